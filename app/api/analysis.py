@@ -1,10 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List, Dict, Any, Optional
-from app.core.database import get_db
+from typing import List, Dict, Any, Optional, Set, Tuple
+from app.core.config import settings
+from app.core.database import SessionLocal, get_async_db, get_db
 from app.services.llm_service import LLMService
 from app.services.analysis_service import AnalysisService
-from app.models.crawler import StockData, FinancialReport, News
+from app.services.precomputed_analysis import PrecomputedAnalysisService
+from app.services.price_repository import PriceRepository
+from app.services.result_cache import get_result_cache
+from app.services.screener import MAX_EXPRESSION_LENGTH, ScreenExpressionError, StockScreener
+from app.models.crawler import FinancialReport
 from app.models.analysis import StockAnalysis
 from datetime import datetime, timedelta
 import pandas as pd
@@ -17,6 +28,14 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 llm_service = LLMService()
 analysis_service = AnalysisService()
+precomputed_service = PrecomputedAnalysisService()
+stock_screener = StockScreener()
+# 单次筛选最多的表达式个数
+MAX_SCREEN_FILTERS = 20
+# 批量分析的工作线程池（NumPy计算和数据库I/O都会释放GIL）
+batch_executor = ThreadPoolExecutor(max_workers=settings.analysis_batch_workers, thread_name_prefix="analysis-batch")
+# 正在执行的批量分析任务：客户端断开后任务仍需完成保存，保留引用防止被垃圾回收
+batch_tasks: Set[asyncio.Task] = set()
 
 class NaNJSONEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -58,51 +77,194 @@ def clean_nan_values(data: Any) -> Any:
         return data.isoformat()
     return data
 
-@router.get("/stock/{symbol}")
-def analyze_stock(
-    symbol: str,
-    days: Optional[int] = 60,
-    db: Session = Depends(get_db)
-) -> Dict:
-    """分析股票数据并返回结果"""
-    try:
-        # 获取历史数据
+def compute_stock_analysis(db: Session, symbol: str, days: int) -> Tuple[Dict[str, Any], Optional[str]]:
+    """
+    计算一只股票的分析结果
+    结果按 (股票, 窗口, 最新K线日期) 缓存，命中时不再计算也不需要重复写入分析记录
+    db 必须连接主库（SessionLocal / get_db）：只读副本可能落后，旧数据会被缓存到新版本的键下
+    :return: (分析结果, 缓存键)，命中缓存时缓存键为None
+    """
+    repository = PriceRepository(db)
+    cache = get_result_cache()
+    version = cache.latest_version(symbol, lambda: repository.latest_date(symbol))
+    cache_key = cache.make_key("stock", symbol, days, version)
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return cached, None
+    
+    # 优先读取爬虫写入新K线时增量维护的指标
+    analysis_results = analysis_service.get_precomputed_analysis(db, symbol, days)
+    
+    if analysis_results is None:
+        # 没有预计算状态时，按窗口加载历史数据重新计算
         end_date = datetime.now()
         start_date = end_date - timedelta(days=days)
-        
-        stock_data = (
-            db.query(StockData)
-            .filter(
-                StockData.symbol == symbol,
-                StockData.date >= start_date,
-                StockData.date <= end_date
-            )
-            .order_by(StockData.date.asc())
-            .all()
-        )
-        
-        if not stock_data:
+    
+        df = repository.load_frame(symbol, start_date, end_date)
+        if df is None:
             raise HTTPException(
                 status_code=404,
                 detail=f"未找到股票 {symbol} 的历史数据"
             )
-            
-        # 转换为DataFrame
-        df = pd.DataFrame([
-            {
-                'date': data.date,
-                'open': data.open,
-                'high': data.high,
-                'low': data.low,
-                'close': data.close,
-                'volume': data.volume
-            }
-            for data in stock_data
-        ])
-        df.set_index('date', inplace=True)
-        
+    
         # 执行分析
         analysis_results = analysis_service.analyze_stock_data(df)
+    return analysis_results, cache_key
+
+class BatchAnalysisRequest(BaseModel):
+    symbols: List[str] = Field(..., min_length=1)
+    days: int = Field(default=60, ge=1, le=3650)
+
+def _analyze_in_worker(symbol: str, days: int) -> Tuple[Dict[str, Any], Optional[str]]:
+    """在工作线程中使用独立的数据库会话分析一只股票"""
+    db = SessionLocal()
+    try:
+        return compute_stock_analysis(db, symbol, days)
+    finally:
+        db.close()
+
+async def _save_batch(pending_saves: List[Tuple[str, Dict[str, Any], str]]) -> int:
+    """一次写入批量分析的记录，写入成功后再缓存结果，返回写入的记录数"""
+    loop = asyncio.get_running_loop()
+    db = SessionLocal()
+    try:
+        saved = await loop.run_in_executor(
+            batch_executor,
+            analysis_service.save_analysis_batch,
+            db,
+            [(symbol, analysis_results) for symbol, analysis_results, _ in pending_saves]
+        )
+    finally:
+        db.close()
+    if saved:
+        cache = get_result_cache()
+        for _, analysis_results, cache_key in pending_saves:
+            cache.set(cache_key, analysis_results)
+    else:
+        logger.warning(f"批量分析结果保存失败: {len(pending_saves)} 条")
+    return saved
+
+async def _run_batch(symbols: List[str], days: int, queue: asyncio.Queue) -> None:
+    """
+    并发分析多只股票，每只完成后把一行JSON放入队列，全部完成后保存分析记录并放入汇总行
+    队列不限长度，不依赖客户端是否仍在读取；结束时放入None
+    """
+    loop = asyncio.get_running_loop()
+
+    async def run(symbol: str):
+        try:
+            return symbol, await loop.run_in_executor(batch_executor, _analyze_in_worker, symbol, days), None
+        except Exception as e:
+            return symbol, None, e
+
+    pending_saves = []
+    errors = 0
+    saved = 0
+    try:
+        for completed in asyncio.as_completed([run(symbol) for symbol in symbols]):
+            symbol, result, error = await completed
+            if error is None:
+                analysis_results, cache_key = result
+                if cache_key is not None:
+                    pending_saves.append((symbol, analysis_results, cache_key))
+                line = {"symbol": symbol, "analysis": clean_nan_values(analysis_results)}
+            else:
+                errors += 1
+                status_code = error.status_code if isinstance(error, HTTPException) else 500
+                detail = error.detail if isinstance(error, HTTPException) else str(error)
+                if status_code == 500:
+                    logger.error(f"批量分析股票 {symbol} 时发生错误: {detail}")
+                line = {"symbol": symbol, "error": detail, "status_code": status_code}
+            queue.put_nowait(json.dumps(line, cls=NaNJSONEncoder, ensure_ascii=False) + "\n")
+
+        # 全部完成后一次写入分析记录
+        if pending_saves:
+            saved = await _save_batch(pending_saves)
+        queue.put_nowait(json.dumps(
+            {"done": True, "count": len(symbols), "errors": errors, "saved": saved},
+            ensure_ascii=False
+        ) + "\n")
+    except Exception as e:
+        logger.error(f"批量分析时发生错误: {str(e)}")
+    finally:
+        queue.put_nowait(None)
+
+@router.post("/batch")
+async def analyze_stock_batch(request: BatchAnalysisRequest):
+    """
+    批量分析股票，每只股票完成后立即以一行JSON（NDJSON）返回
+    计算在线程池中并发进行，全部完成后用一条批量INSERT保存分析记录，最后一行为汇总
+    客户端中途断开不影响分析记录的保存
+    """
+    symbols = list(dict.fromkeys(symbol.strip().upper() for symbol in request.symbols if symbol.strip()))
+    if len(symbols) > settings.analysis_batch_max_symbols:
+        raise HTTPException(
+            status_code=400,
+            detail=f"单次最多分析 {settings.analysis_batch_max_symbols} 只股票"
+        )
+
+    # 计算和保存在独立的任务中进行，客户端中途断开只会停止输出，已完成的分析照常写入数据库和缓存
+    queue: asyncio.Queue = asyncio.Queue()
+    task = asyncio.create_task(_run_batch(symbols, request.days, queue))
+    batch_tasks.add(task)
+    task.add_done_callback(batch_tasks.discard)
+
+    async def stream():
+        while True:
+            line = await queue.get()
+            if line is None:
+                return
+            yield line
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@router.get("/screen")
+def screen_stocks(
+    symbols: Optional[str] = None,
+    filter: Optional[List[str]] = Query(None, max_length=MAX_SCREEN_FILTERS),
+    sort: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=1000),
+    days: int = Query(180, ge=30, le=3650),
+    db: Session = Depends(get_db)
+) -> Dict:
+    """
+    跨股票筛选：一次计算整个股票池的技术指标和趋势
+    K线加载（数据库或本地列式存储）和整个股票池的指标计算都是阻塞的，使用同步路由在线程池中执行
+    - symbols: 逗号分隔的股票代码，为空时使用全部股票
+    - filter: 筛选表达式，可以传多个，例如 rsi_14 < 30、close > ma_20 and trend == '上升'
+    - sort: 逗号分隔的排序字段，前缀 - 表示降序，例如 -trend_strength,rsi_14
+    """
+    if any(len(expression) > MAX_EXPRESSION_LENGTH for expression in filter or []):
+        raise HTTPException(status_code=400, detail=f"筛选表达式不能超过 {MAX_EXPRESSION_LENGTH} 个字符")
+    try:
+        symbol_list = [symbol.strip().upper() for symbol in symbols.split(",") if symbol.strip()] if symbols else None
+        sort_list = [key.strip() for key in sort.split(",") if key.strip()] if sort else None
+        return stock_screener.screen(db, symbol_list, filter, sort_list, limit, days)
+    except HTTPException:
+        raise
+    except ScreenExpressionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"筛选股票时发生错误: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"筛选过程中发生错误: {str(e)}"
+        )
+
+@router.get("/stock/{symbol}")
+def analyze_stock(
+    symbol: str,
+    days: Optional[int] = 60,
+    db: Session = Depends(get_db)
+) -> Dict:
+    """
+    分析股票数据并返回结果
+    结果缓存（Redis）、K线加载和指标计算都是阻塞的，使用同步路由在线程池中执行，不占用事件循环
+    """
+    try:
+        analysis_results, cache_key = compute_stock_analysis(db, symbol, days)
+        if cache_key is None:
+            return analysis_results
         
         # 保存分析结果
         saved_analysis = analysis_service.save_analysis_results(
@@ -111,7 +273,8 @@ def analyze_stock(
         
         if not saved_analysis:
             logger.warning(f"分析结果保存失败: {symbol}")
-            
+        
+        get_result_cache().set(cache_key, analysis_results)
         return analysis_results
         
     except Exception as e:
@@ -122,26 +285,25 @@ def analyze_stock(
         )
         
 @router.get("/stock/{symbol}/history")
-def get_analysis_history(
+async def get_analysis_history(
     symbol: str,
     days: Optional[int] = 30,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> List[Dict]:
     """获取股票分析历史记录"""
     try:
         end_date = datetime.now()
         start_date = end_date - timedelta(days=days)
         
-        analysis_history = (
-            db.query(StockAnalysis)
-            .filter(
+        analysis_history = (await db.scalars(
+            select(StockAnalysis)
+            .where(
                 StockAnalysis.symbol == symbol,
                 StockAnalysis.analysis_date >= start_date,
                 StockAnalysis.analysis_date <= end_date
             )
             .order_by(StockAnalysis.analysis_date.desc())
-            .all()
-        )
+        )).all()
         
         if not analysis_history:
             raise HTTPException(
@@ -187,28 +349,34 @@ def get_analysis_history(
 async def analyze_financial_report(
     symbol: str,
     report_type: str = "10-K",
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """分析财务报表"""
     try:
         # 获取财务报表
-        reports = db.query(FinancialReport).filter(
-            FinancialReport.company_symbol == symbol,
-            FinancialReport.report_type == report_type
-        ).order_by(FinancialReport.report_date.desc()).limit(4).all()
+        reports = (await db.scalars(
+            select(FinancialReport).where(
+                FinancialReport.company_symbol == symbol,
+                FinancialReport.report_type == report_type
+            ).order_by(FinancialReport.report_date.desc()).limit(4)
+        )).all()
         
         if not reports:
             raise HTTPException(status_code=404, detail="未找到财务报表数据")
         
-        # 分析每份报表
-        analyses = []
-        for report in reports:
-            analysis = await llm_service.analyze_financial_report({
-                'content': report.content,
-                'report_type': report.report_type,
-                'report_date': report.report_date
-            })
-            analyses.append(analysis)
+        # 优先使用后台任务预先生成的分析，缺少的报表并发实时分析
+        precomputed = await db.run_sync(precomputed_service.get_financial_analyses, [report.id for report in reports])
+        missing = [report for report in reports if report.id not in precomputed]
+        # 数据库读取已完成，调用LLM前归还连接，避免慢请求占满连接池
+        await db.close()
+        live = dict(zip(
+            [report.id for report in missing],
+            await asyncio.gather(*[
+                llm_service.analyze_financial_report(precomputed_service.report_payload(report))
+                for report in missing
+            ])
+        ))
+        analyses = [precomputed[report.id] if report.id in precomputed else live[report.id] for report in reports]
         
         # 解决可能的冲突
         if len(analyses) > 1:
@@ -234,31 +402,37 @@ async def analyze_financial_report(
 async def analyze_news(
     symbol: str,
     days: int = 7,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """分析新闻数据"""
     try:
+        # 优先使用后台任务预先生成的分析
+        analysis = await db.run_sync(precomputed_service.get_news_analysis, symbol, days)
+        if analysis is not None:
+            return {
+                "symbol": symbol,
+                "news_count": analysis["news_count"],
+                "analysis": clean_nan_values(analysis)
+            }
+        
         # 获取新闻
-        news = db.query(News).filter(
-            News.content.like(f"%{symbol}%"),
-            News.published_date >= datetime.now() - timedelta(days=days)
-        ).order_by(News.published_date.desc()).all()
+        news_count, news = await db.run_sync(
+            precomputed_service.load_symbol_news, symbol, datetime.now() - timedelta(days=days)
+        )
         
         if not news:
             raise HTTPException(status_code=404, detail="未找到新闻数据")
         
+        # 数据库读取已完成，调用LLM前归还连接
+        await db.close()
+        
         # 分析新闻
-        analysis = await llm_service.analyze_news([{
-            'title': n.title,
-            'content': n.content,
-            'source': n.source,
-            'published_date': n.published_date
-        } for n in news])
+        analysis = await llm_service.analyze_news(news)
         
         # 清理NaN值
         result = {
             "symbol": symbol,
-            "news_count": len(news),
+            "news_count": news_count,
             "analysis": clean_nan_values(analysis)
         }
         
@@ -1,16 +1,98 @@
+import asyncio
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 from app.core.database import get_db
 from app.services.llm_service import LLMService
 from app.services.analysis_service import AnalysisService
-from app.models.crawler import StockData, FinancialReport, News
+from app.services.price_repository import PriceRepository
+from app.services.precomputed_analysis import PrecomputedAnalysisService
+from app.models.crawler import FinancialReport
 from datetime import datetime, timedelta
-import pandas as pd
 
 router = APIRouter()
 llm_service = LLMService()
 analysis_service = AnalysisService()
+precomputed_service = PrecomputedAnalysisService()
+
+def _load_prediction_inputs(db: Session, symbol: str, days: int) -> Optional[Dict[str, Any]]:
+    """
+    读取预测需要的数据并计算技术指标（在线程池中执行）
+    :return: 技术指标、波动率、异常值数量、最新财务报表及已有的新闻/财务分析，没有K线时返回None
+    """
+    # 获取历史数据
+    df = PriceRepository(db).load_frame(symbol, datetime.now() - timedelta(days=days))
+    if df is None:
+        return None
+
+    # 获取最新财务报表
+    financial_report = (
+        db.query(FinancialReport)
+        .filter(FinancialReport.company_symbol == symbol)
+        .order_by(FinancialReport.report_date.desc())
+        .first()
+    )
+
+    # 优先使用后台任务预先生成的分析
+    news_analysis = precomputed_service.get_news_analysis(db, symbol, days)
+    news = None
+    if news_analysis is None:
+        _, news = precomputed_service.load_symbol_news(db, symbol, None, 5)
+
+    financial_analysis = None
+    if financial_report:
+        financial_analysis = precomputed_service.get_financial_analyses(db, [financial_report.id]).get(financial_report.id)
+
+    # 计算技术指标、波动率并检测异常值
+    volatility = analysis_service.calculate_volatility(df['close'])
+    anomalies = analysis_service.detect_anomalies(df[['close', 'volume']])
+    return {
+        "technical_indicators": analysis_service.analyze_technical_indicators(df),
+        "volatility": volatility.iloc[-1] if not volatility.empty else None,
+        "anomalies": len(anomalies),
+        "financial_report": financial_report,
+        "news_analysis": news_analysis,
+        "news": news,
+        "financial_analysis": financial_analysis
+    }
+
+def _load_market_inputs(
+    db: Session, symbol: str, days: int
+) -> Tuple[Optional[Dict[str, Any]], int, Optional[List[Dict[str, Any]]], Dict[str, Any]]:
+    """
+    读取情绪分析需要的新闻和K线并计算市场数据（在线程池中执行）
+    :return: (预先计算的新闻分析, 新闻数量, 待实时分析的新闻, 市场数据)
+    """
+    news = None
+    # 优先使用后台任务预先生成的新闻分析
+    sentiment_analysis = precomputed_service.get_news_analysis(db, symbol, days)
+    if sentiment_analysis is not None:
+        news_count = sentiment_analysis["news_count"]
+    else:
+        # 获取新闻数据
+        news_count, news = precomputed_service.load_symbol_news(db, symbol, datetime.now() - timedelta(days=days))
+        if not news:
+            return None, news_count, news, {}
+
+    # 获取股票数据
+    df = PriceRepository(db).load_frame(
+        symbol, datetime.now() - timedelta(days=days), columns=["close", "volume"]
+    )
+    if df is None:
+        return sentiment_analysis, news_count, news, {}
+
+    # 计算波动率
+    volatility = analysis_service.calculate_volatility(df['close'])
+
+    # 计算成交量变化
+    volume_change = df['volume'].pct_change()
+
+    market_data = {
+        "volatility": float(volatility.iloc[-1]) if not volatility.empty else None,
+        "volume_change": float(volume_change.iloc[-1]) if not volume_change.empty else None
+    }
+    return sentiment_analysis, news_count, news, market_data
 
 @router.get("/stock/{symbol}")
 async def predict_stock(
@@ -19,78 +101,48 @@ async def predict_stock(
     prediction_horizon: str = "short",  # short, medium, long
     db: Session = Depends(get_db)
 ):
-    """预测股票走势"""
+    """
+    预测股票走势
+    K线加载、数据库读取和指标计算都是阻塞的，放到线程池执行，事件循环只负责等待LLM调用
+    """
     try:
-        # 获取历史数据
-        stock_data = db.query(StockData).filter(
-            StockData.symbol == symbol,
-            StockData.date >= datetime.now() - timedelta(days=days)
-        ).all()
-        
-        if not stock_data:
+        data = await run_in_threadpool(_load_prediction_inputs, db, symbol, days)
+        if data is None:
             raise HTTPException(status_code=404, detail="未找到股票数据")
+        financial_report = data["financial_report"]
+        
+        # 数据库读取已完成，调用LLM前归还连接，避免慢请求占满连接池
+        await run_in_threadpool(db.close)
+        
+        # 新闻分析和财务报表分析互不依赖，并发执行
+        async def analyze_news() -> Dict[str, Any]:
+            if data["news_analysis"] is not None:
+                return data["news_analysis"]
+            return await llm_service.analyze_news(data["news"])
         
-        # 转换为DataFrame
-        df = pd.DataFrame([{
-            'date': data.date,
-            'open': data.open,
-            'high': data.high,
-            'low': data.low,
-            'close': data.close,
-            'volume': data.volume
-        } for data in stock_data])
-        
-        # 计算技术指标
-        technical_indicators = analysis_service.analyze_technical_indicators(df)
-        
-        # 获取最新财务报表
-        financial_report = db.query(FinancialReport).filter(
-            FinancialReport.company_symbol == symbol
-        ).order_by(FinancialReport.report_date.desc()).first()
-        
-        # 获取最新新闻
-        news = db.query(News).filter(
-            News.content.like(f"%{symbol}%")
-        ).order_by(News.published_date.desc()).limit(5).all()
-        
-        # 分析新闻
-        news_analysis = await llm_service.analyze_news([{
-            'title': n.title,
-            'content': n.content,
-            'source': n.source,
-            'published_date': n.published_date
-        } for n in news])
-        
-        # 分析财务报表
-        if financial_report:
-            financial_analysis = await llm_service.analyze_financial_report({
-                'content': financial_report.content,
-                'report_type': financial_report.report_type,
-                'report_date': financial_report.report_date
-            })
-        else:
-            financial_analysis = {"error": "未找到财务报表数据"}
+        async def analyze_financial() -> Dict[str, Any]:
+            if not financial_report:
+                return {"error": "未找到财务报表数据"}
+            if data["financial_analysis"] is not None:
+                return data["financial_analysis"]
+            return await llm_service.analyze_financial_report(precomputed_service.report_payload(financial_report))
+        
+        news_analysis, financial_analysis = await asyncio.gather(analyze_news(), analyze_financial())
         
         # 预测股价
         prediction = await llm_service.predict_stock_price(
-            technical_data=technical_indicators,
+            technical_data=data["technical_indicators"],
             fundamental_data=financial_analysis,
             news_analysis=news_analysis
         )
         
-        # 计算波动率
-        volatility = analysis_service.calculate_volatility(df['close'])
-        
-        # 检测异常值
-        anomalies = analysis_service.detect_anomalies(df[['close', 'volume']])
-        
         return {
             "symbol": symbol,
             "prediction": prediction,
-            "volatility": volatility.iloc[-1] if not volatility.empty else None,
-            "anomalies": len(anomalies),
+            "volatility": data["volatility"],
+            "anomalies": data["anomalies"],
             "confidence_score": prediction.get("confidence_score", 0.0),
-            "technical_indicators": technical_indicators,
+            "technical_indicators": data["technical_indicators"],
             "fundamental_analysis": financial_analysis,
             "news_sentiment": news_analysis
         }
@@ -99,12 +151,15 @@ async def predict_stock(
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/trend/{symbol}")
-async def predict_trend(
+def predict_trend(
     symbol: str,
     timeframe: str = "weekly",  # weekly, monthly, quarterly
     db: Session = Depends(get_db)
 ):
-    """预测市场趋势"""
+    """
+    预测市场趋势
+    K线加载和均线计算都是阻塞的，使用同步路由在线程池中执行，不占用事件循环
+    """
     try:
         # 根据时间框架确定历史数据范围
         days_map = {
@@ -115,21 +170,10 @@ async def predict_trend(
         days = days_map.get(timeframe, 30)
         
         # 获取历史数据
-        stock_data = db.query(StockData).filter(
-            StockData.symbol == symbol,
-            StockData.date >= datetime.now() - timedelta(days=days)
-        ).all()
-        
-        if not stock_data:
+        df = PriceRepository(db).load_frame(symbol, datetime.now() - timedelta(days=days), columns=["close"])
+        if df is None:
             raise HTTPException(status_code=404, detail="未找到股票数据")
         
-        # 转换为DataFrame
-        df = pd.DataFrame([{
-            'date': data.date,
-            'close': data.close,
-            'volume': data.volume
-        } for data in stock_data])
-        
         # 计算趋势指标
         ma_20 = df['close'].rolling(window=20).mean()
         ma_50 = df['close'].rolling(window=50).mean()
@@ -162,57 +206,28 @@ async def analyze_market_sentiment(
     days: int = 30,
     db: Session = Depends(get_db)
 ):
-    """分析市场情绪"""
+    """
+    分析市场情绪
+    数据库读取、K线加载和指标计算放到线程池执行，事件循环只负责等待LLM调用
+    """
     try:
-        # 获取新闻数据
-        news = db.query(News).filter(
-            News.content.like(f"%{symbol}%"),
-            News.published_date >= datetime.now() - timedelta(days=days)
-        ).order_by(News.published_date.desc()).all()
-        
-        if not news:
+        sentiment_analysis, news_count, news, market_data = await run_in_threadpool(
+            _load_market_inputs, db, symbol, days
+        )
+        if sentiment_analysis is None and not news:
             raise HTTPException(status_code=404, detail="未找到新闻数据")
+        # 调用LLM前归还连接
+        await run_in_threadpool(db.close)
         
-        # 分析新闻情绪
-        sentiment_analysis = await llm_service.analyze_news([{
-            'title': n.title,
-            'content': n.content,
-            'source': n.source,
-            'published_date': n.published_date
-        } for n in news])
-        
-        # 获取股票数据
-        stock_data = db.query(StockData).filter(
-            StockData.symbol == symbol,
-            StockData.date >= datetime.now() - timedelta(days=days)
-        ).all()
-        
-        if stock_data:
-            # 转换为DataFrame
-            df = pd.DataFrame([{
-                'date': data.date,
-                'close': data.close,
-                'volume': data.volume
-            } for data in stock_data])
-            
-            # 计算波动率
-            volatility = analysis_service.calculate_volatility(df['close'])
-            
-            # 计算成交量变化
-            volume_change = df['volume'].pct_change()
-            
-            market_data = {
-                "volatility": float(volatility.iloc[-1]) if not volatility.empty else None,
-                "volume_change": float(volume_change.iloc[-1]) if not volume_change.empty else None
-            }
-        else:
-            market_data = {}
+        if sentiment_analysis is None:
+            # 分析新闻情绪
+            sentiment_analysis = await llm_service.analyze_news(news)
         
         return {
             "symbol": symbol,
             "sentiment_analysis": sentiment_analysis,
             "market_data": market_data,
-            "news_count": len(news)
+            "news_count": news_count
         }
         
     except Exception as e:
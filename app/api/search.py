@@ -0,0 +1,36 @@
+from datetime import datetime
+from typing import Dict, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.database import get_async_db
+from app.services.search_service import SearchService
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+search_service = SearchService()
+
+@router.get("")
+async def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    target: str = Query("all", pattern="^(news|reports|all)$"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    page: int = Query(1, ge=1),
+    page_size: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_async_db)
+) -> Dict:
+    """全文检索新闻和财务报表，结果按相关度排序并分页"""
+    try:
+        targets = ["news", "reports"] if target == "all" else [target]
+        results = {"query": q}
+        for name in targets:
+            results[name] = await db.run_sync(search_service.search, name, q, start, end, page, page_size)
+        return results
+    except Exception as e:
+        logger.error(f"检索时发生错误: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"检索过程中发生错误: {str(e)}"
+        )
\ No newline at end of file
@@ -1,19 +1,313 @@
-from sqlalchemy import create_engine
+import asyncio
+import itertools
+import logging
+import time
+from uuid import uuid4
+from typing import Any, Dict, List, Optional
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import NullPool, QueuePool
 from app.core.config import settings
 
-SQLALCHEMY_DATABASE_URL = f"postgresql://{settings.db_user}:{settings.db_password}@{settings.db_host}:{settings.db_port}/{settings.db_name}"
+logger = logging.getLogger(__name__)
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+SQLALCHEMY_DATABASE_URL = settings.database_url
+
+# API路由使用的异步引擎（asyncpg），可以通过 ASYNC_DATABASE_URL 替换（例如测试时使用 sqlite+aiosqlite）
+ASYNC_SQLALCHEMY_DATABASE_URL = settings.async_database_url or (
+    f"postgresql+asyncpg://{settings.db_user}:{settings.db_password}@{settings.db_host}:{settings.db_port}/{settings.db_name}"
+)
+
+
+def engine_options(url: str) -> Dict[str, Any]:
+    """
+    按 Settings 生成引擎参数，同步和异步引擎共用
+    - 默认在进程内维护 QueuePool：限制连接数，取出连接前探活，定期回收长连接
+    - db_external_pooler 开启时由 PgBouncer 等外部连接池管理连接：进程内使用 NullPool，
+      并关闭 asyncpg 的预处理语句缓存（事务模式下同一会话的语句可能落到不同的服务端连接上）；
+      asyncpg 仍会为每条语句创建预处理语句，默认的自增名称在共用的服务端连接上会冲突，改用随机名称
+    非 PostgreSQL 的连接串（如测试用的 sqlite）保持方言默认的连接池
+    """
+    parsed = make_url(url)
+    options: Dict[str, Any] = {"query_cache_size": settings.db_query_cache_size}
+    if parsed.get_backend_name() != "postgresql":
+        return options
+
+    statement_cache_size = 0 if settings.db_external_pooler else settings.db_statement_cache_size
+    if parsed.get_driver_name() == "asyncpg":
+        options["connect_args"] = {
+            "prepared_statement_cache_size": statement_cache_size,
+            "statement_cache_size": statement_cache_size
+        }
+        if settings.db_external_pooler:
+            options["connect_args"]["prepared_statement_name_func"] = lambda: f"__asyncpg_{uuid4()}__"
+
+    if settings.db_external_pooler:
+        options["poolclass"] = NullPool
+    else:
+        options.update(
+            pool_size=settings.db_pool_size,
+            max_overflow=settings.db_max_overflow,
+            pool_timeout=settings.db_pool_timeout,
+            pool_recycle=settings.db_pool_recycle,
+            pool_pre_ping=settings.db_pool_pre_ping
+        )
+    return options
+
+
+def create_db_engine(url: Optional[str] = None) -> Engine:
+    """创建同步引擎，爬虫、Celery任务和脚本都应使用本模块的 engine / SessionLocal，而不是各自创建引擎"""
+    url = url or SQLALCHEMY_DATABASE_URL
+    return create_engine(url, **engine_options(url))
+
+
+def create_async_db_engine(url: Optional[str] = None):
+    """创建异步引擎，连接池参数与同步引擎相同"""
+    url = url or ASYNC_SQLALCHEMY_DATABASE_URL
+    return create_async_engine(url, **engine_options(url))
+
+
+# 主库当前的WAL位置，副本回放到这个位置即追上了检查开始时的主库
+PRIMARY_LSN_SQL = text("SELECT pg_current_wal_lsn()::text")
+
+# 副本的复制状态：是否处于恢复（备库）模式、WAL接收进程状态、是否已回放到主库位置、最后一次回放的事务距今的秒数
+# 只比较副本自己接收和回放的位置不够：WAL接收中断时两者也相等，落后很久的副本会被误判为没有延迟
+REPLICA_STATUS_SQL = text("""
+    SELECT
+        pg_is_in_recovery() AS in_recovery,
+        (SELECT status FROM pg_stat_wal_receiver LIMIT 1) AS receiver_status,
+        pg_last_wal_replay_lsn() >= CAST(CAST(:primary_lsn AS text) AS pg_lsn) AS caught_up,
+        EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) AS replay_age
+""")
+
+
+class RoutingSession(Session):
+    """
+    读写分离的会话
+    只读查询走创建会话时分配的副本，flush 和 INSERT/UPDATE/DELETE 语句走主库；
+    写入过主库之后，同一会话的查询也改走主库，保证读到自己的写入
+    （text() 语句按只读处理，需要写入时请使用 insert/update/delete 构造）
+    """
+
+    def __init__(self, replica: Optional[Engine] = None, **kw):
+        """
+        :param replica: 只读副本的同步引擎，为空时全部走主库
+        """
+        super().__init__(**kw)
+        self.replica = replica
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self.replica is not None:
+            if not self._flushing and not getattr(clause, "is_dml", False):
+                return self.replica
+            self.replica = None
+        return super().get_bind(mapper, clause=clause, **kw)
+
+
+class ReplicaRouter:
+    """
+    只读副本的选择和复制延迟检查
+    每隔 check_interval 秒在后台检查一次各副本的延迟（不阻塞请求），
+    连接失败或延迟超过 max_lag 的副本暂不分配，没有可用副本时回退到主库
+    """
+
+    def __init__(
+        self,
+        replicas: List[AsyncEngine],
+        primary: Optional[AsyncEngine] = None,
+        max_lag: float = 30.0,
+        check_interval: float = 5.0,
+        check_timeout: float = 2.0
+    ):
+        """
+        :param replicas: 只读副本的异步引擎
+        :param primary: 主库的异步引擎，用于读取主库当前的WAL位置
+        :param max_lag: 可以接受的最大复制延迟（秒）
+        :param check_interval: 延迟检查的间隔（秒）
+        :param check_timeout: 单次检查的超时（秒），超时按不可用处理
+        """
+        self.replicas = replicas
+        self.primary = primary
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.check_timeout = check_timeout
+        # 各副本最近一次检查到的延迟，None 表示尚未检查或不可用
+        self.lags: List[Optional[float]] = [None] * len(replicas)
+        self._checked_at: Optional[float] = None
+        self._check_task: Optional[asyncio.Task] = None
+        self._next = itertools.count()
+
+    @staticmethod
+    def _name(replica: AsyncEngine) -> str:
+        return replica.url.render_as_string(hide_password=True)
+
+    def _available(self, lag: Optional[float]) -> bool:
+        return lag is not None and lag <= self.max_lag
+
+    @staticmethod
+    def lag_from_status(
+        in_recovery: bool,
+        receiver_status: Optional[str],
+        caught_up: Optional[bool],
+        replay_age: Optional[float]
+    ) -> Optional[float]:
+        """
+        根据副本的复制状态计算延迟（秒），不可用时返回None
+        - 不在恢复模式：连接串指向的就是主库，没有延迟
+        - WAL接收进程不在 streaming 状态：复制已中断，无论回放位置如何都不可用
+        - 已回放到主库的WAL位置：没有延迟
+        - 否则按最后一次回放的事务距今的时间估算
+        """
+        if not in_recovery:
+            return 0.0
+        if receiver_status != "streaming":
+            return None
+        if caught_up:
+            return 0.0
+        return float(replay_age) if replay_age is not None else None
+
+    async def primary_lsn(self) -> Optional[str]:
+        """读取主库当前的WAL位置，主库不是 PostgreSQL 或读取失败时返回None"""
+        if self.primary is None or self.primary.dialect.name != "postgresql":
+            return None
+        try:
+            async with self.primary.connect() as conn:
+                return await asyncio.wait_for(conn.scalar(PRIMARY_LSN_SQL), self.check_timeout)
+        except Exception as e:
+            logger.warning(f"读取主库WAL位置失败: {e!r}")
+            return None
+
+    async def replica_lag(self, replica: AsyncEngine, primary_lsn: Optional[str] = None) -> Optional[float]:
+        """查询副本的复制延迟，非 PostgreSQL 的替身（如 sqlite 副本）没有复制，延迟视为0"""
+        async with replica.connect() as conn:
+            if conn.dialect.name != "postgresql":
+                await conn.execute(text("SELECT 1"))
+                return 0.0
+            row = (await conn.execute(REPLICA_STATUS_SQL, {"primary_lsn": primary_lsn})).one()
+            return self.lag_from_status(row.in_recovery, row.receiver_status, row.caught_up, row.replay_age)
+
+    async def refresh(self) -> None:
+        """检查全部副本的延迟"""
+        primary_lsn = await self.primary_lsn()
+        results = await asyncio.gather(
+            *[
+                asyncio.wait_for(self.replica_lag(replica, primary_lsn), self.check_timeout)
+                for replica in self.replicas
+            ],
+            return_exceptions=True
+        )
+        for index, (replica, result) in enumerate(zip(self.replicas, results)):
+            lag = None if isinstance(result, BaseException) else result
+            was_available = self._available(self.lags[index])
+            self.lags[index] = lag
+            if was_available and not self._available(lag):
+                reason = f"检查失败: {result!r}" if isinstance(result, BaseException) else f"复制延迟 {lag} 秒"
+                logger.warning(f"只读副本 {self._name(replica)} 暂停使用，{reason}")
+            elif not was_available and self._available(lag):
+                logger.info(f"只读副本 {self._name(replica)} 可用，复制延迟 {lag:.1f} 秒")
+
+    def schedule_refresh(self) -> None:
+        """到检查间隔时在后台启动一次检查，检查完成前沿用上一次的结果"""
+        now = time.monotonic()
+        if not self.replicas or (self._checked_at is not None and now - self._checked_at < self.check_interval):
+            return
+        if self._check_task is not None and not self._check_task.done():
+            return
+        self._checked_at = now
+        self._check_task = asyncio.get_running_loop().create_task(self.refresh())
+
+    def choose(self) -> Optional[Engine]:
+        """在可用副本中轮询选择一个（返回同步引擎，供 RoutingSession 使用），没有可用副本时返回None即使用主库"""
+        available = [replica for replica, lag in zip(self.replicas, self.lags) if self._available(lag)]
+        if not available:
+            return None
+        return available[next(self._next) % len(available)].sync_engine
+
+    def status(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "url": self._name(replica),
+                "lag": lag,
+                "available": self._available(lag),
+                **_pool_metrics(replica.sync_engine)
+            }
+            for replica, lag in zip(self.replicas, self.lags)
+        ]
+
+
+engine = create_db_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_db_engine()
+replica_router = ReplicaRouter(
+    [create_async_db_engine(url) for url in settings.db_replica_urls],
+    primary=async_engine,
+    max_lag=settings.db_replica_max_lag,
+    check_interval=settings.db_replica_check_interval,
+    check_timeout=settings.db_replica_check_timeout
+)
+# 提交后不过期对象，避免在异步上下文中隐式刷新属性
+AsyncSessionLocal = async_sessionmaker(
+    async_engine,
+    class_=AsyncSession,
+    sync_session_class=RoutingSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
 Base = declarative_base()
 
+
+def _pool_metrics(db_engine: Engine) -> Dict[str, Any]:
+    pool = db_engine.pool
+    metrics: Dict[str, Any] = {"pool": type(pool).__name__}
+    if not isinstance(pool, QueuePool):
+        return metrics
+    # overflow() 在连接数未达到 pool_size 时为负数
+    capacity = pool.size() + settings.db_max_overflow
+    checked_out = pool.checkedout()
+    metrics.update(
+        size=pool.size(),
+        checked_in=pool.checkedin(),
+        checked_out=checked_out,
+        overflow=max(pool.overflow(), 0),
+        capacity=capacity,
+        utilization=checked_out / capacity if capacity else None
+    )
+    return metrics
+
+
+def pool_status() -> Dict[str, Any]:
+    """当前进程内同步和异步引擎（以及只读副本）的连接池使用情况"""
+    return {
+        "external_pooler": settings.db_external_pooler,
+        "sync": _pool_metrics(engine),
+        "async": _pool_metrics(async_engine.sync_engine),
+        "replicas": replica_router.status()
+    }
+
 # Dependency
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    """
+    异步会话依赖
+    已有的同步查询代码可以通过 await db.run_sync(func, *args) 复用，但 func 仍在事件循环线程中执行：
+    只有经过驱动的数据库I/O会让出事件循环，读取本地列式存储、pandas/NumPy 计算等阻塞操作会占住事件循环，
+    这类路由应使用 get_db 同步会话，并把加载和计算放到线程池（同步路由或 run_in_threadpool）
+    同一个会话不能被并发使用，需要并发的LLM调用应在数据库查询完成后再 gather；
+    调用LLM等慢操作前应 await db.close() 归还连接，避免连接在等待期间一直被占用
+    配置了只读副本时，会话的只读查询走一个复制延迟合格的副本，写入走主库；
+    副本可能落后主库 DB_REPLICA_MAX_LAG 秒，读取结果要写入结果缓存的代码应使用 get_db（主库）
+    """
+    replica_router.schedule_refresh()
+    async with AsyncSessionLocal(replica=replica_router.choose()) as db:
+        yield db
\ No newline at end of file
@@ -0,0 +1,139 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CacheEntry:
+    """缓存条目"""
+
+    def __init__(self, key: str, value: bytes, meta: Dict[str, Any], expires_at: Optional[float]):
+        self.key = key
+        self.value = value
+        self.meta = meta
+        self.expires_at = expires_at
+
+    @property
+    def is_fresh(self) -> bool:
+        return self.expires_at is None or self.expires_at > time.time()
+
+
+class DiskCache:
+    """
+    基于SQLite的磁盘缓存
+    支持按条目的TTL，总大小超过上限时按最近访问时间（LRU）淘汰；
+    使用WAL模式，可被多个进程同时读写。
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache (
+                    key TEXT PRIMARY KEY,
+                    value BLOB,
+                    meta TEXT,
+                    size INTEGER,
+                    expires_at REAL,
+                    last_access REAL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_last_access ON cache (last_access)")
+
+    def _connect(self) -> sqlite3.Connection:
+        """每个线程使用独立的连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        """读取条目（包括已过期的条目，由调用方决定是否重新验证），并更新访问时间"""
+        try:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT value, meta, expires_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            with conn:
+                conn.execute("UPDATE cache SET last_access = ? WHERE key = ?", (time.time(), key))
+            return CacheEntry(key, row[0], json.loads(row[1] or "{}"), row[2])
+        except sqlite3.Error as e:
+            logger.warning(f"读取磁盘缓存失败: {str(e)}")
+            return None
+
+    def set(self, key: str, value: bytes, meta: Optional[Dict[str, Any]] = None, ttl: Optional[float] = None) -> None:
+        """写入条目，ttl为None表示不过期"""
+        now = time.time()
+        expires_at = None if ttl is None else now + ttl
+        try:
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, meta, size, expires_at, last_access) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, value, json.dumps(meta or {}), len(value), expires_at, now)
+                )
+            self._evict()
+        except sqlite3.Error as e:
+            logger.warning(f"写入磁盘缓存失败: {str(e)}")
+
+    def touch(self, key: str, ttl: Optional[float] = None, meta: Optional[Dict[str, Any]] = None) -> None:
+        """刷新条目的过期时间（以及元数据）"""
+        now = time.time()
+        expires_at = None if ttl is None else now + ttl
+        try:
+            conn = self._connect()
+            with conn:
+                if meta is None:
+                    conn.execute(
+                        "UPDATE cache SET expires_at = ?, last_access = ? WHERE key = ?",
+                        (expires_at, now, key)
+                    )
+                else:
+                    conn.execute(
+                        "UPDATE cache SET expires_at = ?, last_access = ?, meta = ? WHERE key = ?",
+                        (expires_at, now, json.dumps(meta), key)
+                    )
+        except sqlite3.Error as e:
+            logger.warning(f"更新磁盘缓存失败: {str(e)}")
+
+    def delete(self, key: str) -> None:
+        try:
+            conn = self._connect()
+            with conn:
+                conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+        except sqlite3.Error as e:
+            logger.warning(f"删除磁盘缓存失败: {str(e)}")
+
+    def total_size(self) -> int:
+        row = self._connect().execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()
+        return int(row[0])
+
+    def _evict(self) -> None:
+        """总大小超过上限时，按最近访问时间从旧到新淘汰"""
+        excess = self.total_size() - self.max_bytes
+        if excess <= 0:
+            return
+        conn = self._connect()
+        keys = []
+        for key, size in conn.execute("SELECT key, size FROM cache ORDER BY last_access ASC"):
+            keys.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        with conn:
+            conn.executemany("DELETE FROM cache WHERE key = ?", keys)
+        logger.debug(f"磁盘缓存淘汰 {len(keys)} 个条目")
@@ -0,0 +1,44 @@
+import logging
+from typing import List, Optional, Dict, Any
+from sqlalchemy.orm import Session
+from app.crawlers.base import BaseCrawler
+from app.crawlers.async_fetcher import AsyncFetcher
+from app.crawlers.rate_limiter import (
+    QuotaExceededError,
+    get_alpha_vantage_limiter,
+    is_alpha_vantage_quota_payload
+)
+from config.dev import settings
+
+logger = logging.getLogger(__name__)
+
+
+class AlphaVantageCrawler(BaseCrawler):
+    """Alpha Vantage 接口爬虫基类：按API Key共享限流，并识别配额超限的返回"""
+
+    def __init__(self, db: Session):
+        super().__init__(db)
+        self.api_key = settings.ALPHA_VANTAGE_API_KEY
+        self.base_url = "https://www.alphavantage.co/query"
+        self.limiter = get_alpha_vantage_limiter(self.api_key)
+        self.quota_exceeded_symbols: List[str] = []
+
+    def _check_quota(self, data: Any) -> Any:
+        """配额超限时抛出 QuotaExceededError，避免被当成“无数据”丢弃"""
+        if is_alpha_vantage_quota_payload(data):
+            raise QuotaExceededError(data.get("Note") or data.get("Information"))
+        return data
+
+    def _mark_quota_exceeded(self, symbol: str, error: QuotaExceededError) -> None:
+        """记录因配额超限需要重新排队的股票"""
+        logger.warning(f"股票 {symbol} 的请求超出 Alpha Vantage 配额，稍后重新排队: {str(error)}")
+        if symbol not in self.quota_exceeded_symbols:
+            self.quota_exceeded_symbols.append(symbol)
+
+    def request_json(self, params: Dict[str, Any]) -> Optional[Any]:
+        """经过缓存和限流同步请求接口，失败返回None"""
+        return self.get_json(self.base_url, params, validate=self._check_quota, limiter=self.limiter)
+
+    async def request_json_async(self, fetcher: AsyncFetcher, params: Dict[str, Any]) -> Optional[Any]:
+        """经过缓存和限流异步请求接口，失败返回None"""
+        return await fetcher.get_json(self.base_url, params, validate=self._check_quota, limiter=self.limiter)
@@ -0,0 +1,134 @@
+import asyncio
+import importlib.util
+import json
+import logging
+from typing import Optional, Dict, Any, Callable
+from urllib.parse import urlsplit
+import httpx
+from app.crawlers.http_cache import HTTPCache
+
+logger = logging.getLogger(__name__)
+
+# HTTP/2 需要安装 h2（httpx[http2]），缺失时退回 HTTP/1.1
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+class AsyncFetcher:
+    """
+    基于 httpx.AsyncClient 的并发抓取器
+    共享一个支持 HTTP/2 和 keep-alive 的连接池，
+    并用全局信号量和按主机的信号量限制并发请求数；
+    配置了 HTTPCache 时先查磁盘缓存，过期条目发送条件请求。
+    """
+
+    def __init__(
+        self,
+        headers: Optional[Dict[str, str]] = None,
+        max_concurrency: int = 20,
+        per_host_limit: int = 5,
+        timeout: float = 10.0,
+        http2: bool = True,
+        cache: Optional[HTTPCache] = None,
+        cache_ttl: Optional[float] = None
+    ):
+        self.headers = headers or {}
+        self.max_concurrency = max_concurrency
+        self.per_host_limit = per_host_limit
+        self.timeout = timeout
+        self.http2 = http2 and HTTP2_AVAILABLE
+        self.cache = cache
+        self.cache_ttl = cache_ttl
+        self.client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._host_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    async def __aenter__(self) -> "AsyncFetcher":
+        self.client = httpx.AsyncClient(
+            http2=self.http2,
+            headers=self.headers,
+            timeout=self.timeout,
+            limits=httpx.Limits(
+                max_connections=self.max_concurrency,
+                max_keepalive_connections=self.max_concurrency,
+                keepalive_expiry=30
+            )
+        )
+        # 信号量必须在事件循环内创建
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._host_semaphores = {}
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.client.aclose()
+        self.client = None
+
+    def _host_semaphore(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        if host not in self._host_semaphores:
+            self._host_semaphores[host] = asyncio.Semaphore(self.per_host_limit)
+        return self._host_semaphores[host]
+
+    async def fetch(
+        self,
+        url: str,
+        params: Optional[Dict[str, Any]] = None,
+        parse: Optional[Callable[[bytes], Any]] = None,
+        limiter=None
+    ) -> Optional[Any]:
+        """
+        获取响应内容，命中新鲜缓存时不发送请求（也不消耗限流令牌）
+        :param url: 请求地址
+        :param params: 查询参数
+        :param parse: 解析响应内容的函数，抛出异常时内容不会写入缓存
+        :param limiter: 发送网络请求前需要等待的限流器
+        :return: 解析后的内容，请求失败返回None
+        """
+        parse = parse or (lambda body: body)
+        entry = self.cache.lookup(url, params) if self.cache else None
+        if entry is not None and entry.is_fresh:
+            return parse(entry.value)
+
+        if limiter is not None:
+            await limiter.acquire_async()
+
+        async with self._semaphore, self._host_semaphore(url):
+            try:
+                response = await self.client.get(
+                    url, params=params, headers=HTTPCache.conditional_headers(entry)
+                )
+                if response.status_code == 304 and entry is not None:
+                    return parse(self.cache.not_modified(entry, self.cache_ttl))
+                response.raise_for_status()
+            except httpx.HTTPError as e:
+                logger.error(f"Error fetching {url}: {str(e)}")
+                return None
+
+        result = parse(response.content)
+        if self.cache is not None:
+            self.cache.store(url, params, response.content, response.headers, self.cache_ttl, previous=entry)
+        return result
+
+    async def get_text(self, url: str, params: Optional[Dict[str, Any]] = None, limiter=None) -> Optional[str]:
+        """获取页面内容"""
+        return await self.fetch(url, params, lambda body: body.decode("utf-8", errors="replace"), limiter)
+
+    async def get_json(
+        self,
+        url: str,
+        params: Optional[Dict[str, Any]] = None,
+        validate: Optional[Callable[[Any], Any]] = None,
+        limiter=None
+    ) -> Optional[Any]:
+        """
+        获取JSON内容
+        :param validate: 校验解析结果的函数，抛出的异常会向上传递且结果不会被缓存
+        """
+        def parse(body: bytes) -> Any:
+            data = json.loads(body)
+            return validate(data) if validate is not None else data
+
+        try:
+            return await self.fetch(url, params, parse, limiter)
+        except ValueError as e:
+            logger.error(f"Error decoding JSON from {url}: {str(e)}")
+            return None
@@ -1,20 +1,36 @@
 import hashlib
+import json
 import logging
 from datetime import datetime
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Callable, List
 import requests
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
 from app.core.database import Base
+from app.crawlers.async_fetcher import AsyncFetcher
+from app.crawlers.http_cache import HTTPCache, get_http_cache
 
 logger = logging.getLogger(__name__)
 
 class BaseCrawler:
+    # 异步抓取时的全局并发数和单主机并发数
+    max_concurrency = 20
+    per_host_limit = 5
+    # 响应缓存的基础TTL（秒），None表示使用配置中的默认值
+    cache_ttl: Optional[float] = None
+    # 批量写入时每条INSERT语句包含的行数
+    insert_batch_size = 1000
+
     def __init__(self, db: Session):
         self.db = db
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         })
+        self.http_cache = get_http_cache()
+        # 本实例累计新增的记录数，抓取部分失败时任务据此决定是否仍需分析已入库的内容
+        self.saved_count = 0
 
     def generate_hash(self, content: str) -> str:
         """生成内容的MD5哈希值"""
@@ -24,6 +40,46 @@ class BaseCrawler:
         """检查内容是否重复"""
         return self.db.query(model).filter(model.content_hash == content_hash).first() is not None
 
+    def insert_new_items(self, model: Base, records: List[Dict[str, Any]]) -> List[int]:
+        """
+        批量写入不重复的内容
+        先用一次 content_hash IN (...) 查询过滤已有记录，
+        其余记录在同一事务中 INSERT ... ON CONFLICT DO NOTHING 写入（并发写入的重复会被唯一约束跳过）
+        :param model: 带 content_hash 唯一列的模型
+        :param records: 待写入的记录
+        :return: 新增记录的id列表
+        :raises SQLAlchemyError: 写入失败时回滚后抛出，由调用方标记本次抓取失败
+        """
+        # 同一批次内按哈希去重
+        unique_records = {}
+        for record in records:
+            unique_records.setdefault(record["content_hash"], record)
+        if not unique_records:
+            return []
+
+        try:
+            existing = set(self.db.scalars(
+                select(model.content_hash).where(model.content_hash.in_(list(unique_records)))
+            ))
+            new_records = [record for content_hash, record in unique_records.items() if content_hash not in existing]
+
+            ids = []
+            for start in range(0, len(new_records), self.insert_batch_size):
+                stmt = (
+                    insert(model)
+                    .values(new_records[start:start + self.insert_batch_size])
+                    .on_conflict_do_nothing()
+                    .returning(model.id)
+                )
+                ids.extend(self.db.scalars(stmt))
+            self.db.commit()
+            self.saved_count += len(ids)
+            return ids
+        except Exception as e:
+            logger.error(f"Error saving to database: {str(e)}")
+            self.db.rollback()
+            raise
+
     def save_to_db(self, model: Base) -> bool:
         """保存数据到数据库"""
         try:
@@ -35,12 +91,85 @@ class BaseCrawler:
             self.db.rollback()
             return False
 
-    def get_page(self, url: str, params: Optional[Dict[str, Any]] = None) -> Optional[str]:
-        """获取页面内容"""
+    def fetch(
+        self,
+        url: str,
+        params: Optional[Dict[str, Any]] = None,
+        parse: Optional[Callable[[bytes], Any]] = None,
+        limiter=None
+    ) -> Optional[Any]:
+        """
+        获取响应内容，命中新鲜缓存时不发送请求（也不消耗限流令牌）
+        :param url: 请求地址
+        :param params: 查询参数
+        :param parse: 解析响应内容的函数，抛出异常时内容不会写入缓存
+        :param limiter: 发送网络请求前需要等待的限流器
+        :return: 解析后的内容，请求失败返回None
+        """
+        parse = parse or (lambda body: body)
+        entry = self.http_cache.lookup(url, params) if self.http_cache else None
+        if entry is not None and entry.is_fresh:
+            return parse(entry.value)
+
+        if limiter is not None:
+            limiter.acquire()
+
         try:
-            response = self.session.get(url, params=params, timeout=10)
+            response = self.session.get(
+                url, params=params, timeout=10, headers=HTTPCache.conditional_headers(entry)
+            )
+            if response.status_code == 304 and entry is not None:
+                return parse(self.http_cache.not_modified(entry, self.cache_ttl))
             response.raise_for_status()
-            return response.text
         except requests.RequestException as e:
             logger.error(f"Error fetching {url}: {str(e)}")
-            return None 
\ No newline at end of file
+            return None
+
+        result = parse(response.content)
+        if self.http_cache is not None:
+            self.http_cache.store(url, params, response.content, response.headers, self.cache_ttl, previous=entry)
+        return result
+
+    def get_page(self, url: str, params: Optional[Dict[str, Any]] = None) -> Optional[str]:
+        """获取页面内容"""
+        return self.fetch(url, params, lambda body: body.decode("utf-8", errors="replace"))
+
+    def get_json(
+        self,
+        url: str,
+        params: Optional[Dict[str, Any]] = None,
+        validate: Optional[Callable[[Any], Any]] = None,
+        limiter=None
+    ) -> Optional[Any]:
+        """
+        获取JSON内容
+        :param validate: 校验解析结果的函数，抛出的异常会向上传递且结果不会被缓存
+        """
+        def parse(body: bytes) -> Any:
+            data = json.loads(body)
+            return validate(data) if validate is not None else data
+
+        try:
+            return self.fetch(url, params, parse, limiter)
+        except ValueError as e:
+            logger.error(f"Error decoding JSON from {url}: {str(e)}")
+            return None
+
+    def async_fetcher(self) -> AsyncFetcher:
+        """创建共享连接池的异步抓取器（需在 async with 中使用）"""
+        return AsyncFetcher(
+            headers=dict(self.session.headers),
+            max_concurrency=self.max_concurrency,
+            per_host_limit=self.per_host_limit,
+            cache=self.http_cache,
+            cache_ttl=self.cache_ttl
+        )
+
+    async def get_page_async(
+        self,
+        fetcher: AsyncFetcher,
+        url: str,
+        params: Optional[Dict[str, Any]] = None
+    ) -> Optional[str]:
+        """异步获取页面内容"""
+        return await fetcher.get_text(url, params)
\ No newline at end of file
@@ -0,0 +1,113 @@
+import logging
+import time
+from typing import Dict, List, Optional
+import pandas as pd
+import requests
+import yfinance as yf
+
+logger = logging.getLogger(__name__)
+
+PRICE_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+
+class TickerValidityCache:
+    """股票代码有效性缓存，避免每次抓取前都调用缓慢的 Ticker.info"""
+
+    def __init__(self, valid_ttl: int = 7 * 24 * 3600, invalid_ttl: int = 24 * 3600):
+        self.valid_ttl = valid_ttl
+        self.invalid_ttl = invalid_ttl
+        self._entries: Dict[str, tuple] = {}
+
+    def get(self, symbol: str) -> Optional[bool]:
+        """返回缓存的有效性，未知或已过期返回None"""
+        entry = self._entries.get(symbol.upper())
+        if entry is None:
+            return None
+        valid, expires_at = entry
+        if expires_at < time.time():
+            del self._entries[symbol.upper()]
+            return None
+        return valid
+
+    def is_invalid(self, symbol: str) -> bool:
+        return self.get(symbol) is False
+
+    def mark(self, symbol: str, valid: bool) -> None:
+        ttl = self.valid_ttl if valid else self.invalid_ttl
+        self._entries[symbol.upper()] = (valid, time.time() + ttl)
+
+
+# 进程级共享的有效性缓存
+ticker_validity = TickerValidityCache()
+
+
+def _split_frames(data: pd.DataFrame, symbols: List[str]) -> Dict[str, pd.DataFrame]:
+    """把多股票下载结果按股票代码拆分成独立的DataFrame"""
+    if data is None or data.empty:
+        return {}
+    if not isinstance(data.columns, pd.MultiIndex):
+        # 只有一只股票时 yfinance 返回普通列
+        return {symbols[0]: data}
+
+    available = set(data.columns.get_level_values(0))
+    frames = {}
+    for symbol in symbols:
+        key = symbol if symbol in available else symbol.upper()
+        if key in available:
+            frames[symbol] = data[key]
+    return frames
+
+
+def download_stock_data(
+    symbols: List[str],
+    period: str = "1d",
+    chunk_size: int = 100,
+    session: Optional[requests.Session] = None,
+    interval: str = "1d"
+) -> Dict[str, pd.DataFrame]:
+    """
+    批量下载多只股票的历史数据
+    :param symbols: 股票代码列表
+    :param period: 时间周期 (1d, 5d, 1mo, 3mo, 6mo, 1y, 2y, 5y, 10y, ytd, max)
+    :param chunk_size: 每次请求的股票数量
+    :param session: 复用的HTTP会话
+    :param interval: K线周期 (1d, 1h, 5m 等)
+    :return: 股票代码 -> 数据，下载失败或无数据的股票不在结果中，由调用方逐个补抓
+    """
+    candidates = [symbol for symbol in symbols if not ticker_validity.is_invalid(symbol)]
+    skipped = len(symbols) - len(candidates)
+    if skipped:
+        logger.info(f"跳过 {skipped} 个已知无效的股票代码")
+
+    results: Dict[str, pd.DataFrame] = {}
+    for start in range(0, len(candidates), chunk_size):
+        chunk = candidates[start:start + chunk_size]
+        try:
+            data = yf.download(
+                tickers=chunk,
+                period=period,
+                interval=interval,
+                group_by='ticker',
+                auto_adjust=True,  # 与 Ticker.history 默认的复权方式一致
+                threads=True,
+                progress=False,
+                session=session
+            )
+        except Exception as e:
+            logger.error(f"批量下载股票数据失败 ({len(chunk)} 只): {str(e)}")
+            continue
+
+        frames = _split_frames(data, chunk)
+        for symbol in chunk:
+            frame = frames.get(symbol)
+            if frame is not None:
+                frame = frame.dropna(how='all')
+            if frame is None or frame.empty or not all(col in frame.columns for col in PRICE_COLUMNS):
+                # 批量结果中缺失的股票由调用方单独重试后再判定是否无效
+                continue
+            ticker_validity.mark(symbol, True)
+            results[symbol] = frame[PRICE_COLUMNS]
+
+        logger.info(f"批量下载完成: {len(chunk)} 只股票中 {sum(s in results for s in chunk)} 只有数据")
+
+    return results
@@ -1,20 +1,51 @@
+import asyncio
 import logging
 from datetime import datetime
 from typing import List, Optional, Dict, Any
 import requests
 from sqlalchemy.orm import Session
 
-from app.crawlers.base import BaseCrawler
+from app.crawlers.alpha_vantage import AlphaVantageCrawler
+from app.crawlers.async_fetcher import AsyncFetcher
+from app.crawlers.rate_limiter import QuotaExceededError
 from app.models.crawler import FinancialReport
-from config.dev import settings
 
 logger = logging.getLogger(__name__)
 
-class FinancialReportCrawler(BaseCrawler):
+class FinancialReportCrawler(AlphaVantageCrawler):
+    cache_ttl = 3 * 24 * 3600  # 财报变化很少，内容不变时TTL会自动延长
+
     def __init__(self, db: Session):
         super().__init__(db)
-        self.api_key = settings.ALPHA_VANTAGE_API_KEY
-        self.base_url = "https://www.alphavantage.co/query"
+
+    def _report_params(self, symbol: str, report_type: str) -> Dict[str, Any]:
+        """根据报告类型构建请求参数"""
+        # 根据报告类型选择不同的API函数
+        function = "INCOME_STATEMENT"  # 默认获取利润表
+        if report_type == "10-K":
+            function = "INCOME_STATEMENT"  # 年度利润表
+        elif report_type == "10-Q":
+            function = "EARNINGS"  # 季度收益报告
+
+        return {
+            "function": function,
+            "symbol": symbol,
+            "apikey": self.api_key
+        }
+
+    def _parse_reports(self, symbol: str, report_type: str, function: str, data: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """从接口返回中提取报表列表"""
+        reports = []
+        if function == "INCOME_STATEMENT" and "annualReports" in data:
+            reports = data["annualReports"]
+        elif function == "EARNINGS" and "quarterlyEarnings" in data:
+            reports = data["quarterlyEarnings"]
+        
+        if not reports:
+            logger.warning(f"未找到股票 {symbol} 的{report_type}报表数据")
+            return []
+
+        return reports
 
     def fetch_financial_reports(self, symbol: str, report_type: str = "10-K") -> List[Dict[str, Any]]:
         """
@@ -24,39 +55,82 @@ class FinancialReportCrawler(BaseCrawler):
         :return: 财务报表数据列表
         """
         try:
-            # 根据报告类型选择不同的API函数
-            function = "INCOME_STATEMENT"  # 默认获取利润表
-            if report_type == "10-K":
-                function = "INCOME_STATEMENT"  # 年度利润表
-            elif report_type == "10-Q":
-                function = "EARNINGS"  # 季度收益报告
-
-            params = {
-                "function": function,
-                "symbol": symbol,
-                "apikey": self.api_key
-            }
-            
-            response = self.session.get(self.base_url, params=params)
-            response.raise_for_status()
-            data = response.json()
+            params = self._report_params(symbol, report_type)
             
-            reports = []
-            if function == "INCOME_STATEMENT" and "annualReports" in data:
-                reports = data["annualReports"]
-            elif function == "EARNINGS" and "quarterlyEarnings" in data:
-                reports = data["quarterlyEarnings"]
-            
-            if not reports:
-                logger.warning(f"未找到股票 {symbol} 的{report_type}报表数据")
+            data = self.request_json(params)
+            if data is None:
                 return []
+            return self._parse_reports(symbol, report_type, params["function"], data)
+
+        except QuotaExceededError as e:
+            self._mark_quota_exceeded(symbol, e)
+            return []
+        except Exception as e:
+            logger.error(f"获取股票 {symbol} 的财务报表数据时出错: {str(e)}")
+            return []
 
-            return reports
+    async def fetch_financial_reports_async(
+        self,
+        fetcher: AsyncFetcher,
+        symbol: str,
+        report_type: str = "10-K"
+    ) -> List[Dict[str, Any]]:
+        """
+        异步获取财务报表数据
+        :param fetcher: 异步抓取器
+        :param symbol: 股票代码
+        :param report_type: 报告类型 (10-K: 年报, 10-Q: 季报)
+        :return: 财务报表数据列表
+        """
+        try:
+            params = self._report_params(symbol, report_type)
+            data = await self.request_json_async(fetcher, params)
+            if data is None:
+                return []
+            return self._parse_reports(symbol, report_type, params["function"], data)
 
+        except QuotaExceededError as e:
+            self._mark_quota_exceeded(symbol, e)
+            return []
         except Exception as e:
             logger.error(f"获取股票 {symbol} 的财务报表数据时出错: {str(e)}")
             return []
 
+    def _report_record(self, symbol: str, report_data: Dict[str, Any], report_type: str) -> Dict[str, Any]:
+        """把接口返回的报表转换为 FinancialReport 表的记录"""
+        content = str(report_data)
+        report_date = datetime.strptime(report_data.get("fiscalDateEnding", ""), "%Y-%m-%d")
+        return {
+            "company_symbol": symbol,
+            "report_type": report_type,
+            "report_date": report_date,
+            "title": f"{symbol} {report_type} Report {report_date.strftime('%Y-%m-%d')}",
+            "content": content,
+            "content_hash": self.generate_hash(content),
+            "url": self.base_url  # 使用API URL作为来源
+        }
+
+    def save_financial_reports_batch(
+        self,
+        symbol_reports: Dict[str, List[Dict[str, Any]]],
+        report_type: str
+    ) -> List[int]:
+        """
+        批量保存财务报表：一次查询去重，剩余报表在同一事务中写入
+        :param symbol_reports: 股票代码到报表数据列表的映射
+        :param report_type: 报告类型
+        :return: 新增报表的id列表
+        :raises SQLAlchemyError: 写入失败时抛出，调用方据此把抓取标记为失败
+        """
+        records = []
+        for symbol, reports in symbol_reports.items():
+            for report_data in reports:
+                try:
+                    records.append(self._report_record(symbol, report_data, report_type))
+                except Exception as e:
+                    logger.error(f"解析股票 {symbol} 的财务报表时出错: {str(e)}")
+        return self.insert_new_items(FinancialReport, records)
+
     def save_financial_report(self, symbol: str, report_data: Dict[str, Any], report_type: str) -> bool:
         """
         保存财务报表到数据库
@@ -66,41 +140,17 @@ class FinancialReportCrawler(BaseCrawler):
         :return: 是否保存成功
         """
         try:
-            # 生成报表内容
-            content = str(report_data)
-            content_hash = self.generate_hash(content)
-            
-            # 检查是否已存在
-            if self.is_duplicate(content_hash, FinancialReport):
-                return False
-            
-            # 获取报表日期
-            if report_type == "10-K":
-                report_date = datetime.strptime(report_data.get("fiscalDateEnding", ""), "%Y-%m-%d")
-            else:
-                report_date = datetime.strptime(report_data.get("fiscalDateEnding", ""), "%Y-%m-%d")
-            
-            # 创建报表对象
-            report = FinancialReport(
-                company_symbol=symbol,
-                report_type=report_type,
-                report_date=report_date,
-                title=f"{symbol} {report_type} Report {report_date.strftime('%Y-%m-%d')}",
-                content=content,
-                content_hash=content_hash,
-                url=self.base_url  # 使用API URL作为来源
-            )
-            
-            # 保存到数据库
-            self.db.add(report)
-            self.db.commit()
-            return True
-            
+            return len(self.save_financial_reports_batch({symbol: [report_data]}, report_type)) > 0
         except Exception as e:
-            logger.error(f"保存财务报表时出错: {str(e)}")
-            self.db.rollback()
+            logger.error(f"保存股票 {symbol} 的财务报表时出错: {str(e)}")
             return False
 
+    def _save_reports(self, symbol: str, reports: List[Dict[str, Any]], report_type: str) -> int:
+        """批量保存一只股票的报表，返回新增数量"""
+        saved_count = len(self.save_financial_reports_batch({symbol: reports}, report_type))
+        logger.info(f"成功保存股票 {symbol} 的 {saved_count} 份{report_type}报表")
+        return saved_count
+
     def crawl_financial_reports(self, symbol: str, report_type: str = "10-K") -> bool:
         """
         爬取并保存财务报表
@@ -116,14 +166,53 @@ class FinancialReportCrawler(BaseCrawler):
                 logger.warning(f"未找到股票 {symbol} 的{report_type}报表")
                 return True
             
-            saved_count = 0
-            for report_data in reports:
-                if self.save_financial_report(symbol, report_data, report_type):
-                    saved_count += 1
-            
-            logger.info(f"成功保存 {saved_count} 份{report_type}报表")
+            self._save_reports(symbol, reports, report_type)
             return True
             
         except Exception as e:
             logger.error(f"爬取股票 {symbol} 的{report_type}报表时出错: {str(e)}")
-            return False 
\ No newline at end of file
+            return False
+
+    async def crawl_financial_reports_async(self, symbols: List[str], report_type: str = "10-K") -> bool:
+        """
+        并发抓取多只股票的财务报表，全部完成后批量保存
+        因配额超限未抓取的股票记录在 self.quota_exceeded_symbols
+        :param symbols: 股票代码列表
+        :param report_type: 报告类型 (10-K: 年报, 10-Q: 季报)
+        :return: 是否成功
+        """
+        async def fetch(fetcher: AsyncFetcher, symbol: str):
+            return symbol, await self.fetch_financial_reports_async(fetcher, symbol, report_type)
+
+        success = True
+        self.quota_exceeded_symbols = []
+        collected = {}
+        async with self.async_fetcher() as fetcher:
+            tasks = [fetch(fetcher, symbol) for symbol in symbols]
+            for completed in asyncio.as_completed(tasks):
+                symbol, reports = await completed
+                if symbol in self.quota_exceeded_symbols:
+                    continue
+                if not reports:
+                    logger.warning(f"未找到股票 {symbol} 的{report_type}报表")
+                    continue
+                collected[symbol] = reports
+
+        # 所有股票的报表整批去重后在一个事务中写入
+        try:
+            saved_count = len(self.save_financial_reports_batch(collected, report_type))
+            logger.info(f"成功保存 {len(collected)} 只股票的 {saved_count} 份{report_type}报表")
+        except Exception as e:
+            logger.error(f"保存{report_type}报表时出错: {str(e)}")
+            success = False
+        return success
+
+    def crawl_financial_reports_batch(self, symbols: List[str], report_type: str = "10-K") -> bool:
+        """
+        爬取并保存多只股票的财务报表（同步入口，供Celery任务调用）
+        :param symbols: 股票代码列表
+        :param report_type: 报告类型 (10-K: 年报, 10-Q: 季报)
+        :return: 是否成功
+        """
+        logger.info(f"开始并发爬取 {len(symbols)} 只股票的{report_type}报表...")
+        return asyncio.run(self.crawl_financial_reports_async(symbols, report_type))
\ No newline at end of file
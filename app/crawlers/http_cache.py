@@ -0,0 +1,100 @@
+import hashlib
+import json
+import logging
+from typing import Any, Dict, Mapping, Optional
+from app.core.disk_cache import CacheEntry, DiskCache
+from config.dev import settings
+
+logger = logging.getLogger(__name__)
+
+# 不参与缓存键的请求参数（更换API Key不应使缓存失效）
+IGNORED_PARAMS = {"apikey"}
+
+
+class HTTPCache:
+    """
+    爬虫的HTTP响应缓存
+    - 有 ETag/Last-Modified 的响应过期后发送条件请求，304时直接复用缓存内容
+    - 没有校验头的响应按TTL缓存，重新抓取时比较内容哈希，
+      内容未变化则把TTL翻倍（不超过基础TTL的 max_ttl_factor 倍和 max_ttl），变化则恢复为基础TTL
+    """
+
+    def __init__(self, cache: DiskCache, default_ttl: float, max_ttl: float, max_ttl_factor: float = 8):
+        self.cache = cache
+        self.default_ttl = default_ttl
+        self.max_ttl = max_ttl
+        self.max_ttl_factor = max_ttl_factor
+
+    @staticmethod
+    def make_key(url: str, params: Optional[Mapping[str, Any]] = None) -> str:
+        """根据URL和排序后的参数生成缓存键"""
+        items = sorted(
+            (str(k), str(v)) for k, v in (params or {}).items() if k not in IGNORED_PARAMS
+        )
+        raw = url + "?" + json.dumps(items, ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def lookup(self, url: str, params: Optional[Mapping[str, Any]] = None) -> Optional[CacheEntry]:
+        return self.cache.get(self.make_key(url, params))
+
+    @staticmethod
+    def conditional_headers(entry: Optional[CacheEntry]) -> Dict[str, str]:
+        """根据缓存的校验头构造条件请求头"""
+        headers = {}
+        if entry is not None:
+            if entry.meta.get("etag"):
+                headers["If-None-Match"] = entry.meta["etag"]
+            if entry.meta.get("last_modified"):
+                headers["If-Modified-Since"] = entry.meta["last_modified"]
+        return headers
+
+    def not_modified(self, entry: CacheEntry, ttl: Optional[float] = None) -> bytes:
+        """服务器返回304时刷新缓存条目并返回缓存内容"""
+        self.cache.touch(entry.key, ttl or entry.meta.get("ttl") or self.default_ttl)
+        return entry.value
+
+    def store(
+        self,
+        url: str,
+        params: Optional[Mapping[str, Any]],
+        body: bytes,
+        headers: Mapping[str, str],
+        ttl: Optional[float] = None,
+        previous: Optional[CacheEntry] = None
+    ) -> None:
+        """保存响应内容，内容未变化时延长TTL（按调用方的基础TTL设上限，更新频繁的数据源不会缓存过久）"""
+        base_ttl = ttl or self.default_ttl
+        content_hash = hashlib.sha256(body).hexdigest()
+        if previous is not None and previous.meta.get("content_hash") == content_hash:
+            limit = max(min(base_ttl * self.max_ttl_factor, self.max_ttl), base_ttl)
+            entry_ttl = min(max(previous.meta.get("ttl", base_ttl), base_ttl) * 2, limit)
+            logger.debug(f"{url} 内容未变化，缓存TTL延长至 {entry_ttl:.0f} 秒")
+        else:
+            entry_ttl = base_ttl
+
+        meta = {
+            "url": url,
+            "etag": headers.get("ETag") or headers.get("etag"),
+            "last_modified": headers.get("Last-Modified") or headers.get("last-modified"),
+            "content_hash": content_hash,
+            "ttl": entry_ttl
+        }
+        self.cache.set(self.make_key(url, params), body, meta, entry_ttl)
+
+
+_http_cache: Optional[HTTPCache] = None
+
+
+def get_http_cache() -> Optional[HTTPCache]:
+    """获取进程内共享的HTTP缓存，未启用时返回None"""
+    global _http_cache
+    if not settings.HTTP_CACHE_ENABLED:
+        return None
+    if _http_cache is None:
+        _http_cache = HTTPCache(
+            DiskCache(settings.HTTP_CACHE_PATH, settings.HTTP_CACHE_MAX_BYTES),
+            default_ttl=settings.HTTP_CACHE_DEFAULT_TTL,
+            max_ttl=settings.HTTP_CACHE_MAX_TTL,
+            max_ttl_factor=settings.HTTP_CACHE_MAX_TTL_FACTOR
+        )
+    return _http_cache
@@ -0,0 +1,91 @@
+import hashlib
+import re
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+# 签名长度及分段数：128个最小哈希分为64段，每段2个
+# 两篇新闻成为候选的概率为 1-(1-J^2)^64，J=0.3 时约为0.998，J=0.05 时约为0.15（候选再按估计的相似度核对）
+NUM_PERM = 128
+BANDS = 64
+ROWS = NUM_PERM // BANDS
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+# 固定种子生成的排列参数，指纹需要跨进程、跨版本保持一致
+_rng = np.random.RandomState(1)
+_A = _rng.randint(1, 1 << 32, size=NUM_PERM, dtype=np.uint64)
+_B = _rng.randint(0, 1 << 32, size=NUM_PERM, dtype=np.uint64)
+_WORD_PATTERN = re.compile(r"\w+")
+
+
+def _shingles(text: str, size: int = 2) -> List[str]:
+    """
+    规范化（小写、只保留单词）后的连续词组
+    转载稿常见的改动（加日期、加来源前缀、替换个别词、截掉最后一句）只影响少量词组，
+    而同一事件的不同报道几乎没有相同的词组
+    """
+    words = _WORD_PATTERN.findall(text.lower())
+    if len(words) <= size:
+        return [" ".join(words)] if words else []
+    return [" ".join(words[i:i + size]) for i in range(len(words) - size + 1)]
+
+
+def minhash(text: str) -> Optional[bytes]:
+    """
+    计算文本词组集合的 MinHash 签名（NUM_PERM 个32位整数，共 NUM_PERM*4 字节）
+    两个签名相同位置取值相等的比例是词组集合 Jaccard 相似度的无偏估计，没有可用单词时返回None
+    """
+    shingles = set(_shingles(text))
+    if not shingles:
+        return None
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little") for s in shingles],
+        dtype=np.uint64
+    )
+    # a < 2^32、x < 2^32，a*x+b 不会溢出 uint64
+    permuted = ((hashes[:, None] * _A + _B) % _MERSENNE_PRIME) & _MAX_HASH
+    return permuted.min(axis=0).astype("<u4").tobytes()
+
+
+def similarity(a: bytes, b: bytes) -> float:
+    """由两个签名估计 Jaccard 相似度"""
+    return float(np.mean(np.frombuffer(a, dtype="<u4") == np.frombuffer(b, dtype="<u4")))
+
+
+def cluster_key(signature: bytes) -> int:
+    """由签名生成新簇的标识（有符号64位整数，便于存入 BIGINT 列）"""
+    value = int.from_bytes(hashlib.blake2b(signature, digest_size=8).digest(), "little")
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def band_keys(signature: bytes) -> List[bytes]:
+    """把签名拆为 BANDS 段，只比较至少有一段完全相同的候选"""
+    width = ROWS * 4
+    return [signature[band * width:(band + 1) * width] for band in range(BANDS)]
+
+
+class MinHashIndex:
+    """按签名分段分桶（LSH）的内存索引，用于把新签名归入已有的近似重复簇"""
+
+    def __init__(self, threshold: float = 0.3):
+        self.threshold = threshold
+        self._buckets: Dict[Tuple[int, bytes], List[Tuple[bytes, int]]] = defaultdict(list)
+
+    def add(self, signature: bytes, cluster_id: int) -> None:
+        for band, key in enumerate(band_keys(signature)):
+            self._buckets[(band, key)].append((signature, cluster_id))
+
+    def find(self, signature: bytes) -> Optional[int]:
+        """返回估计相似度最高且不低于 threshold 的簇id，没有时返回None"""
+        best = None
+        seen = set()
+        for band, key in enumerate(band_keys(signature)):
+            for candidate, cluster_id in self._buckets.get((band, key), ()):
+                if id(candidate) in seen:
+                    continue
+                seen.add(id(candidate))
+                score = similarity(signature, candidate)
+                if score >= self.threshold and (best is None or score > best[0]):
+                    best = (score, cluster_id)
+        return best[1] if best else None
@@ -1,19 +1,59 @@
+import asyncio
 import logging
 from datetime import datetime, timedelta
 from typing import List, Optional, Dict, Any
 import requests
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
-from app.crawlers.base import BaseCrawler
-from app.models.crawler import News
-from config.dev import settings
+from app.crawlers.alpha_vantage import AlphaVantageCrawler
+from app.crawlers.async_fetcher import AsyncFetcher
+from app.crawlers.rate_limiter import QuotaExceededError
+from app.crawlers.minhash import MinHashIndex, cluster_key, minhash
+from app.models.crawler import News, NewsTicker
 
 logger = logging.getLogger(__name__)
 
-class NewsCrawler(BaseCrawler):
+class NewsCrawler(AlphaVantageCrawler):
+    cache_ttl = 15 * 60  # 新闻更新频繁，缓存15分钟
+    # 摘要词组集合的 Jaccard 相似度不低于该值的新闻视为同一稿件的转载
+    # 转载稿（加日期/来源、改写个别词、截掉一句）约0.45以上，同一事件的不同报道在0.05以下
+    near_duplicate_similarity = 0.3
+    # 只在最近几天的新闻中查找近似重复
+    near_duplicate_window_days = 7
+
     def __init__(self, db: Session):
         super().__init__(db)
-        self.api_key = settings.ALPHA_VANTAGE_API_KEY
-        self.base_url = "https://www.alphavantage.co/query"
+
+    def _news_params(self, symbol: str) -> Dict[str, Any]:
+        """构建新闻接口的请求参数"""
+        return {
+            "function": "NEWS_SENTIMENT",
+            "tickers": symbol,
+            "apikey": self.api_key,
+            "limit": 50  # 限制返回的新闻数量
+        }
+
+    def _parse_news(self, symbol: str, data: Dict[str, Any], days: int) -> List[Dict[str, Any]]:
+        """从接口返回中筛选最近几天的新闻"""
+        if "feed" not in data:
+            logger.warning(f"未找到股票 {symbol} 的新闻数据")
+            return []
+
+        # 过滤最近几天的新闻
+        cutoff_date = datetime.now() - timedelta(days=days)
+        news_list = []
+        
+        for item in data["feed"]:
+            time_published = datetime.strptime(item["time_published"], "%Y%m%dT%H%M%S")
+            if time_published >= cutoff_date:
+                # 保证按股票查询的新闻至少关联到被查询的股票
+                tickers = item.setdefault("ticker_sentiment", [])
+                if not any(ticker.get("ticker") == symbol for ticker in tickers):
+                    tickers.append({"ticker": symbol})
+                news_list.append(item)
+        
+        return news_list
 
     def fetch_news(self, symbol: str, days: int = 7) -> List[Dict[str, Any]]:
         """
@@ -23,36 +63,164 @@ class NewsCrawler(BaseCrawler):
         :return: 新闻数据列表
         """
         try:
-            params = {
-                "function": "NEWS_SENTIMENT",
-                "tickers": symbol,
-                "apikey": self.api_key,
-                "limit": 50  # 限制返回的新闻数量
-            }
-            
-            response = self.session.get(self.base_url, params=params)
-            response.raise_for_status()
-            data = response.json()
-            
-            if "feed" not in data:
-                logger.warning(f"未找到股票 {symbol} 的新闻数据")
+            data = self.request_json(self._news_params(symbol))
+            if data is None:
                 return []
+            return self._parse_news(symbol, data, days)
 
-            # 过滤最近几天的新闻
-            cutoff_date = datetime.now() - timedelta(days=days)
-            news_list = []
-            
-            for item in data["feed"]:
-                time_published = datetime.strptime(item["time_published"], "%Y%m%dT%H%M%S")
-                if time_published >= cutoff_date:
-                    news_list.append(item)
-            
-            return news_list
+        except QuotaExceededError as e:
+            self._mark_quota_exceeded(symbol, e)
+            return []
+        except Exception as e:
+            logger.error(f"获取股票 {symbol} 的新闻数据时出错: {str(e)}")
+            return []
 
+    async def fetch_news_async(self, fetcher: AsyncFetcher, symbol: str, days: int = 7) -> List[Dict[str, Any]]:
+        """
+        异步获取新闻数据
+        :param fetcher: 异步抓取器
+        :param symbol: 股票代码
+        :param days: 获取最近几天的新闻
+        :return: 新闻数据列表
+        """
+        try:
+            data = await self.request_json_async(fetcher, self._news_params(symbol))
+            if data is None:
+                return []
+            return self._parse_news(symbol, data, days)
+
+        except QuotaExceededError as e:
+            self._mark_quota_exceeded(symbol, e)
+            return []
         except Exception as e:
             logger.error(f"获取股票 {symbol} 的新闻数据时出错: {str(e)}")
             return []
 
+    def _news_record(self, news_data: Dict[str, Any]) -> Dict[str, Any]:
+        """把接口返回的新闻转换为 News 表的记录"""
+        content = news_data.get("summary", "")
+        title = news_data.get("title", "")
+        return {
+            "title": title,
+            "content": content,
+            "source": news_data.get("source", ""),
+            "url": news_data.get("url", ""),
+            "content_hash": self.generate_hash(content),
+            "published_date": datetime.strptime(news_data["time_published"], "%Y%m%dT%H%M%S"),
+            "is_analyzed": False,
+            # 转载的稿件标题常被改写，只对摘要计算签名
+            "minhash": minhash(content or title),
+            "cluster_id": None
+        }
+
+    def assign_clusters(self, records: List[Dict[str, Any]]) -> None:
+        """
+        为新闻记录分配近似重复簇：读取最近几天新闻的 MinHash 签名建立分段索引，
+        只与至少有一段签名相同的候选比较相似度，同一批次内的转载也归入同一簇
+        :param records: _news_record 生成的记录（原地写入 cluster_id）
+        """
+        fingerprinted = [record for record in records if record["minhash"] is not None]
+        if not fingerprinted:
+            return
+
+        index = MinHashIndex(self.near_duplicate_similarity)
+        since = datetime.now() - timedelta(days=self.near_duplicate_window_days)
+        for signature, cluster_id in self.db.execute(
+            select(News.minhash, News.cluster_id)
+            .where(News.published_date >= since, News.minhash.isnot(None), News.cluster_id.isnot(None))
+        ):
+            index.add(signature, cluster_id)
+
+        for record in fingerprinted:
+            cluster_id = index.find(record["minhash"])
+            if cluster_id is None:
+                cluster_id = cluster_key(record["minhash"])
+            record["cluster_id"] = cluster_id
+            index.add(record["minhash"], cluster_id)
+
+    @staticmethod
+    def _optional_float(value: Any) -> Optional[float]:
+        try:
+            return float(value) if value not in (None, "") else None
+        except (TypeError, ValueError):
+            return None
+
+    def _ticker_records(self, news_data: Dict[str, Any], published_date: datetime) -> List[Dict[str, Any]]:
+        """把接口返回的 ticker_sentiment 转换为 NewsTicker 表的记录（不含 news_id）"""
+        records = []
+        for ticker in news_data.get("ticker_sentiment") or []:
+            symbol = (ticker.get("ticker") or "").upper()
+            if not symbol:
+                continue
+            records.append({
+                "symbol": symbol,
+                "relevance_score": self._optional_float(ticker.get("relevance_score")),
+                "sentiment_score": self._optional_float(ticker.get("ticker_sentiment_score")),
+                "sentiment_label": ticker.get("ticker_sentiment_label"),
+                "published_date": published_date
+            })
+        return records
+
+    def save_news_tickers(self, tickers_by_hash: Dict[str, List[Dict[str, Any]]]) -> int:
+        """
+        写入新闻与股票的关联
+        按 content_hash 查出新闻id（包括之前已保存的新闻），已有的关联被主键冲突跳过
+        :param tickers_by_hash: 新闻内容哈希到关联记录的映射
+        :return: 写入的关联数量
+        :raises SQLAlchemyError: 写入失败时回滚后抛出
+        """
+        if not tickers_by_hash:
+            return 0
+        try:
+            ids = dict(self.db.execute(
+                select(News.content_hash, News.id).where(News.content_hash.in_(list(tickers_by_hash)))
+            ).all())
+            records = {}
+            for content_hash, tickers in tickers_by_hash.items():
+                news_id = ids.get(content_hash)
+                if news_id is None:
+                    continue
+                for ticker in tickers:
+                    records.setdefault((news_id, ticker["symbol"]), {"news_id": news_id, **ticker})
+
+            rows = list(records.values())
+            for start in range(0, len(rows), self.insert_batch_size):
+                stmt = insert(NewsTicker).values(rows[start:start + self.insert_batch_size]).on_conflict_do_nothing()
+                self.db.execute(stmt)
+            self.db.commit()
+            return len(rows)
+        except Exception as e:
+            logger.error(f"保存新闻关联股票时出错: {str(e)}")
+            self.db.rollback()
+            raise
+
+    def save_news_batch(self, news_list: List[Dict[str, Any]]) -> List[int]:
+        """
+        批量保存新闻：一次查询去重，剩余新闻在同一事务中写入，随后写入新闻与股票的关联
+        :param news_list: 新闻数据列表
+        :return: 新增新闻的id列表
+        :raises SQLAlchemyError: 写入失败时抛出，调用方据此把抓取标记为失败
+        """
+        records = []
+        tickers_by_hash: Dict[str, List[Dict[str, Any]]] = {}
+        for news_data in news_list:
+            try:
+                record = self._news_record(news_data)
+                records.append(record)
+                tickers_by_hash.setdefault(record["content_hash"], []).extend(
+                    self._ticker_records(news_data, record["published_date"])
+                )
+            except Exception as e:
+                logger.error(f"解析新闻时出错: {str(e)}")
+        try:
+            self.assign_clusters(records)
+        except Exception as e:
+            logger.error(f"检测近似重复新闻时出错: {str(e)}")
+            self.db.rollback()
+        ids = self.insert_new_items(News, records)
+        self.save_news_tickers(tickers_by_hash)
+        return ids
+
     def save_news(self, news_data: Dict[str, Any]) -> bool:
         """
         保存新闻到数据库
@@ -60,34 +228,17 @@ class NewsCrawler(BaseCrawler):
         :return: 是否保存成功
         """
         try:
-            # 生成内容哈希
-            content = news_data.get("summary", "")
-            content_hash = self.generate_hash(content)
-            
-            # 检查是否已存在
-            if self.is_duplicate(content_hash, News):
-                return False
-            
-            # 创建新闻对象
-            news = News(
-                title=news_data.get("title", ""),
-                content=content,
-                source=news_data.get("source", ""),
-                url=news_data.get("url", ""),
-                content_hash=content_hash,
-                published_date=datetime.strptime(news_data["time_published"], "%Y%m%dT%H%M%S")
-            )
-            
-            # 保存到数据库
-            self.db.add(news)
-            self.db.commit()
-            return True
-            
+            return len(self.save_news_batch([news_data])) > 0
         except Exception as e:
             logger.error(f"保存新闻时出错: {str(e)}")
-            self.db.rollback()
             return False
 
+    def _save_news_list(self, symbol: str, news_list: List[Dict[str, Any]]) -> int:
+        """批量保存一只股票的新闻，返回新增数量"""
+        saved_count = len(self.save_news_batch(news_list))
+        logger.info(f"成功保存股票 {symbol} 的 {saved_count} 条新闻")
+        return saved_count
+
     def crawl_news(self, symbol: str, days: int = 7) -> bool:
         """
         爬取并保存新闻
@@ -103,14 +254,53 @@ class NewsCrawler(BaseCrawler):
                 logger.warning(f"未找到股票 {symbol} 的新闻")
                 return True
             
-            saved_count = 0
-            for news_data in news_list:
-                if self.save_news(news_data):
-                    saved_count += 1
-            
-            logger.info(f"成功保存 {saved_count} 条新闻")
+            self._save_news_list(symbol, news_list)
             return True
             
         except Exception as e:
             logger.error(f"爬取股票 {symbol} 的新闻时出错: {str(e)}")
-            return False 
\ No newline at end of file
+            return False
+
+    async def crawl_news_async(self, symbols: List[str], days: int = 7) -> bool:
+        """
+        并发抓取多只股票的新闻，全部完成后批量保存
+        因配额超限未抓取的股票记录在 self.quota_exceeded_symbols
+        :param symbols: 股票代码列表
+        :param days: 获取最近几天的新闻
+        :return: 是否成功
+        """
+        async def fetch(fetcher: AsyncFetcher, symbol: str):
+            return symbol, await self.fetch_news_async(fetcher, symbol, days)
+
+        success = True
+        self.quota_exceeded_symbols = []
+        collected = []
+        async with self.async_fetcher() as fetcher:
+            tasks = [fetch(fetcher, symbol) for symbol in symbols]
+            for completed in asyncio.as_completed(tasks):
+                symbol, news_list = await completed
+                if symbol in self.quota_exceeded_symbols:
+                    continue
+                if not news_list:
+                    logger.warning(f"未找到股票 {symbol} 的新闻")
+                    continue
+                collected.extend(news_list)
+
+        # 同一篇新闻常出现在多只股票的结果中，整批去重后在一个事务中写入
+        try:
+            saved_count = len(self.save_news_batch(collected))
+            logger.info(f"成功保存 {len(symbols)} 只股票的 {saved_count} 条新闻")
+        except Exception as e:
+            logger.error(f"保存新闻时出错: {str(e)}")
+            success = False
+        return success
+
+    def crawl_news_batch(self, symbols: List[str], days: int = 7) -> bool:
+        """
+        爬取并保存多只股票的新闻（同步入口，供Celery任务调用）
+        :param symbols: 股票代码列表
+        :param days: 获取最近几天的新闻
+        :return: 是否成功
+        """
+        logger.info(f"开始并发爬取 {len(symbols)} 只股票的新闻...")
+        return asyncio.run(self.crawl_news_async(symbols, days))
\ No newline at end of file
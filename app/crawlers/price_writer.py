@@ -0,0 +1,77 @@
+import logging
+from typing import Any, Dict, Iterable, List, Set
+from sqlalchemy import event
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.models.crawler import PriceBar, get_price_model, ensure_price_bar_partitions
+
+logger = logging.getLogger(__name__)
+
+PRICE_FIELDS = ('open_price', 'high_price', 'low_price', 'close_price', 'volume')
+
+# 本进程已确认存在的 price_bars 分区年份，只为新出现的年份执行建表语句
+_known_partition_years: Set[int] = set()
+_PENDING_YEARS_KEY = "pending_partition_years"
+
+
+def ensure_partitions_for(db: Session, years: Iterable[int]) -> None:
+    """
+    确保写入涉及的年份已有分区（init_db 已预建到明年，这里通常只会补建更早的历史年份）
+    建表语句在调用方的事务中执行，事务提交后才把年份记为已存在，回滚时下次重新建
+    """
+    missing = set(years) - _known_partition_years
+    if not missing:
+        return
+    ensure_price_bar_partitions(db, missing)
+    db.info.setdefault(_PENDING_YEARS_KEY, set()).update(missing)
+
+
+@event.listens_for(Session, "after_commit")
+def _remember_partition_years(session: Session) -> None:
+    years = session.info.pop(_PENDING_YEARS_KEY, None)
+    if years:
+        _known_partition_years.update(years)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_partition_years(session: Session) -> None:
+    session.info.pop(_PENDING_YEARS_KEY, None)
+
+
+def upsert_price_records(
+    db: Session,
+    records: List[Dict[str, Any]],
+    batch_size: int = 5000,
+    interval: str = "1d"
+) -> int:
+    """
+    按 PRICE_STORAGE 配置把K线记录写入 stock_data 或 price_bars
+    使用 INSERT ... ON CONFLICT DO UPDATE，由调用方提交事务
+    :param db: 数据库会话
+    :param records: 包含 symbol、date 和价格字段的记录
+    :param batch_size: 每次执行的记录数
+    :param interval: K线周期（stock_data 只保存日线）
+    :return: 写入的记录数
+    """
+    if not records:
+        return 0
+
+    model = get_price_model(settings.price_storage)
+    if model is PriceBar:
+        records = [{**record, 'interval': interval} for record in records]
+        index_elements = [PriceBar.symbol, PriceBar.interval, PriceBar.date]
+        ensure_partitions_for(db, {record['date'].year for record in records})
+    else:
+        if interval != "1d":
+            raise ValueError(f"stock_data 只保存日线，周期 {interval} 需要 PRICE_STORAGE=price_bars")
+        index_elements = [model.symbol, model.date]
+
+    stmt = insert(model)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=index_elements,
+        set_={field: stmt.excluded[field] for field in PRICE_FIELDS}
+    )
+    for start in range(0, len(records), batch_size):
+        db.execute(stmt, records[start:start + batch_size])
+    return len(records)
@@ -0,0 +1,164 @@
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional
+from config.dev import settings
+
+try:
+    import redis
+except ImportError:  # redis 为可选依赖，缺失时只能使用进程内限流
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+
+class QuotaExceededError(Exception):
+    """接口返回配额超限提示（而不是真正的空数据）"""
+
+
+def is_alpha_vantage_quota_payload(data: Any) -> bool:
+    """判断 Alpha Vantage 的返回是否为配额超限提示"""
+    if not isinstance(data, dict):
+        return False
+    if "Note" in data:
+        return True
+    message = str(data.get("Information", "")).lower()
+    return any(keyword in message for keyword in ("rate limit", "call frequency", "requests per day"))
+
+
+class LocalTokenBucketBackend:
+    """进程内令牌桶，用于测试或没有Redis的单进程部署"""
+
+    blocking = False  # 只持有进程内锁，可以直接在事件循环中调用
+
+    def __init__(self):
+        self._buckets: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str, rate: float, capacity: float, tokens: float = 1) -> float:
+        """尝试取令牌，成功返回0，否则返回需要等待的秒数"""
+        with self._lock:
+            now = time.monotonic()
+            bucket = self._buckets.setdefault(key, [capacity, now])
+            available = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if available >= tokens:
+                bucket[0] = available - tokens
+                return 0.0
+            bucket[0] = available
+            return (tokens - available) / rate
+
+
+class RedisTokenBucketBackend:
+    """基于Redis的令牌桶，所有Celery worker共享同一个桶"""
+
+    blocking = True  # 同步网络调用，异步场景下需放到线程池执行
+
+    # 使用Redis服务器时间，避免各主机时钟不一致
+    SCRIPT = """
+local key = KEYS[1]
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local bucket = redis.call('HMGET', key, 'tokens', 'ts')
+local tokens = tonumber(bucket[1])
+local ts = tonumber(bucket[2])
+if tokens == nil then
+    tokens = capacity
+    ts = now
+end
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= requested then
+    tokens = tokens - requested
+else
+    wait = (requested - tokens) / rate
+end
+redis.call('HSET', key, 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', key, math.ceil(capacity / rate) * 2 + 1)
+return tostring(wait)
+"""
+
+    def __init__(self, client):
+        self._script = client.register_script(self.SCRIPT)
+
+    def acquire(self, key: str, rate: float, capacity: float, tokens: float = 1) -> float:
+        """尝试取令牌，成功返回0，否则返回需要等待的秒数"""
+        return float(self._script(keys=[key], args=[rate, capacity, tokens]))
+
+
+class TokenBucketLimiter:
+    """令牌桶限流器，按速率平滑放行请求"""
+
+    def __init__(self, name: str, requests_per_minute: float, burst: Optional[int] = None, backend=None):
+        self.key = f"ratelimit:{name}"
+        self.rate = requests_per_minute / 60.0
+        self.capacity = float(burst or max(1, int(requests_per_minute)))
+        self.backend = backend or LocalTokenBucketBackend()
+
+    def acquire(self) -> None:
+        """阻塞直到取得令牌"""
+        while True:
+            wait = self.backend.acquire(self.key, self.rate, self.capacity)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self) -> None:
+        """在事件循环中等待直到取得令牌"""
+        loop = asyncio.get_running_loop()
+        while True:
+            if getattr(self.backend, "blocking", True):
+                # Redis调用放到默认线程池，避免阻塞事件循环中的其他请求
+                wait = await loop.run_in_executor(
+                    None, self.backend.acquire, self.key, self.rate, self.capacity
+                )
+            else:
+                wait = self.backend.acquire(self.key, self.rate, self.capacity)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+
+_backend = None
+_limiters: Dict[str, TokenBucketLimiter] = {}
+
+
+def get_backend():
+    """根据配置创建令牌桶后端，Redis不可用时退回进程内实现"""
+    global _backend
+    if _backend is not None:
+        return _backend
+
+    if settings.RATE_LIMIT_BACKEND == "redis":
+        if redis is None:
+            logger.warning("未安装redis，限流器退回进程内实现")
+        else:
+            try:
+                client = redis.Redis.from_url(settings.REDIS_URL)
+                client.ping()
+                _backend = RedisTokenBucketBackend(client)
+                return _backend
+            except Exception as e:
+                logger.warning(f"连接Redis失败，限流器退回进程内实现: {str(e)}")
+
+    _backend = LocalTokenBucketBackend()
+    return _backend
+
+
+def get_alpha_vantage_limiter(api_key: str) -> TokenBucketLimiter:
+    """获取按API Key共享的 Alpha Vantage 限流器"""
+    # 不把API Key明文写入Redis
+    name = "alphavantage:" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+    if name not in _limiters:
+        _limiters[name] = TokenBucketLimiter(
+            name,
+            requests_per_minute=settings.ALPHA_VANTAGE_REQUESTS_PER_MINUTE,
+            burst=settings.ALPHA_VANTAGE_BURST,
+            backend=get_backend()
+        )
+    return _limiters[name]
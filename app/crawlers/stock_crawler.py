@@ -1,10 +1,16 @@
 import yfinance as yf
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
-from typing import List, Optional
+from typing import List, Optional, Dict, Any
 import logging
 from app.core.database import SessionLocal
-from app.models.crawler import StockData
+from sqlalchemy.orm import Session
+from app.services.analysis_service import AnalysisService
+from app.crawlers.batch_download import download_stock_data, ticker_validity
+from app.crawlers.price_writer import upsert_price_records
+from app.services.price_repository import PriceRepository
+from app.services.result_cache import get_result_cache
 import time
 import json
 import requests
@@ -22,9 +28,16 @@ class StockCrawler:
                        status_forcelist=[500, 502, 503, 504])
         self.session.mount('http://', HTTPAdapter(max_retries=retries))
         self.session.mount('https://', HTTPAdapter(max_retries=retries))
+        self.analysis_service = AnalysisService()
+        self.upsert_batch_size = 5000
+        self.download_batch_size = 100  # 每次批量下载的股票数量
         
-    def _get_stock_data(self, symbol: str, period: str = "1d", retry_count: int = 0) -> Optional[pd.DataFrame]:
-        """获取股票数据，带重试机制"""
+    def _get_stock_data(self, symbol: str, period: str = "1d", interval: str = "1d", retry_count: int = 0) -> Optional[pd.DataFrame]:
+        """
+        获取股票数据，带重试机制
+        :return: 股票数据；数据源明确返回无数据时返回空DataFrame，请求失败等临时错误返回None
+        """
+        failed = False  # 是否出现过请求异常或数据不完整，用于区分临时失败和确定无数据
         try:
             logger.info(f"开始获取股票 {symbol} 的数据...")
             
@@ -33,7 +46,7 @@ class StockCrawler:
                 try:
                     # 使用session进行请求
                     stock = yf.Ticker(symbol, session=self.session)
-                    data = stock.history(period=period)
+                    data = stock.history(period=period, interval=interval)
                     
                     if not data.empty:
                         # 检查数据是否有效
@@ -46,6 +59,7 @@ class StockCrawler:
                             return data
                             
                         logger.warning(f"股票 {symbol} 的数据格式不完整")
+                        failed = True
                     else:
                         logger.warning(f"第 {attempt + 1} 次尝试获取 {symbol} 数据为空")
                         
@@ -53,6 +67,7 @@ class StockCrawler:
                     
                 except Exception as e:
                     logger.warning(f"第 {attempt + 1} 次尝试获取 {symbol} 数据失败: {str(e)}")
+                    failed = True
                     if attempt < self.max_retries - 1:
                         time.sleep(self.retry_delay * (attempt + 1))
                     continue
@@ -64,55 +79,118 @@ class StockCrawler:
                 backup_data = yf.download(symbol, 
                                         start=start_date.strftime('%Y-%m-%d'),
                                         end=end_date.strftime('%Y-%m-%d'),
+                                        interval=interval,
                                         progress=False)
                 if not backup_data.empty:
                     logger.info(f"使用备用数据源获取 {symbol} 的数据成功")
                     return backup_data
             except Exception as e:
                 logger.error(f"备用数据源获取 {symbol} 的数据失败: {str(e)}")
+                failed = True
             
             logger.error(f"获取股票 {symbol} 的数据失败")
-            return None
+            return None if failed else pd.DataFrame()
             
         except Exception as e:
             logger.error(f"获取股票 {symbol} 的数据时发生错误: {str(e)}")
             return None
 
-    def crawl_stock_data(self, symbols: List[str], period: str = "1d") -> bool:
-        """爬取多个股票的数据"""
+    def _to_records(self, symbol: str, data: pd.DataFrame) -> List[Dict[str, Any]]:
+        """把yfinance返回的DataFrame按列转换为待写入的记录（跳过价格缺失的行）"""
+        index = data.index
+        if isinstance(index, pd.DatetimeIndex) and index.tz is not None:
+            index = index.tz_localize(None)
+
+        opens = data['Open'].to_numpy(dtype=np.float64)
+        highs = data['High'].to_numpy(dtype=np.float64)
+        lows = data['Low'].to_numpy(dtype=np.float64)
+        closes = data['Close'].to_numpy(dtype=np.float64)
+        volumes = data['Volume'].fillna(0).to_numpy(dtype=np.int64)
+        valid = np.isfinite(opens) & np.isfinite(highs) & np.isfinite(lows) & np.isfinite(closes)
+        if not valid.all():
+            logger.warning(f"股票 {symbol} 有 {int((~valid).sum())} 条数据价格缺失，已跳过")
+
+        return [
+            {
+                'symbol': symbol,
+                'date': date,
+                'open_price': open_price,
+                'high_price': high_price,
+                'low_price': low_price,
+                'close_price': close_price,
+                'volume': volume
+            }
+            for date, open_price, high_price, low_price, close_price, volume in zip(
+                index[valid].to_pydatetime(),
+                opens[valid].tolist(),
+                highs[valid].tolist(),
+                lows[valid].tolist(),
+                closes[valid].tolist(),
+                volumes[valid].tolist()
+            )
+        ]
+
+    def _upsert_stock_data(self, db: Session, records: List[Dict[str, Any]], interval: str = "1d") -> int:
+        """
+        使用 INSERT ... ON CONFLICT DO UPDATE 批量写入股票数据（按 PRICE_STORAGE 写入对应的表）
+        :param db: 数据库会话（由调用方提交事务）
+        :param records: _to_records 转换后的记录
+        :param interval: K线周期
+        :return: 写入的记录数
+        """
+        return upsert_price_records(db, records, self.upsert_batch_size, interval)
+
+    def crawl_stock_data(self, symbols: List[str], period: str = "1d", interval: str = "1d") -> bool:
+        """
+        爬取多个股票的数据
+        :param period: 时间范围 (1d, 5d, 1mo, 1y 等)
+        :param interval: K线周期，写入数据库和本地列式存储时使用同一周期；增量指标只维护日线
+        """
         success = True
         db = SessionLocal()
         
         try:
+            # 先批量下载所有股票，缺失的再逐个补抓
+            frames = download_stock_data(
+                symbols, period, chunk_size=self.download_batch_size, session=self.session, interval=interval
+            )
+            
             for symbol in symbols:
                 try:
-                    data = self._get_stock_data(symbol, period)
+                    data = frames.get(symbol)
+                    if data is None and not ticker_validity.is_invalid(symbol):
+                        data = self._get_stock_data(symbol, period, interval)
+                        # 临时失败（None）不更新有效性缓存，只有数据源明确无数据时才标记为无效
+                        if data is not None:
+                            ticker_validity.mark(symbol, not data.empty)
                     if data is not None and not data.empty:
-                        # 保存数据到数据库
-                        for index, row in data.iterrows():
-                            try:
-                                # 确保数据类型正确
-                                stock_data = StockData(
-                                    symbol=symbol,
-                                    date=index,
-                                    open_price=float(row['Open']),
-                                    high_price=float(row['High']),
-                                    low_price=float(row['Low']),
-                                    close_price=float(row['Close']),
-                                    volume=int(row['Volume'])
-                                )
-                                db.add(stock_data)
-                            except (ValueError, TypeError) as e:
-                                logger.error(f"处理股票 {symbol} 在 {index} 的数据时发生错误: {str(e)}")
-                                continue
-                                
+                        # 整批写入数据库（按 symbol+date 去重更新）
                         try:
+                            records = self._to_records(symbol, data)
+                            saved_count = self._upsert_stock_data(db, records, interval)
                             db.commit()
-                            logger.info(f"成功保存股票 {symbol} 的数据")
+                            logger.info(f"成功保存股票 {symbol} 的 {saved_count} 条数据")
                         except Exception as e:
                             logger.error(f"保存股票 {symbol} 数据到数据库时发生错误: {str(e)}")
                             db.rollback()
                             success = False
+                            continue
+
+                        # 数据库提交后同步到本地列式存储（首次写入时从数据库加载完整历史）
+                        if records:
+                            try:
+                                PriceRepository(db).sync_store(symbol, records, interval)
+                            except Exception as e:
+                                logger.error(f"写入股票 {symbol} 的本地列式存储时发生错误: {str(e)}")
+
+                        # 只用实际写入的K线推进增量指标状态（指标状态按日线维护）
+                        if interval == "1d" and records:
+                            bars = self.analysis_service.records_to_bars(records)
+                            self.analysis_service.update_indicator_state(db, symbol, bars)
+
+                        # 指标状态提交后再使该股票的分析结果缓存失效，避免并发请求用旧状态重新填充新版本的缓存
+                        if records:
+                            get_result_cache().invalidate(symbol, max(record['date'] for record in records))
                     else:
                         logger.warning(f"未找到股票 {symbol} 的数据")
                         success = False
@@ -8,9 +8,26 @@ import logging
 from typing import List
 from app.crawlers.stock_crawler import StockCrawler
 from app.core.celery_app import celery_app
+from app.services.tasks import analyze_pending_news, analyze_pending_reports
+from config.dev import settings
 
 logger = logging.getLogger(__name__)
 
+def requeue_quota_exceeded(task, symbols: List[str], requeue_count: int, *args):
+    """把因接口配额超限而未抓取的股票延迟后重新排队"""
+    if not symbols:
+        return
+    if requeue_count >= settings.ALPHA_VANTAGE_MAX_REQUEUES:
+        logger.error(f"股票 {symbols} 多次因配额超限未能抓取，放弃重新排队")
+        return
+    countdown = settings.ALPHA_VANTAGE_REQUEUE_DELAY * (2 ** requeue_count)
+    logger.info(f"股票 {symbols} 因配额超限将在 {countdown} 秒后重新排队")
+    task.apply_async(
+        args=(symbols, *args),
+        kwargs={'requeue_count': requeue_count + 1},
+        countdown=countdown
+    )
+
 @shared_task(
     bind=True,
     max_retries=3,
@@ -20,12 +37,12 @@ logger = logging.getLogger(__name__)
     retry_backoff_max=600,
     retry_jitter=True
 )
-def crawl_stock_data(self, symbols: List[str], period: str = "1d"):
+def crawl_stock_data(self, symbols: List[str], period: str = "1d", interval: str = "1d"):
     """爬取股票数据的Celery任务"""
     try:
         logger.info(f"开始爬取股票数据: {symbols}")
         crawler = StockCrawler()
-        success = crawler.crawl_stock_data(symbols, period)
+        success = crawler.crawl_stock_data(symbols, period, interval)
         if not success:
             raise Exception(f"Failed to crawl stock data for symbols: {symbols}")
         return success
@@ -42,18 +59,25 @@ def crawl_stock_data(self, symbols: List[str], period: str = "1d"):
     retry_backoff_max=600,
     retry_jitter=True
 )
-def crawl_financial_reports(self, symbols: List[str], report_type: str = "10-K"):
+def crawl_financial_reports(self, symbols: List[str], report_type: str = "10-K", requeue_count: int = 0):
     """爬取财务报告的Celery任务"""
     try:
         logger.info(f"开始爬取财务报告: {symbols}")
-        crawler = FinancialReportCrawler()
-        success = crawler.crawl_financial_reports(symbols, report_type)
+        db = SessionLocal()
+        crawler = FinancialReportCrawler(db)
+        success = crawler.crawl_financial_reports_batch(symbols, report_type)
+        requeue_quota_exceeded(crawl_financial_reports, crawler.quota_exceeded_symbols, requeue_count, report_type)
+        # 新报表入库后在后台预先生成LLM分析，部分失败时已入库的报表同样需要分析
+        if success or crawler.saved_count:
+            analyze_pending_reports.delay()
         if not success:
             raise Exception(f"Failed to crawl financial reports for symbols: {symbols}")
         return success
     except Exception as e:
         logger.error(f"爬取财务报告时发生错误: {str(e)}")
         raise self.retry(exc=e)
+    finally:
+        db.close()
 
 @shared_task(
     bind=True,
@@ -64,13 +88,17 @@ def crawl_financial_reports(self, symbols: List[str], report_type: str = "10-K")
     retry_backoff_max=600,
     retry_jitter=True
 )
-def crawl_news(self, symbols: List[str], days: int = 7):
+def crawl_news(self, symbols: List[str], days: int = 7, requeue_count: int = 0):
     """爬取新闻的Celery任务"""
     try:
         logger.info(f"开始爬取新闻: {symbols}")
         db = SessionLocal()
         crawler = NewsCrawler(db)
-        success = crawler.crawl_news(symbols, days)
+        success = crawler.crawl_news_batch(symbols, days)
+        requeue_quota_exceeded(crawl_news, crawler.quota_exceeded_symbols, requeue_count, days)
+        # 新闻入库后在后台预先生成LLM分析，部分失败时已入库的新闻同样需要分析
+        if success or crawler.saved_count:
+            analyze_pending_news.delay(symbols)
         if not success:
             raise Exception(f"Failed to crawl news for symbols: {symbols}")
         return success
@@ -1,10 +1,19 @@
+import math
 import yfinance as yf
+import pandas as pd
 from datetime import datetime, timedelta
-from typing import List, Optional
+from typing import List, Optional, Dict, Any
+from sqlalchemy import update
 from sqlalchemy.orm import Session
 from app.core.logging_config import logger
 from app.crawlers.base import BaseCrawler
-from app.models.crawler import StockData
+from app.core.config import settings
+from app.crawlers.batch_download import download_stock_data, ticker_validity
+from app.crawlers.price_writer import PRICE_FIELDS, upsert_price_records
+from app.models.crawler import StockData, get_price_model, price_filters
+from app.services.analysis_service import AnalysisService
+from app.services.price_repository import PriceRepository
+from app.services.result_cache import get_result_cache
 import time
 
 class YahooFinanceCrawler(BaseCrawler):
@@ -12,53 +21,73 @@ class YahooFinanceCrawler(BaseCrawler):
         super().__init__(db)
         self.max_retries = 3
         self.retry_delay = 2  # 重试延迟（秒）
+        self.download_batch_size = 100  # 每次批量下载的股票数量
+        self.last_save_stats = {'inserted': 0, 'updated': 0, 'skipped': 0}
+        self.crawl_stats = {'inserted': 0, 'updated': 0, 'skipped': 0}
+        self.analysis_service = AnalysisService()
 
-    def fetch_stock_data(self, symbol: str, period: str = "1y") -> Optional[List[StockData]]:
+    def _to_stock_data(self, symbol: str, df: pd.DataFrame) -> List[StockData]:
+        """把yfinance返回的DataFrame转换为StockData列表"""
+        df = df.dropna(subset=['Open', 'High', 'Low', 'Close'])
+        return [
+            StockData(
+                symbol=symbol,
+                date=date,
+                open_price=open_price,
+                high_price=high_price,
+                low_price=low_price,
+                close_price=close_price,
+                volume=volume
+            )
+            for date, open_price, high_price, low_price, close_price, volume in zip(
+                df.index.to_pydatetime(),
+                df['Open'].astype(float).tolist(),
+                df['High'].astype(float).tolist(),
+                df['Low'].astype(float).tolist(),
+                df['Close'].astype(float).tolist(),
+                df['Volume'].fillna(0).astype('int64').tolist()
+            )
+        ]
+
+    def fetch_stock_data(self, symbol: str, period: str = "1y", interval: str = "1d") -> Optional[List[StockData]]:
         """
         获取股票数据
         :param symbol: 股票代码
         :param period: 时间周期 (1d, 5d, 1mo, 3mo, 6mo, 1y, 2y, 5y, 10y, ytd, max)
+        :param interval: K线周期 (1d, 1h, 5m 等)
         :return: 股票数据列表
         """
+        failed = False  # 出现过请求异常时不把空结果当作确定无数据
         for attempt in range(self.max_retries):
             try:
                 logger.info(f"开始获取股票 {symbol} 的数据（第{attempt + 1}次尝试）...")
-                stock = yf.Ticker(symbol)
                 
-                # 尝试获取股票信息以验证股票代码是否有效
-                info = stock.info
-                if not info:
+                # 使用有效性缓存代替每次调用 stock.info 验证股票代码
+                if ticker_validity.is_invalid(symbol):
                     logger.warning(f"股票代码 {symbol} 可能无效")
                     return None
 
                 # 获取历史数据
-                df = stock.history(period=period)
+                df = yf.Ticker(symbol).history(period=period, interval=interval)
                 
                 if df.empty:
                     logger.warning(f"未找到股票 {symbol} 的数据，将在 {self.retry_delay} 秒后重试...")
                     if attempt < self.max_retries - 1:
                         time.sleep(self.retry_delay)
                         continue
+                    if not failed:
+                        ticker_validity.mark(symbol, False)
                     return None
 
-                stock_data_list = []
-                for date, row in df.iterrows():
-                    stock_data = StockData(
-                        symbol=symbol,
-                        date=date,
-                        open_price=float(row['Open']),
-                        high_price=float(row['High']),
-                        low_price=float(row['Low']),
-                        close_price=float(row['Close']),
-                        volume=int(row['Volume'])
-                    )
-                    stock_data_list.append(stock_data)
+                ticker_validity.mark(symbol, True)
+                stock_data_list = self._to_stock_data(symbol, df)
 
                 logger.info(f"成功获取股票 {symbol} 的 {len(stock_data_list)} 条数据")
                 return stock_data_list
 
             except Exception as e:
                 logger.error(f"获取股票 {symbol} 数据时出错: {str(e)}")
+                failed = True
                 if attempt < self.max_retries - 1:
                     logger.info(f"将在 {self.retry_delay} 秒后重试...")
                     time.sleep(self.retry_delay)
@@ -66,49 +95,142 @@ class YahooFinanceCrawler(BaseCrawler):
                     logger.error(f"已达到最大重试次数 ({self.max_retries})，放弃获取股票 {symbol} 的数据")
                     return None
 
-    def save_stock_data(self, stock_data_list: List[StockData]) -> bool:
+    PRICE_FIELDS = PRICE_FIELDS
+
+    @staticmethod
+    def _naive_date(date: datetime) -> datetime:
+        """去掉时区信息，与数据库中的无时区日期保持一致"""
+        return date.replace(tzinfo=None) if date.tzinfo is not None else date
+
+    def _is_changed(self, existing: Dict[str, Any], stock_data: StockData) -> bool:
+        """比较已存在的记录与新数据的价格和成交量是否有变化"""
+        return any(
+            not math.isclose(existing[field] or 0, getattr(stock_data, field) or 0, rel_tol=1e-9)
+            for field in self.PRICE_FIELDS
+        )
+
+    def _price_values(self, stock_data: StockData) -> Dict[str, Any]:
+        return {field: getattr(stock_data, field) for field in self.PRICE_FIELDS}
+
+    def _write_price_store(self, by_symbol: Dict[str, List[StockData]], interval: str = "1d") -> None:
+        """数据库提交后同步到本地列式存储（未启用时跳过，首次写入时从数据库加载完整历史）"""
+        repository = PriceRepository(self.db)
+        for symbol, items in by_symbol.items():
+            try:
+                repository.sync_store(
+                    symbol, [{'date': item.date, **self._price_values(item)} for item in items], interval
+                )
+            except Exception as e:
+                logger.error(f"写入股票 {symbol} 的本地列式存储时出错: {str(e)}")
+
+    def save_stock_data(self, stock_data_list: List[StockData], interval: str = "1d") -> bool:
         """
         保存股票数据到数据库
+        每只股票只用一次查询取出日期范围内已有的记录，在内存中区分新增、更新和跳过
         :param stock_data_list: 股票数据列表
-        :return: 是否保存成功
+        :param interval: K线周期（stock_data 只保存日线）
+        :return: 是否保存成功，统计结果保存在 self.last_save_stats
         """
+        stats = {'inserted': 0, 'updated': 0, 'skipped': 0}
         try:
-            saved_count = 0
+            by_symbol: Dict[str, List[StockData]] = {}
             for stock_data in stock_data_list:
-                # 检查是否已存在相同日期的数据
-                existing_data = self.db.query(StockData).filter(
-                    StockData.symbol == stock_data.symbol,
-                    StockData.date == stock_data.date
-                ).first()
+                stock_data.date = self._naive_date(stock_data.date)
+                by_symbol.setdefault(stock_data.symbol, []).append(stock_data)
 
-                if not existing_data:
-                    self.db.add(stock_data)
-                    saved_count += 1
+            model = get_price_model(settings.price_storage)
+            if model is StockData and interval != "1d":
+                raise ValueError(f"stock_data 只保存日线，周期 {interval} 需要 PRICE_STORAGE=price_bars")
+            # 只有 stock_data 有代理主键，可以按id批量更新；price_bars 的新增和变化记录统一走upsert
+            key_columns = [StockData.id] if model is StockData else []
+            for symbol, items in by_symbol.items():
+                dates = [item.date for item in items]
+                rows = self.db.query(
+                    *key_columns, model.date, *[getattr(model, field) for field in self.PRICE_FIELDS]
+                ).filter(*price_filters(model, symbol, min(dates), max(dates), interval)).all()
+                existing = {row.date: row._asdict() for row in rows}
+
+                new_rows = []
+                changed = []
+                seen = set()
+                for item in items:
+                    current = existing.get(item.date)
+                    if item.date in seen:
+                        # 同一批次内重复的日期只写入一次
+                        stats['skipped'] += 1
+                    elif current is None:
+                        new_rows.append(item)
+                    elif self._is_changed(current, item):
+                        changed.append((current, item))
+                    else:
+                        stats['skipped'] += 1
+                    seen.add(item.date)
+
+                if model is StockData:
+                    if new_rows:
+                        self.db.add_all(new_rows)
+                    if changed:
+                        self.db.execute(
+                            update(StockData),
+                            [{'id': current['id'], **self._price_values(item)} for current, item in changed]
+                        )
+                else:
+                    upsert_price_records(self.db, [
+                        {'symbol': symbol, 'date': item.date, **self._price_values(item)}
+                        for item in new_rows + [item for _, item in changed]
+                    ], interval=interval)
+                stats['inserted'] += len(new_rows)
+                stats['updated'] += len(changed)
 
             self.db.commit()
-            logger.info(f"成功保存 {saved_count} 条新数据到数据库")
+            self.last_save_stats = stats
+            self._write_price_store(by_symbol, interval)
+            for symbol, items in by_symbol.items():
+                # 推进增量指标状态后再使分析结果缓存失效（指标状态按日线维护）
+                if interval == "1d":
+                    bars = self.analysis_service.records_to_bars(
+                        [{'date': item.date, **self._price_values(item)} for item in items]
+                    )
+                    self.analysis_service.update_indicator_state(self.db, symbol, bars)
+                get_result_cache().invalidate(symbol, max(item.date for item in items))
+            logger.info(f"保存完成：新增 {stats['inserted']} 条，更新 {stats['updated']} 条，跳过 {stats['skipped']} 条")
             return True
         except Exception as e:
             logger.error(f"保存股票数据时出错: {str(e)}")
             self.db.rollback()
+            # 事务已回滚，本批次没有任何记录被写入
+            self.last_save_stats = {'inserted': 0, 'updated': 0, 'skipped': 0}
             return False
 
-    def crawl_stock_data(self, symbols: List[str], period: str = "1y") -> bool:
+    def crawl_stock_data(self, symbols: List[str], period: str = "1y", interval: str = "1d") -> bool:
         """
         爬取并保存多个股票的数据
         :param symbols: 股票代码列表
         :param period: 时间周期
+        :param interval: K线周期
         :return: 是否成功
         """
         success = True
+        self.crawl_stats = {'inserted': 0, 'updated': 0, 'skipped': 0}
+        frames = download_stock_data(symbols, period, chunk_size=self.download_batch_size, interval=interval)
         for symbol in symbols:
             logger.info(f"开始爬取股票 {symbol} 的数据...")
-            stock_data_list = self.fetch_stock_data(symbol, period)
+            if symbol in frames:
+                stock_data_list = self._to_stock_data(symbol, frames[symbol])
+            else:
+                # 批量结果中缺失的股票逐个补抓
+                stock_data_list = self.fetch_stock_data(symbol, period, interval)
             if stock_data_list:
-                if not self.save_stock_data(stock_data_list):
+                if not self.save_stock_data(stock_data_list, interval):
                     success = False
                     logger.error(f"保存股票 {symbol} 的数据失败")
+                for key, count in self.last_save_stats.items():
+                    self.crawl_stats[key] += count
             else:
                 success = False
                 logger.error(f"获取股票 {symbol} 的数据失败")
+        logger.info(
+            f"爬取完成：新增 {self.crawl_stats['inserted']} 条，"
+            f"更新 {self.crawl_stats['updated']} 条，跳过 {self.crawl_stats['skipped']} 条"
+        )
         return success 
\ No newline at end of file
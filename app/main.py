@@ -1,7 +1,7 @@
 from fastapi import FastAPI, Depends
 from sqlalchemy.orm import Session
-from app.core.database import get_db
-from app.api import analysis, prediction
+from app.core.database import get_db, pool_status
+from app.api import analysis, prediction, search
 from app.core.config import settings
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -23,6 +23,7 @@ app.add_middleware(
 # 注册路由
 app.include_router(analysis.router, prefix="/api/analysis", tags=["分析"])
 app.include_router(prediction.router, prefix="/api/prediction", tags=["预测"])
+app.include_router(search.router, prefix="/api/search", tags=["搜索"])
 
 @app.get("/")
 async def root():
@@ -30,4 +31,9 @@ async def root():
         "message": "欢迎使用量化分析API",
         "docs_url": "/docs",
         "redoc_url": "/redoc"
-    } 
\ No newline at end of file
+    }
+
+@app.get("/metrics/db-pool")
+async def db_pool_metrics():
+    """数据库连接池使用情况（当前工作进程）"""
+    return pool_status() 
\ No newline at end of file
@@ -69,6 +69,12 @@ class NewsAnalysis(Base):
     # 综合分析
     news_summary = Column(String)  # 新闻摘要
     analysis_summary = Column(String)  # 分析总结
+    
+    # 分析来源
+    news_ids = Column(JSON)  # 本次分析覆盖的新闻id
+    news_count = Column(Integer)  # 新闻数量
+    latest_published_date = Column(DateTime, index=True)  # 本次分析覆盖的最新新闻的发布时间
+    model = Column(String)  # 使用的模型
 
 class FinancialAnalysis(Base):
     """财务分析结果表"""
@@ -77,7 +83,9 @@ class FinancialAnalysis(Base):
     id = Column(Integer, primary_key=True, index=True)
     symbol = Column(String, index=True)
     analysis_date = Column(DateTime, default=datetime.now)
+    report_id = Column(Integer, ForeignKey("financial_reports.id"), unique=True, index=True)  # 对应的财务报表
     report_type = Column(String)  # 报表类型(10-K/10-Q)
+    report_date = Column(DateTime)  # 报表日期
     
     # 财务指标
     revenue_growth = Column(Float)  # 收入增长率
@@ -94,4 +102,15 @@ class FinancialAnalysis(Base):
     # 综合分析
     strength_factors = Column(JSON)  # 优势因素
     weakness_factors = Column(JSON)  # 劣势因素
-    analysis_summary = Column(String)  # 分析总结 
\ No newline at end of file
+    analysis_summary = Column(String)  # 分析总结
+    model = Column(String)  # 使用的模型
+
+class IndicatorState(Base):
+    """增量技术指标状态表（每只股票一行）"""
+    __tablename__ = "indicator_state"
+
+    symbol = Column(String, primary_key=True)
+    last_date = Column(DateTime)  # 已处理的最后一根K线日期
+    state = Column(JSON)  # EMA/Wilder累加器及滚动窗口
+    latest = Column(JSON)  # 最新指标值
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
@@ -1,10 +1,27 @@
-from sqlalchemy import Column, Integer, String, DateTime, Float, Text, ForeignKey, Boolean
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, BigInteger, LargeBinary, String, DateTime, Float, Text, ForeignKey, Boolean, UniqueConstraint, Index, Computed, DDL, event, text
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import relationship, deferred
 from app.core.database import Base
 from datetime import datetime
 
+# 全文检索使用的分词配置（新闻和财报均为英文）
+SEARCH_CONFIG = "english"
+
+def search_vector_expression(title_column: str, content_column: str) -> str:
+    """全文检索向量的生成列表达式：标题权重A，正文权重B"""
+    return (
+        f"setweight(to_tsvector('{SEARCH_CONFIG}'::regconfig, coalesce({title_column}, '')), 'A') || "
+        f"setweight(to_tsvector('{SEARCH_CONFIG}'::regconfig, coalesce({content_column}, '')), 'B')"
+    )
+
+NEWS_SEARCH_EXPRESSION = search_vector_expression("title", "content")
+REPORT_SEARCH_EXPRESSION = search_vector_expression("title", "content")
+
 class StockData(Base):
     __tablename__ = "stock_data"
+    __table_args__ = (
+        UniqueConstraint("symbol", "date", name="uq_stock_data_symbol_date"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     symbol = Column(String, index=True)
@@ -13,11 +30,35 @@ class StockData(Base):
     high_price = Column(Float)
     low_price = Column(Float)
     close_price = Column(Float)
-    volume = Column(Integer)
+    volume = Column(BigInteger)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+class PriceBar(Base):
+    """
+    紧凑的K线表：以 (symbol, interval, date) 为复合主键，不保留代理主键和创建时间，
+    按日期范围分区（每年一个分区），同时支持日线和分钟线
+    """
+    __tablename__ = "price_bars"
+    __table_args__ = {"postgresql_partition_by": "RANGE (date)"}
+
+    symbol = Column(String(16), primary_key=True)
+    interval = Column(String(8), primary_key=True, default="1d")  # 1d, 1h, 5m 等
+    date = Column(DateTime, primary_key=True)
+    open_price = Column(Float)
+    high_price = Column(Float)
+    low_price = Column(Float)
+    close_price = Column(Float)
+    volume = Column(BigInteger)
+
 class FinancialReport(Base):
     __tablename__ = "financial_reports"
+    __table_args__ = (
+        Index("ix_financial_reports_search_vector", "search_vector", postgresql_using="gin"),
+        Index(
+            "ix_financial_reports_title_trgm", "title",
+            postgresql_using="gin", postgresql_ops={"title": "gin_trgm_ops"}
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     company_symbol = Column(String, index=True)
@@ -28,9 +69,16 @@ class FinancialReport(Base):
     content_hash = Column(String, unique=True)
     url = Column(String)
     created_at = Column(DateTime, default=datetime.utcnow)
+    is_analyzed = Column(Boolean, default=False)
+    # 写入时由数据库维护的全文检索向量，只在检索条件中使用，查询对象时不加载
+    search_vector = deferred(Column(TSVECTOR, Computed(REPORT_SEARCH_EXPRESSION, persisted=True)))
 
 class News(Base):
     __tablename__ = "news"
+    __table_args__ = (
+        Index("ix_news_search_vector", "search_vector", postgresql_using="gin"),
+        Index("ix_news_title_trgm", "title", postgresql_using="gin", postgresql_ops={"title": "gin_trgm_ops"}),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String)
@@ -38,6 +86,80 @@ class News(Base):
     source = Column(String)
     url = Column(String, unique=True)
     content_hash = Column(String, unique=True)
-    published_date = Column(DateTime)
+    published_date = Column(DateTime, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
-    is_analyzed = Column(Boolean, default=False) 
\ No newline at end of file
+    is_analyzed = Column(Boolean, default=False)
+    # 写入时由数据库维护的全文检索向量，只在检索条件中使用，查询对象时不加载
+    search_vector = deferred(Column(TSVECTOR, Computed(NEWS_SEARCH_EXPRESSION, persisted=True)))
+    # 摘要的 MinHash 签名，用于检测不同来源转载的同一篇稿件
+    minhash = Column(LargeBinary)
+    # 近似重复簇的标识（由簇中第一篇新闻的签名生成），转载的同一篇稿件属于同一簇
+    cluster_id = Column(BigInteger, index=True)
+
+# 标题的三元组索引依赖 pg_trgm 扩展，建表前确保已安装
+event.listen(
+    Base.metadata,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql")
+)
+
+class NewsTicker(Base):
+    """
+    新闻与股票的关联表（来自 Alpha Vantage 的 ticker_sentiment）
+    冗余保存发布时间，按股票查询最近新闻时只需扫描 (symbol, published_date) 索引
+    """
+    __tablename__ = "news_tickers"
+    __table_args__ = (
+        Index("ix_news_tickers_symbol_published_date", "symbol", "published_date"),
+    )
+
+    news_id = Column(Integer, ForeignKey("news.id", ondelete="CASCADE"), primary_key=True)
+    symbol = Column(String(32), primary_key=True)
+    relevance_score = Column(Float)
+    sentiment_score = Column(Float)
+    sentiment_label = Column(String)
+    published_date = Column(DateTime)
+
+# K线存储方式（PRICE_STORAGE 配置）对应的模型，两者的价格列同名
+PRICE_MODELS = {
+    "stock_data": StockData,
+    "price_bars": PriceBar
+}
+
+def get_price_model(storage: str):
+    """根据存储方式返回K线模型"""
+    if storage not in PRICE_MODELS:
+        raise ValueError(f"未知的K线存储方式: {storage}")
+    return PRICE_MODELS[storage]
+
+def price_filters(model, symbol: str, start: datetime = None, end: datetime = None, interval: str = "1d") -> list:
+    """构造按股票和日期范围查询K线的条件，日期条件让分区表只扫描涉及的分区"""
+    conditions = [model.symbol == symbol]
+    if model is PriceBar:
+        conditions.append(PriceBar.interval == interval)
+    if start is not None:
+        conditions.append(model.date >= start)
+    if end is not None:
+        conditions.append(model.date <= end)
+    return conditions
+
+def panel_filters(model, symbols=None, start: datetime = None, end: datetime = None, interval: str = "1d") -> list:
+    """构造一次查询多只股票K线的条件，symbols 为空时查询全部股票"""
+    conditions = []
+    if symbols:
+        conditions.append(model.symbol.in_(list(symbols)))
+    if model is PriceBar:
+        conditions.append(PriceBar.interval == interval)
+    if start is not None:
+        conditions.append(model.date >= start)
+    if end is not None:
+        conditions.append(model.date <= end)
+    return conditions
+
+def ensure_price_bar_partitions(conn, years) -> None:
+    """按年份创建 price_bars 的分区（已存在则跳过），不设默认分区以便随时补建新的年份"""
+    for year in sorted(set(years)):
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS price_bars_{year} PARTITION OF price_bars "
+            f"FOR VALUES FROM ('{year}-01-01') TO ('{year + 1}-01-01')"
+        ))
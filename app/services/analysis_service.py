@@ -0,0 +1,369 @@
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional, Tuple
+import logging
+import math
+import numpy as np
+import pandas as pd
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from app.models.analysis import StockAnalysis, IndicatorState
+from app.services.price_repository import PriceRepository
+from app.services import indicators
+from app.services.indicators import IncrementalIndicators
+
+logger = logging.getLogger(__name__)
+
+# 写入 StockAnalysis 的技术指标字段
+INDICATOR_FIELDS = [
+    "ma_5", "ma_10", "ma_20", "rsi_14",
+    "macd", "macd_signal", "macd_hist",
+    "bollinger_upper", "bollinger_middle", "bollinger_lower",
+    "volatility", "atr", "trend_strength"
+]
+
+# 预计算状态基于完整历史；窗口短于该天数时按窗口计算的指标还没有完成预热（MACD需要 慢线+信号线 根K线），
+# 与完整历史的结果不同，此时不使用预计算状态（按交易日折算为自然日并留出节假日余量）
+PRECOMPUTED_MIN_DAYS = (indicators.MACD_SLOW + indicators.MACD_SIGNAL) * 7 // 5 + 10
+
+
+def _to_float(value: Any) -> Optional[float]:
+    """转换为可JSON序列化的float，NaN/inf返回None"""
+    if value is None:
+        return None
+    value = float(value)
+    return value if np.isfinite(value) else None
+
+
+class AnalysisService:
+    def __init__(self):
+        self.anomaly_threshold = 3.0
+
+    def _to_arrays(self, df: pd.DataFrame) -> Dict[str, np.ndarray]:
+        """按日期排序并提取连续的OHLCV数组"""
+        if "date" in df.columns:
+            df = df.sort_values("date")
+        else:
+            df = df.sort_index()
+        close = indicators.as_float_array(df["close"].to_numpy())
+        return {
+            "high": indicators.as_float_array(df["high"].to_numpy()) if "high" in df.columns else close,
+            "low": indicators.as_float_array(df["low"].to_numpy()) if "low" in df.columns else close,
+            "close": close
+        }
+
+    def latest_indicators(self, series: Dict[str, np.ndarray]) -> Dict[str, Optional[float]]:
+        """取指标序列的最新值"""
+        return {field: _to_float(series[field][-1]) for field in INDICATOR_FIELDS}
+
+    def analyze_technical_indicators(self, df: pd.DataFrame) -> Dict[str, Optional[float]]:
+        """计算最新一根K线上的技术指标"""
+        arrays = self._to_arrays(df)
+        if len(arrays["close"]) == 0:
+            return {field: None for field in INDICATOR_FIELDS}
+        series = indicators.compute_indicators(arrays["high"], arrays["low"], arrays["close"])
+        return self.latest_indicators(series)
+
+    def analyze_stock_data(self, df: pd.DataFrame) -> Dict[str, Any]:
+        """分析股票数据，返回技术指标、趋势、支撑阻力位和综合评估"""
+        arrays = self._to_arrays(df)
+        if len(arrays["close"]) == 0:
+            raise ValueError("没有可分析的股票数据")
+
+        series = indicators.compute_indicators(arrays["high"], arrays["low"], arrays["close"])
+        latest = self.latest_indicators(series)
+        latest["close"] = _to_float(arrays["close"][-1])
+        latest["support"] = _to_float(series["support"][-1])
+        latest["resistance"] = _to_float(series["resistance"][-1])
+        return self.build_analysis(latest)
+
+    def build_analysis(self, latest: Dict[str, Optional[float]]) -> Dict[str, Any]:
+        """根据最新指标值生成趋势判断、评分和交易建议"""
+        close = latest.get("close")
+        ma_5 = latest.get("ma_5")
+        ma_20 = latest.get("ma_20")
+
+        if close is not None and ma_5 is not None and ma_20 is not None:
+            trend = str(indicators.classify_trend(np.array(close), np.array(ma_5), np.array(ma_20)))
+        else:
+            trend = "震荡"
+
+        support_levels = sorted({
+            level for level in (latest.get("support"), latest.get("bollinger_lower")) if level is not None
+        })
+        resistance_levels = sorted({
+            level for level in (latest.get("bollinger_upper"), latest.get("resistance")) if level is not None
+        })
+
+        technical_score = self._technical_score(latest, trend)
+        risk_level = self._risk_level(latest.get("volatility"))
+        if technical_score >= 65:
+            trading_suggestion = "买入"
+        elif technical_score <= 35:
+            trading_suggestion = "卖出"
+        else:
+            trading_suggestion = "持有"
+
+        result = {field: latest.get(field) for field in INDICATOR_FIELDS}
+        result.update({
+            "close": close,
+            "trend": trend,
+            "support_levels": support_levels,
+            "resistance_levels": resistance_levels,
+            "technical_score": technical_score,
+            "risk_level": risk_level,
+            "trading_suggestion": trading_suggestion,
+            "analysis_summary": (
+                f"趋势{trend}，RSI {self._fmt(latest.get('rsi_14'))}，"
+                f"MACD柱 {self._fmt(latest.get('macd_hist'))}，"
+                f"年化波动率 {self._fmt(latest.get('volatility'))}，"
+                f"技术评分 {technical_score:.0f}，风险{risk_level}，建议{trading_suggestion}"
+            )
+        })
+        return result
+
+    @staticmethod
+    def _fmt(value: Optional[float]) -> str:
+        return "N/A" if value is None else f"{value:.2f}"
+
+    @staticmethod
+    def _technical_score(latest: Dict[str, Optional[float]], trend: str) -> float:
+        """技术面评分（0-100）"""
+        score = 50.0
+        if trend == "上升":
+            score += 15
+        elif trend == "下降":
+            score -= 15
+
+        rsi = latest.get("rsi_14")
+        if rsi is not None:
+            if rsi < 30:
+                score += 10
+            elif rsi > 70:
+                score -= 10
+
+        macd_hist = latest.get("macd_hist")
+        if macd_hist is not None:
+            score += 10 if macd_hist > 0 else -10
+
+        close = latest.get("close")
+        upper = latest.get("bollinger_upper")
+        lower = latest.get("bollinger_lower")
+        if close is not None and upper is not None and lower is not None:
+            if close > upper:
+                score -= 5
+            elif close < lower:
+                score += 5
+
+        return float(min(max(score, 0.0), 100.0))
+
+    @staticmethod
+    def _risk_level(volatility: Optional[float]) -> str:
+        """根据年化波动率划分风险等级"""
+        if volatility is None:
+            return "未知"
+        if volatility < 0.2:
+            return "低"
+        if volatility < 0.4:
+            return "中"
+        return "高"
+
+    def calculate_volatility(self, prices: pd.Series, window: int = indicators.VOLATILITY_WINDOW) -> pd.Series:
+        """计算滚动年化波动率"""
+        close = indicators.as_float_array(prices.to_numpy())
+        volatility = np.full_like(close, np.nan)
+        if len(close) > window:
+            with np.errstate(divide="ignore", invalid="ignore"):
+                log_returns = np.diff(np.log(close))
+            volatility[1:] = indicators.rolling_std(log_returns, window, ddof=1) * np.sqrt(indicators.TRADING_DAYS)
+        return pd.Series(volatility, index=prices.index).dropna()
+
+    def detect_anomalies(self, df: pd.DataFrame, threshold: Optional[float] = None) -> pd.DataFrame:
+        """
+        检测异常值：任一列的变化率Z分数超过阈值即视为异常
+        :param df: 待检测数据（如 close、volume 列）
+        :param threshold: Z分数阈值
+        :return: 异常行
+        """
+        threshold = self.anomaly_threshold if threshold is None else threshold
+        if len(df) < 3:
+            return df.iloc[0:0]
+
+        values = indicators.as_float_array(df.to_numpy())
+        with np.errstate(divide="ignore", invalid="ignore"):
+            changes = np.diff(values, axis=0) / values[:-1]
+        changes[~np.isfinite(changes)] = np.nan
+        mean = np.nanmean(changes, axis=0)
+        std = np.nanstd(changes, axis=0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            z_scores = np.abs((changes - mean) / std)
+        mask = np.zeros(len(df), dtype=bool)
+        mask[1:] = np.nan_to_num(z_scores, nan=0.0).max(axis=1) > threshold
+        return df[mask]
+
+    @staticmethod
+    def _analysis_record(symbol: str, results: Dict[str, Any]) -> Dict[str, Any]:
+        """把分析结果转换为 StockAnalysis 表的字段"""
+        return dict(
+            symbol=symbol,
+            support_levels=results.get("support_levels"),
+            resistance_levels=results.get("resistance_levels"),
+            trend=results.get("trend"),
+            technical_score=results.get("technical_score"),
+            risk_level=results.get("risk_level"),
+            trading_suggestion=results.get("trading_suggestion"),
+            analysis_summary=results.get("analysis_summary"),
+            **{field: results.get(field) for field in INDICATOR_FIELDS}
+        )
+
+    def save_analysis_batch(self, db: Session, items: List[Tuple[str, Dict[str, Any]]]) -> int:
+        """
+        一条批量INSERT保存多只股票的分析结果
+        :param items: (股票代码, 分析结果) 列表
+        :return: 写入的记录数，失败时为0
+        """
+        if not items:
+            return 0
+        try:
+            db.execute(insert(StockAnalysis), [self._analysis_record(symbol, results) for symbol, results in items])
+            db.commit()
+            return len(items)
+        except Exception as e:
+            logger.error(f"批量保存分析结果时出错: {str(e)}")
+            db.rollback()
+            return 0
+
+    def save_analysis_results(self, db: Session, symbol: str, results: Dict[str, Any]) -> Optional[StockAnalysis]:
+        """保存分析结果到数据库"""
+        try:
+            analysis = StockAnalysis(**self._analysis_record(symbol, results))
+            db.add(analysis)
+            db.commit()
+            db.refresh(analysis)
+            return analysis
+        except Exception as e:
+            logger.error(f"保存分析结果时出错: {str(e)}")
+            db.rollback()
+            return None
+
+    @staticmethod
+    def records_to_bars(records: List[Dict[str, Any]]) -> pd.DataFrame:
+        """
+        把已写入数据库的价格记录转换为 update_indicator_state 使用的K线
+        只使用校验后实际保存的记录，避免价格缺失的行污染增量状态；同一日期重复时保留第一条（与写入逻辑一致）
+        :param records: 包含 date/high_price/low_price/close_price 的记录
+        :return: 以日期为索引、包含 high/low/close 列的K线
+        """
+        bars = pd.DataFrame.from_records(
+            records, columns=["date", "high_price", "low_price", "close_price"]
+        ).rename(columns={"high_price": "high", "low_price": "low", "close_price": "close"})
+        bars = bars.drop_duplicates(subset="date", keep="first").set_index("date")
+        bars.index = pd.DatetimeIndex(bars.index)
+        return bars.sort_index()
+
+    @staticmethod
+    def _naive_index(bars: pd.DataFrame) -> pd.DataFrame:
+        """去掉时区信息，与数据库中的无时区日期保持一致"""
+        if isinstance(bars.index, pd.DatetimeIndex) and bars.index.tz is not None:
+            bars = bars.copy()
+            bars.index = bars.index.tz_localize(None)
+        return bars.sort_index()
+
+    def _bootstrap_state(self, db: Session, symbol: str):
+        """
+        从数据库中的完整历史初始化指标状态
+        不读本地列式存储：爬虫同步存储和推进状态的顺序不影响结果，避免用不完整的文件初始化
+        """
+        bars = PriceRepository(db).load_arrays(symbol, columns=["high", "low", "close"], use_store=False)
+        if bars is None:
+            return None, None
+        state = IncrementalIndicators.from_arrays(bars["high"], bars["low"], bars["close"])
+        return state, pd.Timestamp(bars["date"][-1]).to_pydatetime()
+
+    @staticmethod
+    def _history_changed(db: Session, symbol: str, state: IncrementalIndicators, last_date: datetime, bars: pd.DataFrame) -> bool:
+        """
+        判断 last_date 及之前的K线（当天K线盘中更新、历史数据修正）是否与状态中记住的值不同
+        状态只保存最近 WINDOW 根K线的价格，更早的K线无法核对，出现时按已变化处理
+        """
+        earlier = bars[bars.index <= last_date]
+        if earlier.empty:
+            return False
+        dates = PriceRepository(db).recent_dates(symbol, last_date, len(state.closes))
+        positions = {pd.Timestamp(date): -(offset + 1) for offset, date in enumerate(dates)}
+        for date, values in zip(earlier.index, earlier[["high", "low", "close"]].to_numpy()):
+            position = positions.get(pd.Timestamp(date))
+            if position is None:
+                return True
+            remembered = (state.highs[position], state.lows[position], state.closes[position])
+            if not all(math.isclose(value, old, rel_tol=1e-9) for value, old in zip(values, remembered)):
+                return True
+        return False
+
+    def update_indicator_state(self, db: Session, symbol: str, bars: pd.DataFrame) -> Optional[IndicatorState]:
+        """
+        用新写入的K线推进股票的增量指标状态
+        首次调用时从完整历史初始化，之后只处理晚于 last_date 的K线；
+        last_date 及之前的K线有变化时（增量状态无法回退）从数据库重新初始化
+        :param db: 数据库会话
+        :param symbol: 股票代码
+        :param bars: 以日期为索引、包含 high/low/close 列的K线
+        :return: 更新后的状态记录
+        """
+        try:
+            record = db.query(IndicatorState).filter(IndicatorState.symbol == symbol).first()
+            state = None
+            if record is not None:
+                state = IncrementalIndicators.from_dict(record.state)
+                last_date = record.last_date
+                bars = self._naive_index(bars)
+                if last_date is not None:
+                    if self._history_changed(db, symbol, state, last_date, bars):
+                        logger.info(f"股票 {symbol} 的历史K线有变化，重新初始化指标状态")
+                        state = None
+                    else:
+                        bars = bars[bars.index > last_date]
+            if state is None:
+                # 数据库中已包含本次写入的K线，重新初始化后不需要再逐根推进
+                state, last_date = self._bootstrap_state(db, symbol)
+                if state is None:
+                    return None
+                if record is None:
+                    record = IndicatorState(symbol=symbol)
+                    db.add(record)
+            else:
+                for date, (high, low, close) in zip(bars.index, bars[["high", "low", "close"]].to_numpy()):
+                    state.update(high, low, close)
+                    last_date = date
+
+            record.state = state.to_dict()
+            record.latest = state.latest()
+            record.last_date = pd.Timestamp(last_date).to_pydatetime()
+            db.commit()
+            return record
+        except Exception as e:
+            logger.error(f"更新股票 {symbol} 的指标状态时出错: {str(e)}")
+            db.rollback()
+            return None
+
+    def get_precomputed_analysis(self, db: Session, symbol: str, days: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        读取增量维护的最新指标并生成分析结果
+        预计算状态基于完整历史，只有窗口足够让全部指标完成预热时才与按窗口计算的结果一致：
+        days 短于 PRECOMPUTED_MIN_DAYS，最新K线不在窗口内，或状态落后于数据库中最新的K线时返回None，由调用方按窗口计算
+        :param days: 请求的分析窗口（天），为空表示不限
+        :return: 分析结果，没有可用的状态时返回None
+        """
+        if days is not None and days < PRECOMPUTED_MIN_DAYS:
+            return None
+        record = db.query(IndicatorState).filter(IndicatorState.symbol == symbol).first()
+        if record is None or not record.latest:
+            return None
+        if days is not None and record.last_date is not None and record.last_date < datetime.now() - timedelta(days=days):
+            return None
+        # 有写入路径没有推进状态时，不能用旧指标顶替新K线的分析结果
+        latest_bar = PriceRepository(db).latest_date(symbol)
+        if latest_bar is not None and (record.last_date is None or record.last_date < latest_bar):
+            return None
+        result = self.build_analysis(record.latest)
+        result["as_of"] = record.last_date
+        return result
@@ -0,0 +1,364 @@
+"""
+向量化技术指标引擎
+
+所有函数都作用在连续的 float64 数组上，沿最后一个轴（时间轴）计算，
+因此既可以处理单只股票的一维序列，也可以处理 (股票 × 日期) 的二维矩阵。
+"""
+from typing import Any, Dict, List, Optional
+import numpy as np
+
+# 与 StockAnalysis 表字段一一对应的指标周期
+MA_WINDOWS = (5, 10, 20)
+RSI_PERIOD = 14
+MACD_FAST = 12
+MACD_SLOW = 26
+MACD_SIGNAL = 9
+BOLLINGER_WINDOW = 20
+BOLLINGER_K = 2.0
+ATR_PERIOD = 14
+VOLATILITY_WINDOW = 20
+TRADING_DAYS = 252
+
+# EMA 分块计算时 decay**-k 的上限，控制浮点误差
+_EMA_BLOCK_GROWTH = 1e6
+
+
+def as_float_array(values) -> np.ndarray:
+    """转换为连续的 float64 数组"""
+    return np.ascontiguousarray(values, dtype=np.float64)
+
+
+def _shift(x: np.ndarray, fill: float = np.nan) -> np.ndarray:
+    """沿时间轴向后平移一位"""
+    out = np.empty_like(x)
+    out[..., 0] = fill
+    out[..., 1:] = x[..., :-1]
+    return out
+
+
+def rolling_sum(x: np.ndarray, window: int) -> np.ndarray:
+    """滚动求和（基于累加和），前 window-1 个值为 NaN"""
+    out = np.full_like(x, np.nan)
+    n = x.shape[-1]
+    if n < window:
+        return out
+    csum = np.cumsum(x, axis=-1)
+    out[..., window - 1] = csum[..., window - 1]
+    out[..., window:] = csum[..., window:] - csum[..., :-window]
+    return out
+
+
+def rolling_mean(x: np.ndarray, window: int) -> np.ndarray:
+    """简单移动平均"""
+    return rolling_sum(x, window) / window
+
+
+def rolling_std(x: np.ndarray, window: int, ddof: int = 0) -> np.ndarray:
+    """滚动标准差，先减去首个值以降低累加和的数值误差"""
+    ref = x[..., :1]
+    centered = x - ref
+    s1 = rolling_sum(centered, window)
+    s2 = rolling_sum(centered * centered, window)
+    var = (s2 - s1 * s1 / window) / (window - ddof)
+    return np.sqrt(np.maximum(var, 0.0))
+
+
+def rolling_max(x: np.ndarray, window: int) -> np.ndarray:
+    """滚动最大值"""
+    out = np.full_like(x, np.nan)
+    if x.shape[-1] < window:
+        return out
+    view = np.lib.stride_tricks.sliding_window_view(x, window, axis=-1)
+    out[..., window - 1:] = view.max(axis=-1)
+    return out
+
+
+def rolling_min(x: np.ndarray, window: int) -> np.ndarray:
+    """滚动最小值"""
+    out = np.full_like(x, np.nan)
+    if x.shape[-1] < window:
+        return out
+    view = np.lib.stride_tricks.sliding_window_view(x, window, axis=-1)
+    out[..., window - 1:] = view.min(axis=-1)
+    return out
+
+
+def ema(x: np.ndarray, alpha: float, seed: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    指数移动平均（等价于 pandas ewm(adjust=False)）
+    递推 y[t] = (1-alpha)*y[t-1] + alpha*x[t] 按块展开成累加和，
+    每块长度保证 decay**-k 不超过 _EMA_BLOCK_GROWTH，循环次数为 n/块长而不是 n。
+    :param x: 输入序列
+    :param alpha: 平滑系数
+    :param seed: 初始状态 y[-1]，默认取首个观测值（即 y[0] = x[0]）
+    """
+    out = np.empty_like(x)
+    n = x.shape[-1]
+    if n == 0:
+        return out
+
+    decay = 1.0 - alpha
+    prev = np.array(x[..., 0] if seed is None else seed, dtype=np.float64)
+    if decay <= 0.0:
+        return x.copy()
+
+    block = max(1, int(np.log(_EMA_BLOCK_GROWTH) / -np.log(decay)))
+    steps = np.arange(min(block, n), dtype=np.float64)
+    powers = decay ** steps
+    inv_powers = decay ** -steps
+
+    for start in range(0, n, block):
+        seg = x[..., start:start + block]
+        k = seg.shape[-1]
+        acc = np.cumsum(seg * inv_powers[:k], axis=-1) * (alpha * powers[:k])
+        out[..., start:start + k] = acc + (decay * powers[:k]) * prev[..., None]
+        prev = out[..., start + k - 1]
+    return out
+
+
+def true_range(high: np.ndarray, low: np.ndarray, close: np.ndarray) -> np.ndarray:
+    """真实波幅，首日取 high-low"""
+    prev_close = _shift(close)
+    prev_close[..., 0] = close[..., 0]
+    return np.maximum.reduce([
+        high - low,
+        np.abs(high - prev_close),
+        np.abs(low - prev_close)
+    ])
+
+
+def compute_indicators(
+    high: np.ndarray,
+    low: np.ndarray,
+    close: np.ndarray
+) -> Dict[str, np.ndarray]:
+    """
+    一次性计算 StockAnalysis 所需的全部技术指标
+    :param high: 最高价
+    :param low: 最低价
+    :param close: 收盘价
+    :return: 指标名 -> 与输入同形状的数组，预热期内为 NaN
+    """
+    high = as_float_array(high)
+    low = as_float_array(low)
+    close = as_float_array(close)
+    n = close.shape[-1]
+
+    result: Dict[str, np.ndarray] = {}
+
+    # 移动平均
+    for window in MA_WINDOWS:
+        result[f"ma_{window}"] = rolling_mean(close, window)
+
+    # RSI（Wilder 平滑）
+    delta = np.diff(close, axis=-1)
+    gain = np.maximum(delta, 0.0)
+    loss = np.maximum(-delta, 0.0)
+    rsi = np.full_like(close, np.nan)
+    if n > 1:
+        avg_gain = ema(gain, 1.0 / RSI_PERIOD)
+        avg_loss = ema(loss, 1.0 / RSI_PERIOD)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rs = avg_gain / avg_loss
+            rsi[..., 1:] = np.where(avg_loss == 0.0, 100.0, 100.0 - 100.0 / (1.0 + rs))
+        rsi[..., :RSI_PERIOD] = np.nan
+    result["rsi_14"] = rsi
+
+    # MACD
+    macd = ema(close, 2.0 / (MACD_FAST + 1)) - ema(close, 2.0 / (MACD_SLOW + 1))
+    macd_signal = ema(macd, 2.0 / (MACD_SIGNAL + 1))
+    result["macd"] = macd
+    result["macd_signal"] = macd_signal
+    result["macd_hist"] = macd - macd_signal
+
+    # 布林带
+    middle = rolling_mean(close, BOLLINGER_WINDOW)
+    band = BOLLINGER_K * rolling_std(close, BOLLINGER_WINDOW)
+    result["bollinger_upper"] = middle + band
+    result["bollinger_middle"] = middle
+    result["bollinger_lower"] = middle - band
+
+    # ATR（Wilder 平滑）
+    atr = ema(true_range(high, low, close), 1.0 / ATR_PERIOD)
+    atr[..., :ATR_PERIOD - 1] = np.nan
+    result["atr"] = atr
+
+    # 年化波动率（对数收益率的滚动标准差）
+    volatility = np.full_like(close, np.nan)
+    if n > 1:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            log_returns = np.diff(np.log(close), axis=-1)
+        volatility[..., 1:] = rolling_std(log_returns, VOLATILITY_WINDOW, ddof=1) * np.sqrt(TRADING_DAYS)
+    result["volatility"] = volatility
+
+    # 趋势强度：短期均线与长期均线的相对距离
+    with np.errstate(divide="ignore", invalid="ignore"):
+        result["trend_strength"] = np.abs(result["ma_5"] - result["ma_20"]) / result["ma_20"]
+
+    # 支撑/阻力参考位
+    result["support"] = rolling_min(low, BOLLINGER_WINDOW)
+    result["resistance"] = rolling_max(high, BOLLINGER_WINDOW)
+
+    return result
+
+
+def classify_trend(close: np.ndarray, ma_short: np.ndarray, ma_long: np.ndarray) -> np.ndarray:
+    """根据价格与均线排列判断趋势（上升/下降/震荡）"""
+    return np.select(
+        [(close > ma_short) & (ma_short > ma_long), (close < ma_short) & (ma_short < ma_long)],
+        ["上升", "下降"],
+        default="震荡"
+    )
+
+
+class IncrementalIndicators:
+    """
+    可持久化的增量指标状态
+    保存 EMA 累加器（MACD）、Wilder 平均（RSI/ATR）和最近窗口内的价格，
+    每来一根新K线只需 O(1) 的计算即可推进，结果与 compute_indicators 一致。
+    """
+
+    WINDOW = max(max(MA_WINDOWS), BOLLINGER_WINDOW, VOLATILITY_WINDOW)
+
+    def __init__(self):
+        self.count = 0
+        self.last_close: Optional[float] = None
+        self.ema_fast: Optional[float] = None
+        self.ema_slow: Optional[float] = None
+        self.macd_signal: Optional[float] = None
+        self.avg_gain: Optional[float] = None
+        self.avg_loss: Optional[float] = None
+        self.atr: Optional[float] = None
+        self.closes: List[float] = []
+        self.highs: List[float] = []
+        self.lows: List[float] = []
+        self.log_returns: List[float] = []
+
+    @classmethod
+    def from_arrays(cls, high, low, close) -> "IncrementalIndicators":
+        """用完整历史一次性初始化状态（向量化计算）"""
+        high = as_float_array(high)
+        low = as_float_array(low)
+        close = as_float_array(close)
+        state = cls()
+        n = len(close)
+        if n == 0:
+            return state
+
+        ema_fast = ema(close, 2.0 / (MACD_FAST + 1))
+        ema_slow = ema(close, 2.0 / (MACD_SLOW + 1))
+        state.count = n
+        state.last_close = float(close[-1])
+        state.ema_fast = float(ema_fast[-1])
+        state.ema_slow = float(ema_slow[-1])
+        state.macd_signal = float(ema(ema_fast - ema_slow, 2.0 / (MACD_SIGNAL + 1))[-1])
+        state.atr = float(ema(true_range(high, low, close), 1.0 / ATR_PERIOD)[-1])
+        if n > 1:
+            delta = np.diff(close)
+            state.avg_gain = float(ema(np.maximum(delta, 0.0), 1.0 / RSI_PERIOD)[-1])
+            state.avg_loss = float(ema(np.maximum(-delta, 0.0), 1.0 / RSI_PERIOD)[-1])
+            with np.errstate(divide="ignore", invalid="ignore"):
+                state.log_returns = np.diff(np.log(close[-(cls.WINDOW + 1):])).tolist()
+
+        state.closes = close[-cls.WINDOW:].tolist()
+        state.highs = high[-cls.WINDOW:].tolist()
+        state.lows = low[-cls.WINDOW:].tolist()
+        return state
+
+    @staticmethod
+    def _blend(prev: Optional[float], value: float, alpha: float) -> float:
+        return value if prev is None else (1.0 - alpha) * prev + alpha * value
+
+    @staticmethod
+    def _push(window: List[float], value: float, size: int) -> None:
+        window.append(value)
+        if len(window) > size:
+            del window[0]
+
+    def update(self, high: float, low: float, close: float) -> Dict[str, Optional[float]]:
+        """推进一根K线并返回最新指标值"""
+        high, low, close = float(high), float(low), float(close)
+        prev_close = close if self.last_close is None else self.last_close
+
+        self.ema_fast = self._blend(self.ema_fast, close, 2.0 / (MACD_FAST + 1))
+        self.ema_slow = self._blend(self.ema_slow, close, 2.0 / (MACD_SLOW + 1))
+        self.macd_signal = self._blend(self.macd_signal, self.ema_fast - self.ema_slow, 2.0 / (MACD_SIGNAL + 1))
+
+        tr = max(high - low, abs(high - prev_close), abs(low - prev_close))
+        self.atr = self._blend(self.atr, tr, 1.0 / ATR_PERIOD)
+
+        if self.last_close is not None:
+            delta = close - prev_close
+            self.avg_gain = self._blend(self.avg_gain, max(delta, 0.0), 1.0 / RSI_PERIOD)
+            self.avg_loss = self._blend(self.avg_loss, max(-delta, 0.0), 1.0 / RSI_PERIOD)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                self._push(self.log_returns, float(np.log(close / prev_close)), self.WINDOW)
+
+        self._push(self.closes, close, self.WINDOW)
+        self._push(self.highs, high, self.WINDOW)
+        self._push(self.lows, low, self.WINDOW)
+        self.last_close = close
+        self.count += 1
+        return self.latest()
+
+    def latest(self) -> Dict[str, Optional[float]]:
+        """根据当前状态计算最新指标值，预热期内的指标为 None"""
+        closes = np.asarray(self.closes, dtype=np.float64)
+        result: Dict[str, Optional[float]] = {"close": self.last_close}
+
+        for window in MA_WINDOWS:
+            result[f"ma_{window}"] = float(closes[-window:].mean()) if len(closes) >= window else None
+
+        rsi = None
+        if self.count > RSI_PERIOD and self.avg_gain is not None:
+            rsi = 100.0 if self.avg_loss == 0.0 else 100.0 - 100.0 / (1.0 + self.avg_gain / self.avg_loss)
+        result["rsi_14"] = rsi
+
+        macd = None if self.ema_fast is None else self.ema_fast - self.ema_slow
+        result["macd"] = macd
+        result["macd_signal"] = self.macd_signal
+        result["macd_hist"] = None if macd is None else macd - self.macd_signal
+
+        if len(closes) >= BOLLINGER_WINDOW:
+            window = closes[-BOLLINGER_WINDOW:]
+            middle = float(window.mean())
+            band = BOLLINGER_K * float(window.std())
+            result["bollinger_upper"] = middle + band
+            result["bollinger_middle"] = middle
+            result["bollinger_lower"] = middle - band
+            result["support"] = float(min(self.lows[-BOLLINGER_WINDOW:]))
+            result["resistance"] = float(max(self.highs[-BOLLINGER_WINDOW:]))
+        else:
+            for key in ("bollinger_upper", "bollinger_middle", "bollinger_lower", "support", "resistance"):
+                result[key] = None
+
+        result["atr"] = self.atr if self.count >= ATR_PERIOD else None
+
+        returns = np.asarray(self.log_returns[-VOLATILITY_WINDOW:], dtype=np.float64)
+        if len(returns) >= VOLATILITY_WINDOW:
+            result["volatility"] = float(returns.std(ddof=1) * np.sqrt(TRADING_DAYS))
+        else:
+            result["volatility"] = None
+
+        if result["ma_5"] is not None and result["ma_20"]:
+            result["trend_strength"] = abs(result["ma_5"] - result["ma_20"]) / result["ma_20"]
+        else:
+            result["trend_strength"] = None
+
+        return {
+            key: (value if value is None or np.isfinite(value) else None)
+            for key, value in result.items()
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        """序列化为可存入JSON列的字典"""
+        return dict(self.__dict__)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "IncrementalIndicators":
+        """从JSON字典恢复状态"""
+        state = cls()
+        for key, value in data.items():
+            if hasattr(state, key):
+                setattr(state, key, list(value) if isinstance(value, list) else value)
+        return state
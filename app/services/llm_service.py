@@ -1,33 +1,234 @@
 from typing import List, Dict, Any, Optional
+import asyncio
+import hashlib
+import json
+import httpx
 import openai
 from app.core.config import settings
+from app.core.disk_cache import DiskCache
+from app.services.prompt_builder import NewsPromptBuilder
 import logging
 
 logger = logging.getLogger(__name__)
 
+_llm_cache: Optional[DiskCache] = None
+
+def get_llm_cache() -> Optional[DiskCache]:
+    """获取进程内共享的LLM响应缓存，未启用时返回None"""
+    global _llm_cache
+    if not settings.llm_cache_enabled:
+        return None
+    if _llm_cache is None:
+        _llm_cache = DiskCache(settings.llm_cache_path, settings.llm_cache_max_bytes)
+    return _llm_cache
+
+_async_client: Optional[openai.AsyncOpenAI] = None
+_semaphore: Optional[asyncio.Semaphore] = None
+
+def create_async_client() -> openai.AsyncOpenAI:
+    """创建带独立连接池的异步OpenAI客户端"""
+    return openai.AsyncOpenAI(
+        api_key=settings.openai_api_key,
+        http_client=httpx.AsyncClient(
+            timeout=settings.llm_timeout,
+            limits=httpx.Limits(
+                max_connections=settings.llm_max_concurrency,
+                max_keepalive_connections=settings.llm_max_concurrency
+            )
+        )
+    )
+
+def get_async_client() -> openai.AsyncOpenAI:
+    """获取进程内共享连接池的异步OpenAI客户端"""
+    global _async_client
+    if _async_client is None:
+        _async_client = create_async_client()
+    return _async_client
+
+def create_llm_semaphore() -> asyncio.Semaphore:
+    """创建限制同时进行的LLM请求数的信号量"""
+    return asyncio.Semaphore(settings.llm_max_concurrency)
+
+def get_llm_semaphore() -> asyncio.Semaphore:
+    """获取进程内共享的LLM并发限制"""
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = create_llm_semaphore()
+    return _semaphore
+
+def parse_json_object(content: str) -> Optional[Dict[str, Any]]:
+    """从模型回复中解析JSON对象（兼容代码块包裹和前后的说明文字）"""
+    if not content:
+        return None
+    start, end = content.find("{"), content.rfind("}")
+    if start < 0 or end <= start:
+        return None
+    try:
+        data = json.loads(content[start:end + 1])
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+# 只描述调用过程的字段：每次调用都可能不同，写进下游提示词会让LLM缓存失效，也会把无关信息泄露给模型
+PROMPT_METADATA_KEYS = frozenset({
+    "tokens_used", "cached", "news_used", "chunks", "model",
+    "precomputed", "analysis_date", "batches", "report_id"
+})
+
+def prompt_data(data: Any) -> Any:
+    """去掉分析结果中的调用元数据，得到可写入下游提示词的内容"""
+    if isinstance(data, dict):
+        return {key: prompt_data(value) for key, value in data.items() if key not in PROMPT_METADATA_KEYS}
+    if isinstance(data, list):
+        return [prompt_data(item) for item in data]
+    return data
+
 class LLMService:
-    def __init__(self):
-        self.client = openai.OpenAI(api_key=settings.openai_api_key)
+    def __init__(
+        self,
+        client: Optional[openai.AsyncOpenAI] = None,
+        semaphore: Optional[asyncio.Semaphore] = None
+    ):
+        """
+        :param client: 异步客户端，默认使用进程内共享的客户端
+        :param semaphore: 并发限制，默认使用进程内共享的信号量
+        （在单独的事件循环中使用时，例如Celery任务里的 asyncio.run，需要传入该循环内创建的客户端和信号量）
+        """
+        self.client = client or get_async_client()
+        self.semaphore = semaphore or get_llm_semaphore()
         self.model = settings.openai_model
+        self.cache = get_llm_cache()
+        self.cache_stats = {"hits": 0, "misses": 0, "tokens_saved": 0}
+        self.news_prompt_builder = NewsPromptBuilder(
+            self.model,
+            token_budget=settings.llm_news_token_budget,
+            article_max_tokens=settings.llm_news_article_max_tokens,
+            max_chunks=settings.llm_news_max_chunks,
+            half_life_hours=settings.llm_news_half_life_hours
+        )
+
+    def _cache_key(
+        self,
+        system_prompt: str,
+        user_content: str,
+        temperature: float,
+        max_tokens: Optional[int]
+    ) -> str:
+        """按 (模型, 系统提示词, 用户内容, 温度, 最大token数) 的哈希生成缓存键"""
+        raw = json.dumps(
+            [self.model, system_prompt, user_content, temperature, max_tokens],
+            ensure_ascii=False
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def _chat(
+        self,
+        system_prompt: str,
+        user_content: str,
+        temperature: float,
+        max_tokens: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        调用聊天接口，相同请求直接返回缓存的结果而不访问网络
+        :return: {"content", "tokens_used", "cached"}，命中缓存时 tokens_used 为0
+        """
+        key = self._cache_key(system_prompt, user_content, temperature, max_tokens)
+        if self.cache is not None:
+            entry = self.cache.get(key)
+            if entry is not None and entry.is_fresh:
+                tokens = entry.meta.get("tokens", 0)
+                self.cache_stats["hits"] += 1
+                self.cache_stats["tokens_saved"] += tokens
+                logger.debug(f"LLM缓存命中，节省 {tokens} 个token（累计 {self.cache_stats['tokens_saved']}）")
+                return {"content": entry.value.decode("utf-8"), "tokens_used": 0, "cached": True}
+
+        params = {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_content}
+            ],
+            "temperature": temperature
+        }
+        if max_tokens is not None:
+            params["max_tokens"] = max_tokens
+        async with self.semaphore:
+            response = await self.client.chat.completions.create(**params)
+        content = response.choices[0].message.content
+        tokens = response.usage.total_tokens
+
+        self.cache_stats["misses"] += 1
+        if self.cache is not None and content:
+            self.cache.set(
+                key,
+                content.encode("utf-8"),
+                {"model": self.model, "tokens": tokens},
+                settings.llm_cache_ttl
+            )
+        return {"content": content, "tokens_used": tokens, "cached": False}
 
     async def analyze_text(self, text: str, system_prompt: str) -> str:
         """使用OpenAI API分析文本"""
         try:
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": text}
-                ],
-                temperature=0.7,
-                max_tokens=1000
-            )
-            return response.choices[0].message.content
+            result = await self._chat(system_prompt, text, temperature=0.7, max_tokens=1000)
+            return result["content"]
             
         except Exception as e:
             logger.error(f"文本分析失败: {str(e)}")
             return ""
 
+    async def _news_content(self, news_list: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        按token预算准备提示词中的新闻内容
+        装得下时直接拼接得分最高的新闻；否则每组新闻并发生成摘要（map），以各组摘要作为内容（reduce）
+        :return: {"content", "tokens_used", "cached", "news_used", "chunks"}，tokens_used 为摘要阶段的消耗
+        """
+        chunks = self.news_prompt_builder.pack(news_list)
+        news_used = sum(len(chunk) for chunk in chunks)
+        if len(chunks) <= 1:
+            return {
+                "content": "\n\n".join(chunks[0] if chunks else []),
+                "tokens_used": 0,
+                "cached": True,
+                "news_used": news_used,
+                "chunks": len(chunks)
+            }
+
+        prompt = """请总结以下新闻的关键信息，包括公司基本面变化、市场情绪、重大事件和风险因素，
+保留重要的日期和数字，不超过300字：
+
+{news_content}
+"""
+        results = await asyncio.gather(*[
+            self._chat(
+                "你是一个专业的金融分析师，擅长提炼新闻要点。",
+                prompt.format(news_content="\n\n".join(chunk)),
+                temperature=0.2,
+                max_tokens=settings.llm_news_summary_max_tokens
+            )
+            for chunk in chunks
+        ], return_exceptions=True)
+
+        summaries = []
+        for index, (chunk, result) in enumerate(zip(chunks, results), start=1):
+            if isinstance(result, Exception):
+                logger.error(f"第 {index} 组新闻摘要失败: {str(result)}")
+                continue
+            summaries.append((len(chunk), result))
+        if not summaries:
+            raise results[0]
+
+        return {
+            "content": "\n\n".join(
+                f"第{index}组新闻摘要（{count}条新闻）：\n{result['content']}"
+                for index, (count, result) in enumerate(summaries, start=1)
+            ),
+            "tokens_used": sum(result["tokens_used"] for _, result in summaries),
+            "cached": all(result["cached"] for _, result in summaries),
+            "news_used": sum(count for count, _ in summaries),
+            "chunks": len(chunks)
+        }
+
     async def analyze_news(self, news_list: List[Dict[str, Any]]) -> Dict[str, Any]:
         """分析新闻内容，提取关键信息并生成摘要"""
         try:
@@ -49,29 +250,23 @@ class LLMService:
 {news_content}
 """
             
-            # 准备新闻内容
-            news_content = "\n\n".join([
-                f"标题：{news['title']}\n"
-                f"日期：{news['published_date']}\n"
-                f"来源：{news['source']}\n"
-                f"内容：{news['content']}\n"
-                for news in news_list
-            ])
+            # 按token预算准备新闻内容
+            news_content = await self._news_content(news_list)
             
             # 调用OpenAI API
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "你是一个专业的金融分析师，擅长分析新闻对股票市场的影响。"},
-                    {"role": "user", "content": prompt.format(news_content=news_content)}
-                ],
+            result = await self._chat(
+                "你是一个专业的金融分析师，擅长分析新闻对股票市场的影响。",
+                prompt.format(news_content=news_content["content"]),
                 temperature=0.3
             )
             
             return {
-                "analysis": response.choices[0].message.content,
+                "analysis": result["content"],
                 "model": self.model,
-                "tokens_used": response.usage.total_tokens
+                "tokens_used": result["tokens_used"] + news_content["tokens_used"],
+                "cached": result["cached"] and news_content["cached"],
+                "news_used": news_content["news_used"],
+                "chunks": news_content["chunks"]
             }
             
         except Exception as e:
@@ -101,19 +296,17 @@ class LLMService:
 """
             
             # 调用OpenAI API
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "你是一个专业的财务分析师，擅长解读财务报表并提供深入分析。"},
-                    {"role": "user", "content": prompt.format(report_data=str(report_data))}
-                ],
+            result = await self._chat(
+                "你是一个专业的财务分析师，擅长解读财务报表并提供深入分析。",
+                prompt.format(report_data=str(report_data)),
                 temperature=0.2
             )
             
             return {
-                "analysis": response.choices[0].message.content,
+                "analysis": result["content"],
                 "model": self.model,
-                "tokens_used": response.usage.total_tokens
+                "tokens_used": result["tokens_used"],
+                "cached": result["cached"]
             }
             
         except Exception as e:
@@ -129,9 +322,9 @@ class LLMService:
         """预测股票价格"""
         try:
             analysis_text = (
-                f"技术面数据:\n{technical_data}\n\n"
-                f"基本面数据:\n{fundamental_data}\n\n"
-                f"新闻分析:\n{news_analysis}"
+                f"技术面数据:\n{prompt_data(technical_data)}\n\n"
+                f"基本面数据:\n{prompt_data(fundamental_data)}\n\n"
+                f"新闻分析:\n{prompt_data(news_analysis)}"
             )
             
             system_prompt = """
@@ -143,19 +336,17 @@ class LLMService:
             请以JSON格式返回结果。
             """
             
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": analysis_text}
-                ],
+            result = await self._chat(
+                system_prompt,
+                analysis_text,
                 temperature=0.3
             )
             
             return {
-                "prediction": response.choices[0].message.content,
+                "prediction": result["content"],
                 "model": self.model,
-                "tokens_used": response.usage.total_tokens
+                "tokens_used": result["tokens_used"],
+                "cached": result["cached"]
             }
             
         except Exception as e:
@@ -180,21 +371,81 @@ class LLMService:
 """
             
             # 调用OpenAI API
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "你是一个资深的投资顾问，擅长分析不同观点并给出平衡的建议。"},
-                    {"role": "user", "content": prompt.format(analyses=str(analyses))}
-                ],
+            result = await self._chat(
+                "你是一个资深的投资顾问，擅长分析不同观点并给出平衡的建议。",
+                prompt.format(analyses=str(prompt_data(analyses))),
                 temperature=0.3
             )
             
             return {
-                "resolution": response.choices[0].message.content,
+                "resolution": result["content"],
                 "model": self.model,
-                "tokens_used": response.usage.total_tokens
+                "tokens_used": result["tokens_used"],
+                "cached": result["cached"]
             }
             
         except Exception as e:
             logger.error(f"冲突解决失败: {str(e)}")
-            return {"error": str(e)} 
\ No newline at end of file
+            return {"error": str(e)}
+
+    async def analyze_news_structured(self, news_list: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """分析新闻并返回结构化结果（用于写入 NewsAnalysis）"""
+        try:
+            prompt = """请分析以下新闻内容，只返回一个JSON对象，包含以下字段：
+- sentiment_label: 情感标签（积极/消极/中性）
+- sentiment_score: 情感得分（-1到1之间的数字）
+- topics: 主要话题列表
+- key_entities: 关键实体列表
+- market_impact: 可能对股价的影响
+- impact_score: 影响程度（0到1之间的数字）
+- news_summary: 关键要点总结
+- analysis: 完整的分析
+
+新闻内容：
+{news_content}
+"""
+            news_content = await self._news_content(news_list)
+            result = await self._chat(
+                "你是一个专业的金融分析师，擅长分析新闻对股票市场的影响。",
+                prompt.format(news_content=news_content["content"]),
+                temperature=0.2
+            )
+            data = parse_json_object(result["content"]) or {"analysis": result["content"]}
+            data.update(model=self.model, tokens_used=result["tokens_used"] + news_content["tokens_used"])
+            return data
+
+        except Exception as e:
+            logger.error(f"新闻结构化分析失败: {str(e)}")
+            return {"error": str(e)}
+
+    async def analyze_financial_report_structured(self, report_data: Dict[str, Any]) -> Dict[str, Any]:
+        """分析财务报表并返回结构化结果（用于写入 FinancialAnalysis）"""
+        try:
+            prompt = """请分析以下财务报表数据，只返回一个JSON对象，包含以下字段（无法得出的数值填null）：
+- revenue_growth: 收入增长率
+- profit_margin: 利润率
+- eps: 每股收益
+- pe_ratio: 市盈率
+- debt_ratio: 负债率
+- current_ratio: 流动比率
+- financial_health_score: 财务健康评分（0到1之间的数字）
+- risk_assessment: 风险评估
+- strength_factors: 优势因素列表
+- weakness_factors: 劣势因素列表
+- analysis: 完整的分析
+
+财务数据：
+{report_data}
+"""
+            result = await self._chat(
+                "你是一个专业的财务分析师，擅长解读财务报表并提供深入分析。",
+                prompt.format(report_data=str(report_data)),
+                temperature=0.2
+            )
+            data = parse_json_object(result["content"]) or {"analysis": result["content"]}
+            data.update(model=self.model, tokens_used=result["tokens_used"])
+            return data
+
+        except Exception as e:
+            logger.error(f"财务报表结构化分析失败: {str(e)}")
+            return {"error": str(e)}
\ No newline at end of file
@@ -0,0 +1,313 @@
+import logging
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional, Tuple
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.orm import Session
+from app.models.analysis import NewsAnalysis, FinancialAnalysis
+from app.models.crawler import News, NewsTicker, FinancialReport
+from app.services.llm_service import LLMService
+
+logger = logging.getLogger(__name__)
+
+# 结构化分析结果中写入 FinancialAnalysis 的数值字段
+FINANCIAL_NUMBER_FIELDS = [
+    "revenue_growth", "profit_margin", "eps", "pe_ratio",
+    "debt_ratio", "current_ratio", "financial_health_score"
+]
+
+
+def _to_float(value: Any) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_list(value: Any) -> Optional[List[Any]]:
+    if value is None:
+        return None
+    return value if isinstance(value, list) else [value]
+
+
+def _to_text(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    return value if isinstance(value, str) else str(value)
+
+
+class PrecomputedAnalysisService:
+    """
+    预先计算新闻和财务报表的LLM分析
+    后台任务批量分析未分析的新闻和新的财务报表并写入 NewsAnalysis / FinancialAnalysis，
+    接口直接读取这些结果，没有结果时才实时调用LLM
+    """
+
+    def __init__(self, news_batch_size: int = 20, report_batch_size: int = 20):
+        self.news_batch_size = news_batch_size
+        self.report_batch_size = report_batch_size
+
+    @staticmethod
+    def symbol_news_query(db: Session, symbol: str, since: Optional[datetime] = None):
+        """通过新闻与股票的关联表查询股票相关的新闻，走 (symbol, published_date) 索引"""
+        query = (
+            db.query(News)
+            .join(NewsTicker, NewsTicker.news_id == News.id)
+            .filter(NewsTicker.symbol == symbol.upper())
+        )
+        if since is not None:
+            query = query.filter(NewsTicker.published_date >= since)
+        return query
+
+    @classmethod
+    def news_for_symbol(cls, db: Session, symbol: str, since: Optional[datetime] = None, limit: Optional[int] = None):
+        """查询与股票相关的新闻，按发布时间倒序"""
+        query = cls.symbol_news_query(db, symbol, since).order_by(NewsTicker.published_date.desc())
+        return query.limit(limit).all() if limit else query.all()
+
+    @staticmethod
+    def _cluster_key(news: News) -> Any:
+        """近似重复簇的标识，未分簇的旧新闻各自成簇"""
+        return news.cluster_id if news.cluster_id is not None else ("id", news.id)
+
+    @classmethod
+    def group_clusters(cls, news_list: List[News]) -> Dict[Any, List[News]]:
+        """按近似重复簇分组，保持首次出现的顺序"""
+        clusters: Dict[Any, List[News]] = {}
+        for news in news_list:
+            clusters.setdefault(cls._cluster_key(news), []).append(news)
+        return clusters
+
+    @classmethod
+    def representatives(cls, news_list: List[News]) -> List[News]:
+        """每个近似重复簇只保留列表中第一次出现的一篇"""
+        return [members[0] for members in cls.group_clusters(news_list).values()]
+
+    @staticmethod
+    def relevance_scores(db: Session, symbol: str, news_list: List[News]) -> Dict[int, float]:
+        """读取新闻与股票的相关度，用于提示词中新闻的排序"""
+        if not news_list:
+            return {}
+        rows = db.execute(
+            select(NewsTicker.news_id, NewsTicker.relevance_score)
+            .where(NewsTicker.symbol == symbol.upper(), NewsTicker.news_id.in_([n.id for n in news_list]))
+        )
+        return {news_id: score for news_id, score in rows if score is not None}
+
+    @classmethod
+    def news_payload(cls, news_list: List[News], relevance: Optional[Dict[int, float]] = None) -> List[Dict[str, Any]]:
+        """
+        转换为 LLMService 需要的新闻格式，同一稿件的转载只保留一篇
+        :param relevance: 新闻id到相关度的映射（可选）
+        """
+        relevance = relevance or {}
+        return [{
+            'title': n.title,
+            'content': n.content,
+            'source': n.source,
+            'published_date': n.published_date,
+            'relevance': relevance.get(n.id)
+        } for n in cls.representatives(news_list)]
+
+    def load_symbol_news(
+        self,
+        db: Session,
+        symbol: str,
+        since: Optional[datetime] = None,
+        limit: Optional[int] = None
+    ) -> Tuple[int, List[Dict[str, Any]]]:
+        """
+        查询股票相关的新闻并转换为 LLMService 需要的格式（附带相关度）
+        :return: (新闻数量, 新闻列表)
+        """
+        news = self.news_for_symbol(db, symbol, since, limit)
+        return len(news), self.news_payload(news, self.relevance_scores(db, symbol, news))
+
+    @staticmethod
+    def report_payload(report: FinancialReport) -> Dict[str, Any]:
+        """转换为 LLMService 需要的报表格式"""
+        return {
+            'content': report.content,
+            'report_type': report.report_type,
+            'report_date': report.report_date
+        }
+
+    async def analyze_pending_news(self, db: Session, llm_service: LLMService, symbols: List[str]) -> int:
+        """
+        分析未分析的新闻，每只股票每批新闻写入一条 NewsAnalysis
+        一篇新闻可能与多只股票相关，全部股票处理完成后才标记为已分析
+        news_ids 包含同簇的全部转载，news_count 为实际送给LLM的新闻数
+        :return: 写入的分析记录数
+        """
+        analyzed_ids = set()
+        saved_count = 0
+        for symbol in symbols:
+            pending = (
+                self.symbol_news_query(db, symbol)
+                .filter(News.is_analyzed.isnot(True))
+                .order_by(NewsTicker.published_date.asc())
+                .all()
+            )
+            # 同一稿件的转载只分析一次；之前已经分析过的稿件，新到的转载直接标记为已分析
+            clusters = self.group_clusters(pending)
+            cluster_ids = [key for key in clusters if not isinstance(key, tuple)]
+            done = set()
+            if cluster_ids:
+                done = {row[0] for row in (
+                    self.symbol_news_query(db, symbol)
+                    .filter(News.is_analyzed.is_(True), News.cluster_id.in_(cluster_ids))
+                    .with_entities(News.cluster_id)
+                    .distinct()
+                )}
+            for key in done:
+                analyzed_ids.update(n.id for n in clusters.pop(key))
+
+            groups = list(clusters.values())
+            for start in range(0, len(groups), self.news_batch_size):
+                batch_groups = groups[start:start + self.news_batch_size]
+                batch = [members[0] for members in batch_groups]
+                result = await llm_service.analyze_news_structured(
+                    self.news_payload(batch, self.relevance_scores(db, symbol, batch))
+                )
+                if "error" in result:
+                    logger.error(f"分析股票 {symbol} 的新闻失败: {result['error']}")
+                    continue
+                db.add(NewsAnalysis(
+                    symbol=symbol,
+                    sentiment_score=_to_float(result.get("sentiment_score")),
+                    sentiment_label=_to_text(result.get("sentiment_label")),
+                    topics=_to_list(result.get("topics")),
+                    key_entities=_to_list(result.get("key_entities")),
+                    market_impact=_to_text(result.get("market_impact")),
+                    impact_score=_to_float(result.get("impact_score")),
+                    news_summary=_to_text(result.get("news_summary")),
+                    analysis_summary=_to_text(result.get("analysis")),
+                    news_ids=[n.id for members in batch_groups for n in members],
+                    news_count=len(batch),
+                    latest_published_date=max(
+                        (n.published_date for members in batch_groups for n in members if n.published_date),
+                        default=None
+                    ),
+                    model=result.get("model")
+                ))
+                db.commit()
+                analyzed_ids.update(n.id for members in batch_groups for n in members)
+                saved_count += 1
+
+        if analyzed_ids:
+            db.execute(update(News).where(News.id.in_(analyzed_ids)).values(is_analyzed=True))
+            db.commit()
+        logger.info(f"新闻分析完成：{len(analyzed_ids)} 条新闻，写入 {saved_count} 条分析记录")
+        return saved_count
+
+    async def analyze_pending_reports(self, db: Session, llm_service: LLMService) -> int:
+        """
+        分析未分析的财务报表，每份报表写入一条 FinancialAnalysis
+        按批次循环直到没有待分析的报表；本次运行中分析失败的报表不再重试，避免一直排在最前面挡住更早的报表
+        :return: 写入的分析记录数
+        """
+        saved_count = 0
+        failed_ids = set()
+        while True:
+            query = db.query(FinancialReport).filter(FinancialReport.is_analyzed.isnot(True))
+            if failed_ids:
+                query = query.filter(FinancialReport.id.notin_(failed_ids))
+            reports = (
+                query.order_by(FinancialReport.report_date.desc(), FinancialReport.id.desc())
+                .limit(self.report_batch_size)
+                .all()
+            )
+            if not reports:
+                break
+            for report in reports:
+                result = await llm_service.analyze_financial_report_structured(self.report_payload(report))
+                if "error" in result:
+                    logger.error(f"分析财务报表 {report.id} 失败: {result['error']}")
+                    failed_ids.add(report.id)
+                    continue
+                db.add(FinancialAnalysis(
+                    symbol=report.company_symbol,
+                    report_id=report.id,
+                    report_type=report.report_type,
+                    report_date=report.report_date,
+                    risk_assessment=_to_text(result.get("risk_assessment")),
+                    strength_factors=_to_list(result.get("strength_factors")),
+                    weakness_factors=_to_list(result.get("weakness_factors")),
+                    analysis_summary=_to_text(result.get("analysis")),
+                    model=result.get("model"),
+                    **{field: _to_float(result.get(field)) for field in FINANCIAL_NUMBER_FIELDS}
+                ))
+                report.is_analyzed = True
+                db.commit()
+                saved_count += 1
+        if failed_ids:
+            logger.warning(f"{len(failed_ids)} 份财务报表分析失败，将在下次任务中重试")
+        logger.info(f"财务报表分析完成：写入 {saved_count} 条分析记录")
+        return saved_count
+
+    @staticmethod
+    def _news_result(rows: List[NewsAnalysis]) -> Dict[str, Any]:
+        """合并多批新闻分析：情感得分按新闻数量加权，文字结论取最新一批"""
+        latest = rows[0]
+        total = sum(row.news_count or 0 for row in rows)
+        scored = [(row.sentiment_score, row.news_count or 0) for row in rows if row.sentiment_score is not None]
+        weight = sum(count for _, count in scored)
+        return {
+            "analysis": latest.analysis_summary,
+            "sentiment_label": latest.sentiment_label,
+            "sentiment_score": sum(score * count for score, count in scored) / weight if weight else None,
+            "topics": latest.topics,
+            "key_entities": latest.key_entities,
+            "market_impact": latest.market_impact,
+            "impact_score": latest.impact_score,
+            "news_summary": latest.news_summary,
+            "news_count": total,
+            "batches": len(rows),
+            "model": latest.model,
+            "analysis_date": latest.analysis_date,
+            "precomputed": True
+        }
+
+    def get_news_analysis(self, db: Session, symbol: str, days: int) -> Optional[Dict[str, Any]]:
+        """
+        读取覆盖最近几天内发布的新闻的预先计算分析，没有时返回None
+        按新闻的发布时间而不是分析时间筛选，补抓的旧新闻不会被当作近期新闻；
+        没有 latest_published_date 的旧记录退回按分析时间筛选
+        """
+        since = datetime.now() - timedelta(days=days)
+        rows = (
+            db.query(NewsAnalysis)
+            .filter(
+                NewsAnalysis.symbol == symbol,
+                or_(
+                    NewsAnalysis.latest_published_date >= since,
+                    and_(NewsAnalysis.latest_published_date.is_(None), NewsAnalysis.analysis_date >= since)
+                )
+            )
+            .order_by(func.coalesce(NewsAnalysis.latest_published_date, NewsAnalysis.analysis_date).desc())
+            .all()
+        )
+        return self._news_result(rows) if rows else None
+
+    @staticmethod
+    def _financial_result(row: FinancialAnalysis) -> Dict[str, Any]:
+        result = {field: getattr(row, field) for field in FINANCIAL_NUMBER_FIELDS}
+        result.update(
+            analysis=row.analysis_summary,
+            report_id=row.report_id,
+            report_type=row.report_type,
+            report_date=row.report_date,
+            risk_assessment=row.risk_assessment,
+            strength_factors=row.strength_factors,
+            weakness_factors=row.weakness_factors,
+            model=row.model,
+            analysis_date=row.analysis_date,
+            precomputed=True
+        )
+        return result
+
+    def get_financial_analyses(self, db: Session, report_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """按报表id读取预先计算的财务分析"""
+        if not report_ids:
+            return {}
+        rows = db.scalars(select(FinancialAnalysis).where(FinancialAnalysis.report_id.in_(report_ids)))
+        return {row.report_id: self._financial_result(row) for row in rows}
@@ -0,0 +1,214 @@
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
+import pandas as pd
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.models.crawler import get_price_model, panel_filters, price_filters
+from app.services.price_store import PRICE_COLUMNS, RECORD_FIELDS, get_price_store
+
+logger = logging.getLogger(__name__)
+
+
+class PriceRepository:
+    """
+    统一的K线加载入口
+    本地列式存储能覆盖查询范围时从存储读取；否则只查询需要的列（Core select，服务端游标分块读取），
+    直接转换为类型化的 NumPy 数组，不创建ORM对象
+    """
+
+    def __init__(self, db: Session, chunk_size: int = 10000):
+        self.db = db
+        self.chunk_size = chunk_size
+
+    def latest_date(self, symbol: str, interval: str = "1d") -> Optional[datetime]:
+        """股票最新一根K线的日期，没有数据时返回None"""
+        model = get_price_model(settings.price_storage)
+        return self.db.execute(
+            select(func.max(model.date)).where(*price_filters(model, symbol, interval=interval))
+        ).scalar()
+
+    def recent_dates(self, symbol: str, end: datetime, limit: int, interval: str = "1d") -> List[datetime]:
+        """不晚于 end 的最近 limit 根K线的日期，按时间倒序"""
+        model = get_price_model(settings.price_storage)
+        return list(self.db.scalars(
+            select(model.date)
+            .where(*price_filters(model, symbol, end=end, interval=interval))
+            .order_by(model.date.desc())
+            .limit(limit)
+        ))
+
+    def load_arrays(
+        self,
+        symbol: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        columns: Sequence[str] = PRICE_COLUMNS,
+        interval: str = "1d",
+        use_store: bool = True
+    ) -> Optional[Dict[str, np.ndarray]]:
+        """
+        加载一只股票的K线
+        :param symbol: 股票代码
+        :param start: 开始日期（包含）
+        :param end: 结束日期（包含）
+        :param columns: 需要的列（open/high/low/close/volume）
+        :param interval: K线周期
+        :param use_store: 是否优先读取本地列式存储，为False时总是查询数据库
+        :return: 按日期升序的 {"date": datetime64[us], 列名: 数组}，没有数据时返回None
+        """
+        store = get_price_store() if use_store else None
+        if store is not None:
+            bars = store.read(symbol, start, end, columns, interval, require_coverage=True)
+            if bars is not None:
+                return bars
+
+        model = get_price_model(settings.price_storage)
+        stmt = (
+            select(model.date, *[getattr(model, RECORD_FIELDS[column]) for column in columns])
+            .where(*price_filters(model, symbol, start, end, interval))
+            .order_by(model.date.asc())
+            .execution_options(stream_results=True, yield_per=self.chunk_size)
+        )
+
+        chunks: List[Dict[str, np.ndarray]] = []
+        for partition in self.db.execute(stmt).partitions():
+            values = list(zip(*partition))
+            chunk = {"date": np.array(values[0], dtype="datetime64[us]")}
+            for column, column_values in zip(columns, values[1:]):
+                if column == "volume":
+                    chunk[column] = np.array([value or 0 for value in column_values], dtype=np.int64)
+                else:
+                    chunk[column] = np.array(column_values, dtype=np.float64)
+            chunks.append(chunk)
+
+        if not chunks:
+            return None
+        if len(chunks) == 1:
+            return chunks[0]
+        return {key: np.concatenate([chunk[key] for chunk in chunks]) for key in chunks[0]}
+
+    def load_frame(
+        self,
+        symbol: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        columns: Sequence[str] = PRICE_COLUMNS,
+        interval: str = "1d",
+        date_index: bool = True
+    ) -> Optional[pd.DataFrame]:
+        """
+        加载一只股票的K线为DataFrame
+        :param date_index: 是否以日期为索引，否则日期作为 date 列
+        :return: DataFrame，没有数据时返回None
+        """
+        bars = self.load_arrays(symbol, start, end, columns, interval)
+        if bars is None:
+            return None
+        dates = bars.pop("date")
+        if date_index:
+            return pd.DataFrame(bars, index=pd.DatetimeIndex(dates, name="date"), copy=False)
+        return pd.DataFrame({"date": dates, **bars}, copy=False)
+
+    def load_panel(
+        self,
+        symbols: Optional[Sequence[str]] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        columns: Sequence[str] = ("high", "low", "close"),
+        interval: str = "1d"
+    ) -> Optional[Dict[str, np.ndarray]]:
+        """
+        一次加载多只股票的K线，对齐为 (股票 × 日期) 的二维数组
+        :param symbols: 股票代码列表，为空时加载全部股票
+        :return: {"symbols": 股票代码数组, "date": 日期数组, 列名: 二维float64数组（缺失为NaN）}，没有数据时返回None
+        """
+        store = get_price_store()
+        if store is not None:
+            universe = list(symbols) if symbols else store.symbols(interval)
+            per_symbol = {}
+            for symbol in universe:
+                bars = store.read(symbol, start, end, columns, interval, require_coverage=True)
+                if bars is not None:
+                    per_symbol[symbol] = bars
+            # 本地存储缺少部分股票或不能覆盖查询范围时（例如刚配置存储目录）回退到数据库
+            if per_symbol and len(per_symbol) == len(universe):
+                return self._align_panel(per_symbol, columns)
+
+        model = get_price_model(settings.price_storage)
+        stmt = (
+            select(model.symbol, model.date, *[getattr(model, RECORD_FIELDS[column]) for column in columns])
+            .where(*panel_filters(model, symbols, start, end, interval))
+            .execution_options(stream_results=True, yield_per=self.chunk_size)
+        )
+        parts: List[List[np.ndarray]] = [[] for _ in range(len(columns) + 2)]
+        for partition in self.db.execute(stmt).partitions():
+            values = list(zip(*partition))
+            parts[0].append(np.array(values[0], dtype=object))
+            parts[1].append(np.array(values[1], dtype="datetime64[us]"))
+            for index, column_values in enumerate(values[2:], start=2):
+                parts[index].append(np.array(column_values, dtype=np.float64))
+        if not parts[0]:
+            return None
+
+        symbol_values, date_values, *column_values = [np.concatenate(part) for part in parts]
+        symbol_axis, rows = np.unique(symbol_values, return_inverse=True)
+        date_axis, cols = np.unique(date_values, return_inverse=True)
+        panel = {"symbols": symbol_axis, "date": date_axis}
+        for column, values in zip(columns, column_values):
+            grid = np.full((len(symbol_axis), len(date_axis)), np.nan)
+            grid[rows, cols] = values
+            panel[column] = grid
+        return panel
+
+    @staticmethod
+    def _align_panel(per_symbol: Dict[str, Dict[str, np.ndarray]], columns: Sequence[str]) -> Dict[str, np.ndarray]:
+        """把按股票读取的数组对齐到所有股票日期的并集"""
+        symbol_axis = np.array(sorted(per_symbol), dtype=object)
+        date_axis = np.unique(np.concatenate([per_symbol[symbol]["date"] for symbol in symbol_axis]))
+        panel = {"symbols": symbol_axis, "date": date_axis}
+        for column in columns:
+            panel[column] = np.full((len(symbol_axis), len(date_axis)), np.nan)
+        for row, symbol in enumerate(symbol_axis):
+            bars = per_symbol[symbol]
+            cols = np.searchsorted(date_axis, bars["date"])
+            for column in columns:
+                panel[column][row, cols] = bars[column]
+        return panel
+
+    def sync_store(self, symbol: str, records: List[Dict[str, Any]], interval: str = "1d") -> None:
+        """
+        数据库提交后把新K线同步到本地列式存储（未启用时跳过）
+        存储中还没有该股票的完整历史时，从数据库加载全部K线重建文件
+        """
+        store = get_price_store()
+        if store is None:
+            return
+        store.write(
+            symbol, records, interval,
+            load_history=lambda: self.load_arrays(symbol, interval=interval, use_store=False)
+        )
+
+    def build_store(self, symbols: Optional[Sequence[str]] = None, interval: str = "1d") -> int:
+        """
+        从数据库重建本地列式存储中各股票的完整历史
+        :param symbols: 股票代码列表，为空时重建数据库中的全部股票
+        :return: 重建的股票数
+        """
+        store = get_price_store()
+        if store is None:
+            return 0
+        if not symbols:
+            model = get_price_model(settings.price_storage)
+            symbols = self.db.execute(
+                select(model.symbol).where(*panel_filters(model, interval=interval)).distinct()
+            ).scalars().all()
+        built = 0
+        for symbol in symbols:
+            bars = self.load_arrays(symbol, interval=interval, use_store=False)
+            if bars is not None:
+                store.rebuild(symbol, bars, interval)
+                built += 1
+        return built
\ No newline at end of file
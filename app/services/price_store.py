@@ -0,0 +1,241 @@
+import logging
+import os
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Any, Callable, List, Optional, Sequence
+import numpy as np
+import pandas as pd
+from app.core.config import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows 没有 fcntl，使用 msvcrt 加锁
+    fcntl = None
+    import msvcrt
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:  # pyarrow 为可选依赖，缺失时不启用本地列式存储
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+# 文件中的列（与分析使用的DataFrame列名一致）
+PRICE_COLUMNS = ["open", "high", "low", "close", "volume"]
+
+# 爬虫写入记录的字段到文件列的映射
+RECORD_FIELDS = {
+    "open": "open_price",
+    "high": "high_price",
+    "low": "low_price",
+    "close": "close_price",
+    "volume": "volume"
+}
+
+# 文件元数据：标记文件包含从数据库加载的完整历史，而不只是爬虫增量写入的K线
+_COMPLETE_KEY = b"complete"
+
+
+@contextmanager
+def _file_lock(path: Path):
+    """跨进程的排他文件锁，多个 Celery 进程可能同时更新同一只股票的文件"""
+    with open(path, "a+b") as handle:
+        if fcntl is not None:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+        else:
+            handle.seek(0)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+            else:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class ArrowPriceStore:
+    """
+    按股票保存K线的本地列式存储
+    每只股票每个周期一个未压缩的 Arrow IPC 文件（{root}/{interval}/{symbol}.arrow），
+    读取时使用内存映射，数值列零拷贝转换为 NumPy 数组。
+    （Parquet 需要解码，无法直接映射，所以这里使用 Arrow IPC 格式）
+    文件第一次写入时从数据库加载该股票的完整历史并打上完整标记，之后只合并新K线；
+    没有完整标记的文件只用于起始日期不早于文件第一根K线的查询
+    """
+
+    def __init__(self, root: str):
+        if pa is None:
+            raise RuntimeError("使用本地列式存储需要安装 pyarrow")
+        self.root = Path(root)
+        self.schema = pa.schema(
+            [("date", pa.timestamp("us"))]
+            + [(column, pa.int64() if column == "volume" else pa.float64()) for column in PRICE_COLUMNS]
+        )
+
+    def _path(self, symbol: str, interval: str) -> Path:
+        return self.root / interval / f"{symbol.upper()}.arrow"
+
+    def symbols(self, interval: str = "1d") -> List[str]:
+        """列出已存储的股票代码"""
+        directory = self.root / interval
+        if not directory.exists():
+            return []
+        return sorted(path.stem for path in directory.glob("*.arrow"))
+
+    @staticmethod
+    def _open(path: Path):
+        """内存映射打开文件，文件不存在时返回None"""
+        if not path.exists():
+            return None
+        # 数组引用映射的内存，映射会一直保持到数组被释放
+        return pa.ipc.open_file(pa.memory_map(str(path), "r")).read_all()
+
+    @staticmethod
+    def _is_complete(table) -> bool:
+        return bool(table.schema.metadata) and table.schema.metadata.get(_COMPLETE_KEY) == b"1"
+
+    def read(
+        self,
+        symbol: str,
+        start: Optional[Any] = None,
+        end: Optional[Any] = None,
+        columns: Optional[Sequence[str]] = None,
+        interval: str = "1d",
+        require_coverage: bool = False
+    ) -> Optional[Dict[str, np.ndarray]]:
+        """
+        读取一只股票的K线
+        :param symbol: 股票代码
+        :param start: 开始日期（包含）
+        :param end: 结束日期（包含）
+        :param columns: 需要的价格列，默认全部
+        :param interval: K线周期
+        :param require_coverage: 为True时，文件没有完整标记且不能覆盖 start 之后的全部K线时返回None（由调用方回退到数据库）
+        :return: 包含 date 和价格列的数组字典（只读视图），没有数据时返回None
+        """
+        table = self._open(self._path(symbol, interval))
+        if table is None or table.num_rows == 0:
+            return None
+
+        dates = self._to_numpy(table.column("date"))
+        if require_coverage and not self._is_complete(table):
+            if start is None or dates[0] > np.datetime64(pd.Timestamp(start), "us"):
+                return None
+        lo = 0 if start is None else int(np.searchsorted(dates, np.datetime64(pd.Timestamp(start), "us"), side="left"))
+        hi = len(dates) if end is None else int(np.searchsorted(dates, np.datetime64(pd.Timestamp(end), "us"), side="right"))
+        if lo >= hi:
+            return None
+
+        result = {"date": dates[lo:hi]}
+        for column in columns or PRICE_COLUMNS:
+            result[column] = self._to_numpy(table.column(column))[lo:hi]
+        return result
+
+    @staticmethod
+    def _to_numpy(column) -> np.ndarray:
+        """单个数据块且没有空值时零拷贝转换"""
+        if column.num_chunks == 1 and column.null_count == 0:
+            return column.chunk(0).to_numpy(zero_copy_only=True)
+        return column.to_numpy()
+
+    @staticmethod
+    def _records_to_arrays(records: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+        arrays = {"date": np.array([record["date"] for record in records], dtype="datetime64[us]")}
+        for column, field in RECORD_FIELDS.items():
+            arrays[column] = np.array(
+                [record[field] for record in records], dtype=np.int64 if column == "volume" else np.float64
+            )
+        return arrays
+
+    def _write_table(self, path: Path, parts: List[Dict[str, np.ndarray]], complete: bool) -> int:
+        """
+        合并多组K线（同一日期以后面的为准）并写入文件
+        每个写入方使用独立的临时文件再原子替换，正在映射旧文件的读取方不受影响
+        """
+        merged = {key: np.concatenate([part[key] for part in parts]) for key in ["date"] + PRICE_COLUMNS}
+        # 倒序后取每个日期第一次出现的位置，即保留最后写入的数据，结果按日期升序
+        _, first = np.unique(merged["date"][::-1], return_index=True)
+        order = len(merged["date"]) - 1 - first
+        schema = self.schema.with_metadata({_COMPLETE_KEY: b"1" if complete else b"0"})
+        table = pa.table({key: values[order] for key, values in merged.items()}, schema=schema)
+
+        fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f"{path.stem}.", suffix=".tmp")
+        os.close(fd)
+        try:
+            with pa.OSFile(tmp_name, "wb") as sink:
+                with pa.ipc.new_file(sink, schema) as writer:
+                    writer.write_table(table)
+            os.replace(tmp_name, path)
+        except BaseException:
+            os.unlink(tmp_name)
+            raise
+        return table.num_rows
+
+    def write(
+        self,
+        symbol: str,
+        records: List[Dict[str, Any]],
+        interval: str = "1d",
+        load_history: Optional[Callable[[], Optional[Dict[str, np.ndarray]]]] = None
+    ) -> int:
+        """
+        把新写入数据库的K线合并进文件，同一日期以新数据为准
+        读取、合并、替换在文件锁内完成，并发的写入方不会互相覆盖
+        :param symbol: 股票代码
+        :param records: 包含 date 和 open_price 等字段的记录
+        :param interval: K线周期
+        :param load_history: 从数据库加载该股票全部K线的函数（必须在数据库提交之后调用），
+                             文件还没有完整历史时用它的结果重建文件
+        :return: 文件中的K线总数
+        """
+        if not records:
+            return 0
+
+        path = self._path(symbol, interval)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with _file_lock(path.with_suffix(".lock")):
+            existing = self._open(path)
+            complete = existing is not None and self._is_complete(existing)
+            parts = []
+            if complete:
+                parts.append({key: self._to_numpy(existing.column(key)) for key in ["date"] + PRICE_COLUMNS})
+            elif load_history is not None:
+                history = load_history()
+                if history is not None:
+                    parts.append(history)
+                    complete = True
+            elif existing is not None and existing.num_rows:
+                parts.append({key: self._to_numpy(existing.column(key)) for key in ["date"] + PRICE_COLUMNS})
+            parts.append(self._records_to_arrays(records))
+            return self._write_table(path, parts, complete)
+
+    def rebuild(self, symbol: str, bars: Dict[str, np.ndarray], interval: str = "1d") -> int:
+        """
+        用从数据库加载的完整历史替换文件（初始化或修复本地存储时使用）
+        :param bars: PriceRepository.load_arrays 返回的全部列
+        """
+        path = self._path(symbol, interval)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with _file_lock(path.with_suffix(".lock")):
+            return self._write_table(path, [bars], complete=True)
+
+
+_price_store: Optional[ArrowPriceStore] = None
+
+
+def get_price_store() -> Optional[ArrowPriceStore]:
+    """获取本地列式存储，未配置 PRICE_STORE_DIR 或未安装 pyarrow 时返回None"""
+    global _price_store
+    if not settings.price_store_dir:
+        return None
+    if pa is None:
+        logger.warning("未安装pyarrow，本地列式存储未启用")
+        return None
+    if _price_store is None:
+        _price_store = ArrowPriceStore(settings.price_store_dir)
+    return _price_store
+
@@ -0,0 +1,134 @@
+import logging
+import math
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken 为可选依赖，缺失时按字符数估算token
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=8)
+def _encoding(model: str):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str, model: str) -> int:
+    """
+    本地计算文本的token数
+    未安装 tiktoken 时估算：非ASCII字符（中文等）按每字1个token，ASCII字符按每4个1个token
+    """
+    encoding = _encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    non_ascii = sum(1 for char in text if ord(char) > 127)
+    return non_ascii + math.ceil((len(text) - non_ascii) / 4)
+
+
+ELLIPSIS = "…"
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: str) -> str:
+    """把文本截断到不超过 max_tokens 个token（包括截断后附加的省略号）"""
+    if count_tokens(text, model) <= max_tokens:
+        return text
+    max_tokens = max(max_tokens - count_tokens(ELLIPSIS, model), 0)
+    encoding = _encoding(model)
+    if encoding is not None:
+        return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens]) + ELLIPSIS
+    # 没有分词器时按比例截断后逐步收缩
+    length = int(len(text) * max_tokens / count_tokens(text, model))
+    while length > 0 and count_tokens(text[:length], model) > max_tokens:
+        length = int(length * 0.9)
+    return text[:length] + ELLIPSIS
+
+
+class NewsPromptBuilder:
+    """
+    按token预算组织新闻提示词
+    新闻按 相关度 × 时间衰减 排序，单篇超长时截断，依次装入预算；
+    一个预算装不下时分成多组（用于 map-reduce），超出组数上限的低分新闻被丢弃
+    """
+
+    def __init__(
+        self,
+        model: str,
+        token_budget: int = 3000,
+        article_max_tokens: int = 400,
+        max_chunks: int = 6,
+        half_life_hours: float = 48.0
+    ):
+        """
+        :param model: 计算token使用的模型名
+        :param token_budget: 每次请求中新闻内容的token上限
+        :param article_max_tokens: 单篇新闻的token上限
+        :param max_chunks: 最多分成的组数（即 map 阶段的请求数上限）
+        :param half_life_hours: 时间衰减的半衰期（小时）
+        """
+        self.model = model
+        self.token_budget = token_budget
+        self.article_max_tokens = min(article_max_tokens, token_budget)
+        self.max_chunks = max_chunks
+        self.half_life_hours = half_life_hours
+
+    def score(self, news: Dict[str, Any], now: datetime) -> float:
+        """新闻的排序得分：相关度（默认1）乘以按发布时间的指数衰减"""
+        relevance = news.get("relevance")
+        relevance = 1.0 if relevance is None else relevance
+        published = news.get("published_date")
+        if not isinstance(published, datetime):
+            return relevance
+        age_hours = max((now - published).total_seconds() / 3600, 0.0)
+        return relevance * 0.5 ** (age_hours / self.half_life_hours)
+
+    @staticmethod
+    def format_article(news: Dict[str, Any]) -> str:
+        return (
+            f"标题：{news['title']}\n"
+            f"日期：{news['published_date']}\n"
+            f"来源：{news['source']}\n"
+            f"内容：{news['content']}\n"
+        )
+
+    def pack(self, news_list: List[Dict[str, Any]], now: Optional[datetime] = None) -> List[List[str]]:
+        """
+        把新闻装入一个或多个不超过预算的分组
+        :return: 分组列表，每组是格式化后的新闻文本，第一组包含得分最高的新闻
+        """
+        now = now or datetime.now()
+        ranked = sorted(news_list, key=lambda news: self.score(news, now), reverse=True)
+
+        chunks: List[List[str]] = []
+        current: List[str] = []
+        used = 0
+        dropped = 0
+        for news in ranked:
+            text = self.format_article(news)
+            if count_tokens(text, self.model) > self.article_max_tokens:
+                header = count_tokens(self.format_article({**news, "content": ""}), self.model)
+                content = truncate_to_tokens(news["content"] or "", max(self.article_max_tokens - header, 0), self.model)
+                text = self.format_article({**news, "content": content})
+            tokens = count_tokens(text, self.model)
+            if current and used + tokens > self.token_budget:
+                chunks.append(current)
+                current, used = [], 0
+            if len(chunks) >= self.max_chunks:
+                dropped += 1
+                continue
+            current.append(text)
+            used += tokens
+        if current and len(chunks) < self.max_chunks:
+            chunks.append(current)
+
+        if dropped:
+            logger.info(f"新闻超出token预算，丢弃得分最低的 {dropped} 条")
+        return chunks
\ No newline at end of file
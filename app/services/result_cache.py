@@ -0,0 +1,207 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+from app.core.config import settings
+
+try:
+    import redis
+except ImportError:  # redis 为可选依赖，缺失时只能使用进程内缓存
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+
+def _json_default(obj: Any) -> Any:
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if hasattr(obj, "item"):  # numpy 标量
+        return obj.item()
+    raise TypeError(f"无法序列化类型 {type(obj).__name__}")
+
+
+class MemoryBackend:
+    """进程内的共享层替代实现，用于测试或单进程部署"""
+
+    def __init__(self):
+        self._data: Dict[str, Tuple[Optional[float], str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at is not None and expires_at <= time.time():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key: str, value: str, ttl: Optional[int] = None) -> None:
+        with self._lock:
+            self._data[key] = (time.time() + ttl if ttl else None, value)
+
+
+class RedisBackend:
+    """基于Redis的共享层，API进程和Celery worker共用"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.client.get(key)
+        return value.decode("utf-8") if isinstance(value, bytes) else value
+
+    def set(self, key: str, value: str, ttl: Optional[int] = None) -> None:
+        self.client.set(key, value, ex=ttl)
+
+
+class ResultCache:
+    """
+    分析结果的两级缓存
+    - 第一级：进程内LRU（带TTL）
+    - 第二级：可替换的共享后端（Redis或内存）
+    缓存键包含股票最新K线的日期，爬虫写入新K线时更新该日期，旧结果自然失效
+    backend 为 None 时缓存被禁用：爬虫进程的失效无法通知到API进程，宁可不缓存也不返回过期结果
+    """
+
+    def __init__(self, backend, local_size: int = 1024, ttl: int = 24 * 3600, local_ttl: int = 60):
+        self.backend = backend
+        self.enabled = backend is not None
+        self.local_size = local_size
+        self.ttl = ttl
+        # 本地层同样缓存最新K线日期，其他进程的失效最多延迟 local_ttl 秒可见
+        self.local_ttl = local_ttl
+        self._local: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _latest_key(symbol: str) -> str:
+        return f"analysis:latest:{symbol}"
+
+    @staticmethod
+    def make_key(namespace: str, symbol: str, window: Any, latest: str) -> str:
+        return f"analysis:{namespace}:{symbol}:{window}:{latest}"
+
+    def _local_get(self, key: str) -> Any:
+        with self._lock:
+            item = self._local.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at <= time.time():
+                del self._local[key]
+                return None
+            self._local.move_to_end(key)
+            return value
+
+    def _local_set(self, key: str, value: Any, ttl: float) -> None:
+        with self._lock:
+            self._local[key] = (time.time() + ttl, value)
+            self._local.move_to_end(key)
+            while len(self._local) > self.local_size:
+                self._local.popitem(last=False)
+
+    def _backend_get(self, key: str) -> Optional[str]:
+        try:
+            return self.backend.get(key)
+        except Exception as e:
+            logger.warning(f"读取共享缓存失败: {str(e)}")
+            return None
+
+    def _backend_set(self, key: str, value: str, ttl: Optional[int]) -> None:
+        try:
+            self.backend.set(key, value, ttl)
+        except Exception as e:
+            logger.warning(f"写入共享缓存失败: {str(e)}")
+
+    def latest_version(self, symbol: str, loader: Callable[[], Any]) -> str:
+        """
+        获取股票最新K线日期（缓存版本号）
+        :param loader: 缓存中没有时从数据库读取最新日期的函数
+        """
+        if not self.enabled:
+            latest = loader()
+            return latest.isoformat() if latest is not None else "none"
+        key = self._latest_key(symbol)
+        version = self._local_get(key)
+        if version is None:
+            version = self._backend_get(key)
+            if version is None:
+                latest = loader()
+                version = latest.isoformat() if latest is not None else "none"
+                self._backend_set(key, version, self.ttl)
+            self._local_set(key, version, self.local_ttl)
+        return version
+
+    def get(self, key: str) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        value = self._local_get(key)
+        if value is not None:
+            return value
+        raw = self._backend_get(key)
+        if raw is None:
+            return None
+        value = json.loads(raw)
+        self._local_set(key, value, self.ttl)
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        if not self.enabled:
+            return
+        raw = json.dumps(value, default=_json_default, ensure_ascii=False)
+        # 本地层保存与共享层相同的JSON形式，命中哪一层返回的结果都一致
+        self._local_set(key, json.loads(raw), self.ttl)
+        self._backend_set(key, raw, self.ttl)
+
+    def invalidate(self, symbol: str, latest: Optional[datetime]) -> None:
+        """
+        爬虫写入K线后更新股票的版本号，使旧的缓存结果失效
+        版本号附带写入时间，当天K线被更新（最新日期不变）时同样失效
+        """
+        if not self.enabled:
+            return
+        key = self._latest_key(symbol)
+        version = f"{latest.isoformat() if latest is not None else 'none'}#{time.time_ns()}"
+        self._backend_set(key, version, self.ttl)
+        self._local_set(key, version, self.local_ttl)
+
+
+_result_cache: Optional[ResultCache] = None
+
+
+def get_result_cache() -> ResultCache:
+    """
+    根据配置创建分析结果缓存
+    RESULT_CACHE_BACKEND=memory 只适用于单进程部署；配置为redis但不可用时禁用缓存，
+    因为进程内后端收不到Celery worker的失效通知，会一直返回旧结果
+    """
+    global _result_cache
+    if _result_cache is not None:
+        return _result_cache
+
+    backend = None
+    if settings.result_cache_backend == "redis":
+        if redis is None:
+            logger.error("未安装redis，分析结果缓存已禁用")
+        else:
+            try:
+                client = redis.Redis(host=settings.redis_host, port=settings.redis_port, db=settings.redis_db)
+                client.ping()
+                backend = RedisBackend(client)
+            except Exception as e:
+                logger.error(f"连接Redis失败，分析结果缓存已禁用: {str(e)}")
+    else:
+        backend = MemoryBackend()
+
+    _result_cache = ResultCache(
+        backend,
+        local_size=settings.result_cache_local_size,
+        ttl=settings.result_cache_ttl
+    )
+    return _result_cache
@@ -0,0 +1,257 @@
+import ast
+import logging
+import operator
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
+from sqlalchemy.orm import Session
+from app.services import indicators
+from app.services.analysis_service import INDICATOR_FIELDS
+from app.services.price_repository import PriceRepository
+
+logger = logging.getLogger(__name__)
+
+# 筛选结果中的数值字段（都可以用于筛选和排序）
+SCREEN_FIELDS = ["close", "change_pct", "bars"] + INDICATOR_FIELDS + ["support", "resistance"]
+
+_COMPARE_OPS = {
+    ast.Lt: operator.lt, ast.LtE: operator.le,
+    ast.Gt: operator.gt, ast.GtE: operator.ge,
+    ast.Eq: operator.eq, ast.NotEq: operator.ne
+}
+_BINARY_OPS = {
+    ast.Add: operator.add, ast.Sub: operator.sub,
+    ast.Mult: operator.mul, ast.Div: operator.truediv
+}
+# 筛选表达式的长度和语法树节点数上限，过长的表达式会让解析和求值递归过深
+MAX_EXPRESSION_LENGTH = 500
+MAX_EXPRESSION_NODES = 200
+
+
+def _to_float(value: Any) -> Optional[float]:
+    value = float(value)
+    return value if np.isfinite(value) else None
+
+
+class ScreenExpressionError(ValueError):
+    """筛选或排序表达式不合法"""
+
+
+def _is_text(value: Any) -> bool:
+    """字符串常量或字符串数组（如 trend 字段）"""
+    return isinstance(value, str) or (isinstance(value, np.ndarray) and value.dtype.kind in "USO")
+
+
+def _is_bool(value: Any) -> bool:
+    return isinstance(value, (bool, np.bool_)) or (isinstance(value, np.ndarray) and value.dtype == bool)
+
+
+def _require_number(value: Any, op: ast.AST) -> Any:
+    if _is_text(value) or _is_bool(value):
+        raise ScreenExpressionError(f"运算 {type(op).__name__} 只能用于数值字段")
+    return value
+
+
+def _require_bool(value: Any, op: ast.AST) -> Any:
+    if not _is_bool(value):
+        raise ScreenExpressionError(f"运算 {type(op).__name__} 只能用于比较结果")
+    return value
+
+
+def _fill_gaps(values: np.ndarray) -> np.ndarray:
+    """
+    沿时间轴填充缺失值：停牌等中间缺口用前值填充，
+    上市较晚的股票开头的缺口用第一个有效值填充（常数前缀不改变均线和EMA）
+    """
+    valid = ~np.isnan(values)
+    index = np.where(valid, np.arange(values.shape[1]), 0)
+    np.maximum.accumulate(index, axis=1, out=index)
+    filled = np.take_along_axis(values, index, axis=1)
+    first = np.argmax(valid, axis=1)
+    leading = np.arange(values.shape[1]) < first[:, None]
+    return np.where(leading, values[np.arange(len(values)), first][:, None], filled)
+
+
+class StockScreener:
+    """
+    跨股票筛选
+    一次查询加载整个股票池的K线为 (股票 × 日期) 矩阵，沿股票轴向量化计算全部指标和趋势，
+    再用表达式（如 "rsi_14 < 30"、"close > ma_20 and trend == '上升'"）过滤和排序
+    """
+
+    def __init__(self, min_bars: int = indicators.MACD_SLOW + indicators.MACD_SIGNAL):
+        """
+        :param min_bars: 参与筛选的最少K线数，不足的股票指标不可靠，直接跳过
+        """
+        self.min_bars = min_bars
+
+    def compute(self, panel: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """
+        计算每只股票最新一根K线上的指标
+        :return: 字段名 -> 一维数组（按股票），另含 symbols 和 trend
+        """
+        valid = ~np.isnan(panel["close"])
+        bars = valid.sum(axis=1)
+        keep = bars >= self.min_bars
+        close = _fill_gaps(panel["close"][keep])
+        high = _fill_gaps(panel["high"][keep])
+        low = _fill_gaps(panel["low"][keep])
+
+        series = indicators.compute_indicators(high, low, close)
+        latest = {field: series[field][:, -1] for field in INDICATOR_FIELDS + ["support", "resistance"]}
+        latest["close"] = close[:, -1]
+        latest["bars"] = bars[keep].astype(np.float64)
+        first = close[np.arange(len(close)), np.argmax(valid[keep], axis=1)]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            latest["change_pct"] = (close[:, -1] / first - 1.0) * 100.0
+        latest["trend"] = indicators.classify_trend(latest["close"], latest["ma_5"], latest["ma_20"])
+        latest["symbols"] = panel["symbols"][keep]
+        return latest
+
+    @staticmethod
+    def _evaluate(node: ast.AST, columns: Dict[str, np.ndarray]) -> Any:
+        """在按股票排列的数组上求值表达式，只允许字段名、常量、算术、比较和逻辑运算"""
+        if isinstance(node, ast.Expression):
+            return StockScreener._evaluate(node.body, columns)
+        if isinstance(node, ast.Name):
+            if node.id not in columns:
+                raise ScreenExpressionError(f"未知字段: {node.id}")
+            return columns[node.id]
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float, str)):
+            return node.value
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+            return -_require_number(StockScreener._evaluate(node.operand, columns), node.op)
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            return np.logical_not(_require_bool(StockScreener._evaluate(node.operand, columns), node.op))
+        if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPS:
+            left = _require_number(StockScreener._evaluate(node.left, columns), node.op)
+            right = _require_number(StockScreener._evaluate(node.right, columns), node.op)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                return _BINARY_OPS[type(node.op)](left, right)
+        if isinstance(node, ast.BoolOp):
+            combine = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+            result = _require_bool(StockScreener._evaluate(node.values[0], columns), node.op)
+            for value in node.values[1:]:
+                result = combine(result, _require_bool(StockScreener._evaluate(value, columns), node.op))
+            return result
+        if isinstance(node, ast.Compare):
+            # 支持连续比较（如 30 < rsi_14 < 70），NaN 参与的比较结果为 False
+            left = StockScreener._evaluate(node.left, columns)
+            result = None
+            for op, comparator in zip(node.ops, node.comparators):
+                if type(op) not in _COMPARE_OPS:
+                    raise ScreenExpressionError(f"不支持的比较运算: {type(op).__name__}")
+                right = StockScreener._evaluate(comparator, columns)
+                # 字符串字段（trend）只能与字符串做相等比较
+                if _is_text(left) or _is_text(right):
+                    if not (_is_text(left) and _is_text(right)) or type(op) not in (ast.Eq, ast.NotEq):
+                        raise ScreenExpressionError("字符串字段只能用 == 或 != 与字符串比较")
+                elif _is_bool(left) or _is_bool(right):
+                    raise ScreenExpressionError("比较结果不能再参与比较")
+                with np.errstate(invalid="ignore"):
+                    current = _COMPARE_OPS[type(op)](left, right)
+                result = current if result is None else np.logical_and(result, current)
+                left = right
+            return result
+        raise ScreenExpressionError(f"不支持的表达式: {ast.dump(node)}")
+
+    def filter_mask(self, expression: str, columns: Dict[str, np.ndarray]) -> np.ndarray:
+        """计算筛选表达式，返回按股票的布尔数组"""
+        if len(expression) > MAX_EXPRESSION_LENGTH:
+            raise ScreenExpressionError(f"筛选表达式不能超过 {MAX_EXPRESSION_LENGTH} 个字符")
+        try:
+            tree = ast.parse(expression, mode="eval")
+        except (SyntaxError, RecursionError, MemoryError) as e:
+            raise ScreenExpressionError(f"筛选表达式语法错误: {expression}") from e
+        if sum(1 for _ in ast.walk(tree)) > MAX_EXPRESSION_NODES:
+            raise ScreenExpressionError(f"筛选表达式过于复杂（超过 {MAX_EXPRESSION_NODES} 个节点）")
+        try:
+            mask = np.asarray(self._evaluate(tree, columns))
+        except (TypeError, RecursionError) as e:
+            raise ScreenExpressionError(f"无法计算筛选表达式 {expression}: {str(e)}") from e
+        if mask.dtype != bool or mask.shape != columns["symbols"].shape:
+            raise ScreenExpressionError(f"筛选表达式必须是按股票的比较: {expression}")
+        return mask
+
+    @staticmethod
+    def sort_order(sort: Sequence[str], columns: Dict[str, np.ndarray]) -> np.ndarray:
+        """
+        计算排序顺序
+        :param sort: 字段名列表，前缀 "-" 表示降序，靠前的字段优先；缺失值排在最后
+        """
+        keys = []
+        for key in reversed(sort):
+            descending = key.startswith("-")
+            field = key.lstrip("-+")
+            if field not in SCREEN_FIELDS:
+                raise ScreenExpressionError(f"不能按字段 {field} 排序")
+            values = columns[field]
+            keys.append(-values if descending else values)
+            keys.append(np.isnan(values))
+        if not keys:
+            return np.arange(len(columns["symbols"]))
+        return np.lexsort(keys)
+
+    def screen(
+        self,
+        db: Session,
+        symbols: Optional[Sequence[str]] = None,
+        filters: Optional[Sequence[str]] = None,
+        sort: Optional[Sequence[str]] = None,
+        limit: Optional[int] = None,
+        days: int = 180
+    ) -> Dict[str, Any]:
+        """
+        筛选股票
+        :param symbols: 股票池，为空时使用全部股票
+        :param filters: 筛选表达式，多个表达式同时满足
+        :param sort: 排序字段
+        :param limit: 返回的最大数量
+        :param days: 加载的历史天数
+        :return: {"count", "total", "skipped", "results"}
+        """
+        panel = self.load_panel(db, symbols, days)
+        return self.screen_panel(panel, symbols, filters, sort, limit)
+
+    @staticmethod
+    def load_panel(db: Session, symbols: Optional[Sequence[str]] = None, days: int = 180) -> Optional[Dict[str, np.ndarray]]:
+        """加载筛选需要的 (股票 × 日期) K线矩阵"""
+        return PriceRepository(db).load_panel(symbols, datetime.now() - timedelta(days=days))
+
+    def screen_panel(
+        self,
+        panel: Optional[Dict[str, np.ndarray]],
+        symbols: Optional[Sequence[str]] = None,
+        filters: Optional[Sequence[str]] = None,
+        sort: Optional[Sequence[str]] = None,
+        limit: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """在已加载的K线矩阵上计算指标并筛选（纯计算，不访问数据库）"""
+        if panel is None:
+            return {"count": 0, "total": 0, "skipped": list(symbols or []), "results": []}
+
+        columns = self.compute(panel)
+        mask = np.ones(len(columns["symbols"]), dtype=bool)
+        for expression in filters or []:
+            mask &= self.filter_mask(expression, columns)
+
+        selected = {key: values[mask] for key, values in columns.items()}
+        order = self.sort_order(sort or [], selected)
+        if limit is not None:
+            order = order[:limit]
+
+        results: List[Dict[str, Any]] = []
+        for index in order:
+            row = {"symbol": selected["symbols"][index], "trend": str(selected["trend"][index])}
+            row.update({field: _to_float(selected[field][index]) for field in SCREEN_FIELDS})
+            row["bars"] = int(selected["bars"][index])
+            results.append(row)
+
+        loaded = set(panel["symbols"].tolist())
+        skipped = sorted(set(symbols or loaded) - set(columns["symbols"].tolist()))
+        return {
+            "count": len(results),
+            "total": int(mask.sum()),
+            "skipped": skipped,
+            "results": results
+        }
\ No newline at end of file
@@ -0,0 +1,97 @@
+import logging
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+from sqlalchemy import cast, func, or_, select
+from sqlalchemy.dialects.postgresql import REGCONFIG
+from sqlalchemy.orm import Session
+from app.models.crawler import News, FinancialReport, SEARCH_CONFIG
+
+logger = logging.getLogger(__name__)
+
+
+class SearchService:
+    """
+    新闻和财务报表的全文检索
+    - 正文和标题通过 tsvector 生成列 + GIN 索引匹配，按 ts_rank_cd 排序
+    - 标题额外通过 pg_trgm 三元组索引做单词相似度匹配（公司名、产品名的拼写差异）
+    先在索引上算出当前页的id和得分，再只为这一页生成摘要片段
+    """
+
+    # 每个目标表的 (模型, 日期列, 额外返回的列)
+    TARGETS = {
+        "news": (News, News.published_date, [News.source, News.url]),
+        "reports": (FinancialReport, FinancialReport.report_date, [
+            FinancialReport.company_symbol, FinancialReport.report_type, FinancialReport.url
+        ])
+    }
+
+    def __init__(self, similarity_weight: float = 0.5, headline_options: str = "MaxFragments=2, MaxWords=30, MinWords=10"):
+        self.similarity_weight = similarity_weight
+        self.headline_options = headline_options
+
+    def search(
+        self,
+        db: Session,
+        target: str,
+        q: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        page: int = 1,
+        page_size: int = 20
+    ) -> Dict[str, Any]:
+        """
+        检索一个目标表
+        :param target: news 或 reports
+        :param q: 检索词，支持网页搜索语法（"短语"、or、-排除）
+        :param start: 开始日期（包含）
+        :param end: 结束日期（包含）
+        :param page: 页码，从1开始
+        :param page_size: 每页条数
+        :return: {"items", "page", "page_size", "has_more"}
+        """
+        if target not in self.TARGETS:
+            raise ValueError(f"未知的检索目标: {target}")
+        model, date_column, extra_columns = self.TARGETS[target]
+
+        config = cast(SEARCH_CONFIG, REGCONFIG)
+        query = func.websearch_to_tsquery(config, q)
+        rank = (
+            func.ts_rank_cd(model.search_vector, query)
+            + self.similarity_weight * func.word_similarity(q, model.title)
+        ).label("rank")
+
+        # title %> q 即 word_similarity(q, title) 超过阈值，可以使用三元组索引
+        conditions = [or_(model.search_vector.op("@@")(query), model.title.op("%>")(q))]
+        if start is not None:
+            conditions.append(date_column >= start)
+        if end is not None:
+            conditions.append(date_column <= end)
+
+        # 多取一条判断是否还有下一页，避免在大表上 COUNT(*)
+        ranked = (
+            select(model.id, rank)
+            .where(*conditions)
+            .order_by(rank.desc(), date_column.desc())
+            .limit(page_size + 1)
+            .offset((page - 1) * page_size)
+            .subquery()
+        )
+        stmt = (
+            select(
+                model.id,
+                model.title,
+                date_column.label("date"),
+                *extra_columns,
+                func.ts_headline(config, model.content, query, self.headline_options).label("snippet"),
+                ranked.c.rank
+            )
+            .join(ranked, ranked.c.id == model.id)
+            .order_by(ranked.c.rank.desc(), date_column.desc())
+        )
+        rows: List[Dict[str, Any]] = [dict(row._mapping) for row in db.execute(stmt)]
+        return {
+            "items": rows[:page_size],
+            "page": page,
+            "page_size": page_size,
+            "has_more": len(rows) > page_size
+        }
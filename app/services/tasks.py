@@ -0,0 +1,73 @@
+import asyncio
+import logging
+from typing import List, Optional
+from celery import shared_task
+from app.core.database import SessionLocal
+from app.services.llm_service import LLMService, create_async_client, create_llm_semaphore
+from app.services.precomputed_analysis import PrecomputedAnalysisService
+from config.dev import settings
+
+logger = logging.getLogger(__name__)
+
+precomputed_analysis_service = PrecomputedAnalysisService()
+
+def _task_llm_service() -> LLMService:
+    """每次 asyncio.run 都是新的事件循环，需要在循环内创建客户端和信号量"""
+    return LLMService(client=create_async_client(), semaphore=create_llm_semaphore())
+
+@shared_task(
+    bind=True,
+    max_retries=3,
+    default_retry_delay=60,
+    retry_backoff=True,
+    retry_backoff_max=600,
+    retry_jitter=True
+)
+def analyze_pending_news(self, symbols: Optional[List[str]] = None):
+    """分析未分析新闻的Celery任务"""
+    db = SessionLocal()
+    try:
+        symbols = symbols or settings.STOCK_UNIVERSE
+        logger.info(f"开始分析新闻: {symbols}")
+
+        async def run():
+            llm_service = _task_llm_service()
+            try:
+                return await precomputed_analysis_service.analyze_pending_news(db, llm_service, symbols)
+            finally:
+                await llm_service.client.close()
+
+        return asyncio.run(run())
+    except Exception as e:
+        logger.error(f"分析新闻时发生错误: {str(e)}")
+        raise self.retry(exc=e)
+    finally:
+        db.close()
+
+@shared_task(
+    bind=True,
+    max_retries=3,
+    default_retry_delay=60,
+    retry_backoff=True,
+    retry_backoff_max=600,
+    retry_jitter=True
+)
+def analyze_pending_reports(self):
+    """分析新财务报表的Celery任务"""
+    db = SessionLocal()
+    try:
+        logger.info("开始分析财务报表")
+
+        async def run():
+            llm_service = _task_llm_service()
+            try:
+                return await precomputed_analysis_service.analyze_pending_reports(db, llm_service)
+            finally:
+                await llm_service.client.close()
+
+        return asyncio.run(run())
+    except Exception as e:
+        logger.error(f"分析财务报表时发生错误: {str(e)}")
+        raise self.retry(exc=e)
+    finally:
+        db.close()
@@ -1,13 +1,10 @@
-from sqlalchemy import create_engine, func
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import func
+from app.core.database import SessionLocal
 from app.models.crawler import StockData, FinancialReport, News
-from config.dev import settings
 import pandas as pd
 from datetime import datetime, timedelta
 
-# 创建数据库连接
-engine = create_engine(settings.DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# 使用与API、爬虫共用的数据库引擎
 db = SessionLocal()
 
 def check_stock_data():
@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import List, Optional
 
 class Settings(BaseSettings):
     # Database settings
@@ -9,6 +9,7 @@ class Settings(BaseSettings):
     DB_PORT: int
     DB_NAME: str
     
+    # 与 app.core.config.settings.database_url 相同；连接数据库统一使用 app.core.database 的引擎和 SessionLocal
     @property
     def DATABASE_URL(self) -> str:
         return f"postgresql://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
@@ -22,6 +23,9 @@ class Settings(BaseSettings):
     def REDIS_URL(self) -> str:
         return f"redis://{self.REDIS_HOST}:{self.REDIS_PORT}/{self.REDIS_DB}"
     
+    # Crawler settings
+    STOCK_UNIVERSE: List[str] = ["AAPL", "GOOGL", "MSFT", "AMZN", "META"]  # 每日行情任务抓取的股票池
+    
     # API settings
     API_V1_STR: str
     PROJECT_NAME: str
@@ -31,6 +35,22 @@ class Settings(BaseSettings):
     # OpenAI settings
     OPENAI_API_KEY: str
     
+    # Alpha Vantage settings
+    ALPHA_VANTAGE_API_KEY: str
+    ALPHA_VANTAGE_REQUESTS_PER_MINUTE: float = 5  # 免费档每分钟5次，按API Key共享
+    ALPHA_VANTAGE_BURST: Optional[int] = None  # 令牌桶容量，默认等于每分钟请求数
+    ALPHA_VANTAGE_REQUEUE_DELAY: int = 60  # 配额超限后重新排队的基础延迟（秒）
+    ALPHA_VANTAGE_MAX_REQUEUES: int = 5
+    RATE_LIMIT_BACKEND: str = "redis"  # redis（多进程共享）或 local（进程内）
+    
+    # HTTP cache settings
+    HTTP_CACHE_ENABLED: bool = True
+    HTTP_CACHE_PATH: str = ".cache/http_cache.sqlite3"
+    HTTP_CACHE_MAX_BYTES: int = 256 * 1024 * 1024  # 超过后按LRU淘汰
+    HTTP_CACHE_DEFAULT_TTL: int = 3600
+    HTTP_CACHE_MAX_TTL: int = 14 * 24 * 3600  # 内容不变时TTL翻倍的上限
+    HTTP_CACHE_MAX_TTL_FACTOR: int = 8  # 每个爬虫的TTL最多延长到其基础TTL的倍数（同时不超过 HTTP_CACHE_MAX_TTL）
+    
     # Logging settings
     LOG_LEVEL: str
     LOG_FILE: str
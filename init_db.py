@@ -1,18 +1,124 @@
-from sqlalchemy import create_engine
-from app.models.crawler import Base
+from datetime import datetime
+from sqlalchemy import text
+from app.models.crawler import Base, ensure_price_bar_partitions, NEWS_SEARCH_EXPRESSION, REPORT_SEARCH_EXPRESSION
+from app.models import analysis  # 注册分析结果表
 from app.core.config import settings
+from app.core.database import engine, SessionLocal
+from app.services.price_repository import PriceRepository
+from config.dev import settings as crawler_settings
+
+def migrate_stock_data(engine):
+    """为已有的 stock_data 表去重并补建 (symbol, date) 唯一索引"""
+    with engine.begin() as conn:
+        conn.execute(text("""
+            DELETE FROM stock_data a
+            USING stock_data b
+            WHERE a.symbol = b.symbol AND a.date = b.date AND a.id < b.id
+        """))
+        conn.execute(text(
+            "CREATE UNIQUE INDEX IF NOT EXISTS uq_stock_data_symbol_date ON stock_data (symbol, date)"
+        ))
+        # 成交量超过 INTEGER 上限的股票会溢出
+        conn.execute(text("ALTER TABLE stock_data ALTER COLUMN volume TYPE BIGINT"))
+
+def migrate_price_bars(engine):
+    """为 price_bars 创建从最早数据到明年的年度分区，并把 stock_data 中的日线复制过去"""
+    with engine.begin() as conn:
+        first_date = conn.execute(text("SELECT MIN(date) FROM stock_data")).scalar()
+        first_year = first_date.year if first_date else datetime.now().year
+        ensure_price_bar_partitions(conn, range(first_year, datetime.now().year + 2))
+        conn.execute(text("""
+            INSERT INTO price_bars (symbol, interval, date, open_price, high_price, low_price, close_price, volume)
+            SELECT symbol, '1d', date, open_price, high_price, low_price, close_price, volume
+            FROM stock_data
+            ON CONFLICT DO NOTHING
+        """))
+
+def migrate_analysis_tables(engine):
+    """为已有的分析结果表补充预计算分析需要的列"""
+    with engine.begin() as conn:
+        for statement in [
+            "ALTER TABLE financial_reports ADD COLUMN IF NOT EXISTS is_analyzed BOOLEAN DEFAULT FALSE",
+            "ALTER TABLE news_analysis ADD COLUMN IF NOT EXISTS news_ids JSON",
+            "ALTER TABLE news_analysis ADD COLUMN IF NOT EXISTS news_count INTEGER",
+            "ALTER TABLE news_analysis ADD COLUMN IF NOT EXISTS model VARCHAR",
+            "ALTER TABLE news_analysis ADD COLUMN IF NOT EXISTS latest_published_date TIMESTAMP",
+            "CREATE INDEX IF NOT EXISTS ix_news_analysis_latest_published_date ON news_analysis (latest_published_date)",
+            "ALTER TABLE financial_analysis ADD COLUMN IF NOT EXISTS report_id INTEGER REFERENCES financial_reports(id)",
+            "ALTER TABLE financial_analysis ADD COLUMN IF NOT EXISTS report_date TIMESTAMP",
+            "ALTER TABLE financial_analysis ADD COLUMN IF NOT EXISTS model VARCHAR",
+            "CREATE UNIQUE INDEX IF NOT EXISTS ix_financial_analysis_report_id ON financial_analysis (report_id)",
+        ]:
+            conn.execute(text(statement))
+
+def migrate_search_columns(engine):
+    """
+    为已有的 news / financial_reports 表补建全文检索生成列和索引
+    生成列会重写整张表，大表建议在低峰期执行
+    """
+    with engine.begin() as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        for table, expression in [("news", NEWS_SEARCH_EXPRESSION), ("financial_reports", REPORT_SEARCH_EXPRESSION)]:
+            conn.execute(text(
+                f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector "
+                f"GENERATED ALWAYS AS ({expression}) STORED"
+            ))
+            conn.execute(text(
+                f"CREATE INDEX IF NOT EXISTS ix_{table}_search_vector ON {table} USING gin (search_vector)"
+            ))
+            conn.execute(text(
+                f"CREATE INDEX IF NOT EXISTS ix_{table}_title_trgm ON {table} USING gin (title gin_trgm_ops)"
+            ))
+
+def migrate_news_clusters(engine):
+    """为已有的 news 表补充近似重复检测的列（旧新闻没有签名，各自成簇）"""
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE news ADD COLUMN IF NOT EXISTS minhash BYTEA"))
+        conn.execute(text("ALTER TABLE news ADD COLUMN IF NOT EXISTS cluster_id BIGINT"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_news_cluster_id ON news (cluster_id)"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_news_published_date ON news (published_date)"))
+
+def backfill_news_tickers(engine, symbols):
+    """
+    为已有新闻补建与股票的关联（旧数据没有保存 ticker_sentiment）
+    按单词边界匹配股票代码，避免 "META" 匹配到 "metadata"
+    """
+    with engine.begin() as conn:
+        for symbol in symbols:
+            conn.execute(text("""
+                INSERT INTO news_tickers (news_id, symbol, published_date)
+                SELECT id, :symbol, published_date
+                FROM news
+                WHERE content ~ ('\\m' || :symbol || '\\M') OR title ~ ('\\m' || :symbol || '\\M')
+                ON CONFLICT DO NOTHING
+            """), {"symbol": symbol})
+
+def build_price_store():
+    """从数据库填充本地 Arrow 列式K线存储（未配置 PRICE_STORE_DIR 时跳过）"""
+    if not settings.price_store_dir:
+        return
+    db = SessionLocal()
+    try:
+        built = PriceRepository(db).build_store()
+        print(f"本地列式存储已填充 {built} 只股票的K线")
+    finally:
+        db.close()
 
 def init_database():
     """初始化数据库"""
     print("开始初始化数据库...")
     
-    # 创建数据库引擎
-    SQLALCHEMY_DATABASE_URL = f"postgresql://{settings.db_user}:{settings.db_password}@{settings.db_host}:{settings.db_port}/{settings.db_name}"
-    engine = create_engine(SQLALCHEMY_DATABASE_URL)
-    
     try:
         # 创建所有表
         Base.metadata.create_all(engine)
+        migrate_stock_data(engine)
+        migrate_analysis_tables(engine)
+        migrate_search_columns(engine)
+        migrate_news_clusters(engine)
+        backfill_news_tickers(engine, crawler_settings.STOCK_UNIVERSE)
+        if settings.price_storage == "price_bars":
+            migrate_price_bars(engine)
+        build_price_store()
         print("数据库表创建成功！")
     except Exception as e:
         print(f"创建数据库表时出错: {str(e)}")
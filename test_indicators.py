@@ -0,0 +1,82 @@
+import math
+import numpy as np
+import pandas as pd
+from app.services import indicators
+from app.services.indicators import IncrementalIndicators, compute_indicators
+
+def _prices(n: int = 300, seed: int = 7):
+    """随机游走的K线（含一段价格不变的区间，覆盖 RSI 的 avg_loss == 0 分支）"""
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+    close[40:60] = close[40]
+    high = close * (1 + rng.uniform(0, 0.02, n))
+    low = close * (1 - rng.uniform(0, 0.02, n))
+    return high, low, close
+
+def _pandas_indicators(high, low, close) -> dict:
+    """用 pandas 的 rolling / ewm 实现的参考结果"""
+    high, low, close = pd.Series(high), pd.Series(low), pd.Series(close)
+    result = {f"ma_{window}": close.rolling(window).mean() for window in indicators.MA_WINDOWS}
+
+    delta = close.diff().iloc[1:]
+    avg_gain = delta.clip(lower=0).ewm(alpha=1 / indicators.RSI_PERIOD, adjust=False).mean()
+    avg_loss = (-delta).clip(lower=0).ewm(alpha=1 / indicators.RSI_PERIOD, adjust=False).mean()
+    rsi = (100 - 100 / (1 + avg_gain / avg_loss)).where(avg_loss != 0, 100.0).reindex(close.index)
+    rsi.iloc[:indicators.RSI_PERIOD] = np.nan
+    result["rsi_14"] = rsi
+
+    macd = (close.ewm(span=indicators.MACD_FAST, adjust=False).mean()
+            - close.ewm(span=indicators.MACD_SLOW, adjust=False).mean())
+    signal = macd.ewm(span=indicators.MACD_SIGNAL, adjust=False).mean()
+    result.update(macd=macd, macd_signal=signal, macd_hist=macd - signal)
+
+    middle = close.rolling(indicators.BOLLINGER_WINDOW).mean()
+    band = indicators.BOLLINGER_K * close.rolling(indicators.BOLLINGER_WINDOW).std(ddof=0)
+    result.update(bollinger_upper=middle + band, bollinger_middle=middle, bollinger_lower=middle - band)
+
+    prev_close = close.shift().fillna(close.iloc[0])
+    true_range = pd.concat([high - low, (high - prev_close).abs(), (low - prev_close).abs()], axis=1).max(axis=1)
+    atr = true_range.ewm(alpha=1 / indicators.ATR_PERIOD, adjust=False).mean()
+    atr.iloc[:indicators.ATR_PERIOD - 1] = np.nan
+    result["atr"] = atr
+
+    log_returns = np.log(close).diff()
+    result["volatility"] = log_returns.rolling(indicators.VOLATILITY_WINDOW).std() * np.sqrt(indicators.TRADING_DAYS)
+    result["trend_strength"] = (result["ma_5"] - result["ma_20"]).abs() / result["ma_20"]
+    result["support"] = low.rolling(indicators.BOLLINGER_WINDOW).min()
+    result["resistance"] = high.rolling(indicators.BOLLINGER_WINDOW).max()
+    return {name: series.to_numpy() for name, series in result.items()}
+
+def test_indicator_parity_with_pandas():
+    """测试向量化指标与 pandas 实现的结果一致（包括预热期的 NaN 位置）"""
+    high, low, close = _prices()
+    expected = _pandas_indicators(high, low, close)
+    actual = compute_indicators(high, low, close)
+    for name, values in expected.items():
+        np.testing.assert_allclose(actual[name], values, rtol=1e-9, atol=1e-9, equal_nan=True, err_msg=name)
+    print("✅ 指标与 pandas 结果一致")
+
+def test_indicator_matrix_matches_rows():
+    """测试 (股票 × 日期) 矩阵的计算结果与逐只股票计算一致"""
+    rows = [_prices(seed=seed) for seed in range(3)]
+    matrix = compute_indicators(*(np.vstack([row[i] for row in rows]) for i in range(3)))
+    for index, row in enumerate(rows):
+        single = compute_indicators(*row)
+        for name, values in single.items():
+            np.testing.assert_allclose(matrix[name][index], values, rtol=1e-12, equal_nan=True, err_msg=name)
+
+def test_incremental_matches_batch():
+    """测试增量推进的指标与对完整历史批量计算的最新值一致"""
+    high, low, close = _prices()
+    batch = compute_indicators(high, low, close)
+    for split in (1, 30, 120):
+        state = IncrementalIndicators.from_arrays(high[:split], low[:split], close[:split])
+        for h, l, c in zip(high[split:], low[split:], close[split:]):
+            latest = state.update(h, l, c)
+        # 经过JSON序列化和恢复后继续推进
+        state = IncrementalIndicators.from_dict(state.to_dict())
+        assert state.latest() == latest
+        for name, value in latest.items():
+            if name in batch:
+                assert math.isclose(value, batch[name][-1], rel_tol=1e-9, abs_tol=1e-9), name
+    print("✅ 增量指标与批量计算一致")
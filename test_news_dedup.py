@@ -0,0 +1,45 @@
+from app.crawlers.minhash import MinHashIndex, minhash, similarity
+from app.crawlers.news import NewsCrawler
+
+ORIGINAL = (
+    "Tesla cut prices of its Model 3 and Model Y vehicles in the United States for the second time this year, "
+    "as the electric carmaker tries to revive demand amid rising competition and high interest rates. "
+    "The reductions range from 2,000 to 5,000 dollars depending on trim, according to the company's website."
+)
+# 不同来源转载同一稿件时常见的改动
+SYNDICATED = [
+    ORIGINAL.rstrip(".") + " on Thursday.",
+    "NEW YORK (Reuters) - " + ORIGINAL,
+    ORIGINAL.replace("according to", "per").replace("the United States", "the U.S.").replace("company's", "firm's"),
+    ORIGINAL.rsplit(". ", 1)[0] + ".",
+    ORIGINAL + " Shares of the company have gained about 20 percent so far this year.",
+]
+# 同一公司、同一话题但不是同一稿件
+SAME_TOPIC = [
+    "Tesla delivered 435,059 vehicles in the third quarter, missing analyst expectations, as planned factory "
+    "shutdowns for upgrades weighed on production. The company said it still expects to deliver about 1.8 million "
+    "vehicles this year.",
+    "Tesla shares fell 5 percent after chief executive Elon Musk warned that high interest rates were hurting "
+    "demand for electric vehicles and said the company would be cautious about expanding its Mexico factory.",
+]
+
+def test_syndicated_variants_cluster():
+    """测试转载稿与原稿的相似度高于阈值，同一话题的不同报道低于阈值"""
+    threshold = NewsCrawler.near_duplicate_similarity
+    original = minhash(ORIGINAL)
+    for text in SYNDICATED:
+        assert similarity(original, minhash(text)) >= threshold, text
+    for text in SAME_TOPIC:
+        assert similarity(original, minhash(text)) < threshold, text
+    print("✅ 转载稿识别正常")
+
+def test_index_assigns_clusters():
+    """测试分段索引把转载稿归入原稿的簇，不同报道不被合并"""
+    index = MinHashIndex(NewsCrawler.near_duplicate_similarity)
+    index.add(minhash(ORIGINAL), 1)
+    for cluster_id, text in enumerate(SAME_TOPIC, start=2):
+        assert index.find(minhash(text)) is None
+        index.add(minhash(text), cluster_id)
+    assert [index.find(minhash(text)) for text in SYNDICATED] == [1] * len(SYNDICATED)
+    assert minhash("") is None
+    print("✅ 近似重复簇分配正常")
@@ -0,0 +1,42 @@
+from datetime import datetime, timedelta
+from app.services.prompt_builder import NewsPromptBuilder, count_tokens
+
+NOW = datetime(2024, 6, 1, 12, 0)
+
+def _news(title: str, hours_ago: float, relevance=None, words: int = 60) -> dict:
+    return {
+        "title": title,
+        "content": " ".join(f"{title.lower()}-word{i}" for i in range(words)),
+        "source": "Reuters",
+        "published_date": NOW - timedelta(hours=hours_ago),
+        "relevance": relevance
+    }
+
+def test_pack_ranks_by_relevance_and_recency():
+    """测试新闻按 相关度 × 时间衰减 排序，得分最高的新闻在第一组的最前面"""
+    builder = NewsPromptBuilder("gpt-4", token_budget=4000)
+    news = [_news("Old", 96, 1.0), _news("Fresh", 1, 0.5), _news("Relevant", 2, 0.9)]
+    chunks = builder.pack(news, now=NOW)
+    assert len(chunks) == 1
+    assert [text.split("\n")[0] for text in chunks[0]] == ["标题：Relevant", "标题：Fresh", "标题：Old"]
+
+def test_pack_respects_budgets():
+    """测试每组不超过token预算、单篇超长时截断、超出组数上限的低分新闻被丢弃"""
+    builder = NewsPromptBuilder("gpt-4", token_budget=600, article_max_tokens=200, max_chunks=3)
+    news = [_news(f"N{i}", hours_ago=i, relevance=0.8, words=40) for i in range(30)] + [_news("Long", 0, 1.0, words=2000)]
+    chunks = builder.pack(news, now=NOW)
+    assert 1 < len(chunks) <= 3
+    for chunk in chunks:
+        assert sum(count_tokens(text, "gpt-4") for text in chunk) <= 600
+        assert all(count_tokens(text, "gpt-4") <= 200 for text in chunk)
+    first = chunks[0][0]
+    assert first.startswith("标题：Long") and first.rstrip().endswith("…")
+    packed = sum(len(chunk) for chunk in chunks)
+    assert packed < len(news)
+    # 丢弃的是得分最低（最旧）的新闻
+    titles = {text.split("\n")[0] for chunk in chunks for text in chunk}
+    assert "标题：N0" in titles and "标题：N29" not in titles
+    print("✅ 新闻提示词按预算分组")
+
+def test_pack_empty():
+    assert NewsPromptBuilder("gpt-4").pack([], now=NOW) == []
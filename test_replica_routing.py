@@ -0,0 +1,86 @@
+import asyncio
+import os
+import tempfile
+from datetime import datetime
+from sqlalchemy import create_engine, select
+from sqlalchemy.ext.asyncio import create_async_engine
+from app.core.database import ReplicaRouter, RoutingSession
+from app.models.analysis import StockAnalysis
+
+def _sqlite_path(name: str) -> str:
+    path = os.path.join(tempfile.gettempdir(), f"quant_test_{name}.sqlite3")
+    if os.path.exists(path):
+        os.remove(path)
+    return path
+
+def test_routing_session():
+    """测试读写分离：读走副本，写入及写入之后的读取走主库"""
+    primary_path, replica_path = _sqlite_path("primary"), _sqlite_path("replica")
+    primary = create_engine(f"sqlite:///{primary_path}")
+    replica = create_engine(f"sqlite:///{replica_path}")
+    for engine in (primary, replica):
+        StockAnalysis.__table__.create(engine)
+    with replica.begin() as conn:
+        conn.execute(StockAnalysis.__table__.insert().values(symbol="AAPL", analysis_date=datetime.now(), trend="副本"))
+
+    db = RoutingSession(bind=primary, replica=replica)
+    try:
+        # 只读查询走副本
+        assert db.scalars(select(StockAnalysis.trend)).all() == ["副本"]
+        db.add(StockAnalysis(symbol="AAPL", analysis_date=datetime.now(), trend="主库"))
+        db.commit()
+        # 写入之后的读取改走主库，能读到自己的写入
+        assert db.scalars(select(StockAnalysis.trend)).all() == ["主库"]
+    finally:
+        db.close()
+    print("✅ 读写分离路由正常")
+
+def test_lag_from_status():
+    """测试根据复制状态计算延迟"""
+    assert ReplicaRouter.lag_from_status(False, None, None, None) == 0.0
+    # WAL接收中断时，即使回放位置与接收位置相同也不可用
+    assert ReplicaRouter.lag_from_status(True, None, True, 3600.0) is None
+    assert ReplicaRouter.lag_from_status(True, "waiting", True, 3600.0) is None
+    assert ReplicaRouter.lag_from_status(True, "streaming", True, 3600.0) == 0.0
+    assert ReplicaRouter.lag_from_status(True, "streaming", False, 12.5) == 12.5
+    assert ReplicaRouter.lag_from_status(True, "streaming", None, None) is None
+    print("✅ 复制延迟计算正常")
+
+def test_replica_fallback():
+    """测试副本延迟超限或检查失败时回退到主库"""
+    class StubRouter(ReplicaRouter):
+        lag = 0.0
+
+        async def replica_lag(self, replica, primary_lsn=None):
+            if isinstance(self.lag, Exception):
+                raise self.lag
+            return self.lag
+
+    async def run():
+        replica = create_async_engine(f"sqlite+aiosqlite:///{_sqlite_path('replica_async')}")
+        router = StubRouter([replica], max_lag=30.0)
+        assert router.choose() is None  # 尚未检查时使用主库
+
+        await router.refresh()
+        assert router.choose() is replica.sync_engine
+
+        router.lag = 120.0
+        await router.refresh()
+        assert router.choose() is None
+
+        router.lag = OSError("副本不可达")
+        await router.refresh()
+        assert router.choose() is None and router.status()[0]["available"] is False
+
+        router.lag = 1.0
+        await router.refresh()
+        assert router.choose() is replica.sync_engine
+        await replica.dispose()
+
+    asyncio.run(run())
+    print("✅ 副本回退正常")
+
+if __name__ == "__main__":
+    test_routing_session()
+    test_lag_from_status()
+    test_replica_fallback()
\ No newline at end of file
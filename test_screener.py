@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.services.screener import MAX_EXPRESSION_LENGTH, ScreenExpressionError, StockScreener
+
+def _panel(days: int = 80) -> dict:
+    """三只股票：持续上涨、持续下跌、K线不足"""
+    steps = np.arange(days, dtype=np.float64)
+    close = np.vstack([100 + steps, 200 - steps, np.full(days, np.nan)])
+    close[2, -10:] = 50.0
+    return {
+        "symbols": np.array(["UP", "DOWN", "NEW"]),
+        "close": close,
+        "high": close + 1,
+        "low": close - 1
+    }
+
+def test_screen_expressions():
+    """测试筛选表达式：数值比较、字符串相等比较、连续比较和排序"""
+    screener = StockScreener()
+    result = screener.screen_panel(_panel(), filters=["trend == '上升'"])
+    assert [row["symbol"] for row in result["results"]] == ["UP"]
+    assert result["skipped"] == ["NEW"]
+
+    result = screener.screen_panel(_panel(), filters=["close > ma_20 or rsi_14 < 30"], sort=["-close"])
+    assert [row["symbol"] for row in result["results"]] == ["UP", "DOWN"]
+
+    result = screener.screen_panel(_panel(), filters=["0 <= rsi_14 <= 100", "not (trend != '下降')"])
+    assert [row["symbol"] for row in result["results"]] == ["DOWN"]
+    print("✅ 筛选表达式计算正常")
+
+@pytest.mark.parametrize("expression", [
+    "-trend",
+    "trend < 3",
+    "trend + 1 > 0",
+    "close + trend",
+    "not close",
+    "close and rsi_14",
+    "(close > 1) > 0",
+    "__import__('os')",
+    "unknown_field > 1",
+    "close >",
+    " + ".join(["close"] * 5000) + " > 0",
+    "-" * 100000 + "1 > 0",
+])
+def test_invalid_expressions(expression):
+    """测试不合法的表达式都报告为 ScreenExpressionError，而不是其他异常"""
+    screener = StockScreener()
+    with pytest.raises(ScreenExpressionError):
+        screener.screen_panel(_panel(), filters=[expression])
+
+def test_screen_route_rejects_long_filters():
+    """测试筛选接口拒绝过长的表达式和过多的表达式"""
+    client = TestClient(app)
+    response = client.get("/api/analysis/screen", params={"filter": "close" + " + close" * MAX_EXPRESSION_LENGTH})
+    assert response.status_code == 400
+    response = client.get("/api/analysis/screen", params={"filter": ["close > 0"] * 100})
+    assert response.status_code == 422